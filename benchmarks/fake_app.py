@@ -0,0 +1,118 @@
+"""The server app wired to the in-process fakes, for benchmarks.
+
+Importing this module configures the environment, imports
+piper_tts_web.server and swaps its Firebase clients for fakes seeded
+from BENCH_* variables, so it also works as a gunicorn app
+(fake_app:app) where every worker builds an identical copy:
+
+    BENCH_MODEL             .onnx voice to serve (its .onnx.json next to it)
+    BENCH_CATALOG_VOICES    extra metadata-only voices listed by /voices
+    BENCH_RECORDINGS        recordings seeded for the dashboard
+    BENCH_STORAGE_LATENCY   seconds added to every Storage call
+    BENCH_FIRESTORE_LATENCY seconds added to every Firestore call
+    REVENUECAT_BASE_URL     URL of a RevenueCatStub
+"""
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("PIPER_MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "piper_tts_web_bench", "models"))
+os.environ.setdefault("PIPER_FRAGMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "piper_tts_web_bench", "fragments"))
+os.environ.setdefault("REVENUECAT_API_KEY", "benchmark")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import firebase_admin.auth  # noqa: E402
+
+from fakes import FakeBucket, FakeFirestore, fake_transactional  # noqa: E402
+from piper_tts_web import server  # noqa: E402
+from piper_tts_web.auth_cache import superuser_cache, token_cache  # noqa: E402
+from piper_tts_web.voice_catalog import VoiceCatalog  # noqa: E402
+
+SUPERUSER_UID = "bench-admin"
+WORDS = (
+    "the quick brown fox jumps over lazy dog voice model speech audio sentence river mountain "
+    "library window garden morning evening coffee market station letter number question answer"
+).split()
+
+
+def token_for(uid: str) -> str:
+    return f"bench-token-{uid}"
+
+
+def _verify_id_token(id_token, *args, **kwargs):
+    if not id_token.startswith("bench-token-"):
+        raise ValueError("Invalid benchmark token")
+    return {"uid": id_token[len("bench-token-"):], "exp": 2 ** 40}
+
+
+def install(storage_latency: float = 0.0, firestore_latency: float = 0.0):
+    """Point the server at fresh fakes; returns (bucket, db)."""
+    bucket = FakeBucket(latency=storage_latency)
+    db = FakeFirestore(latency=firestore_latency)
+    server.bucket = bucket
+    server.db = db
+    server.firestore.transactional = fake_transactional
+    server.voice_catalog = VoiceCatalog(server.FIREBASE_MODELS_PATH)
+    firebase_admin.auth.verify_id_token = _verify_id_token
+    token_cache.clear()
+    superuser_cache.invalidate()
+    db.put(f"users/{SUPERUSER_UID}", {"email": "admin@benchmark.invalid", "superuser": True})
+    return bucket, db
+
+
+def seed_model(bucket, model_path) -> str:
+    """Upload a voice model; returns the voice name."""
+    model_path = Path(model_path)
+    voice = model_path.name[:-len(".onnx")]
+    bucket.put(f"{server.FIREBASE_MODELS_PATH}{voice}.onnx", model_path.read_bytes())
+    bucket.put(f"{server.FIREBASE_MODELS_PATH}{voice}.onnx.json", Path(f"{model_path}.json").read_bytes())
+    return voice
+
+
+def seed_catalog_voices(bucket, count: int):
+    """Metadata-only voices, enough for /voices to list (they can't synthesize)."""
+    for i in range(count):
+        voice = f"xx_BENCH-voice{i:05d}-low"
+        bucket.put(f"{server.FIREBASE_MODELS_PATH}{voice}.onnx", b"\0")
+        bucket.put(
+            f"{server.FIREBASE_MODELS_PATH}{voice}.onnx.json",
+            b'{"description": "Benchmark voice", "audio": {"sample_rate": 22050}}',
+        )
+
+
+def seed_recordings(db, count: int, users: int = 50, voices: int = 20, seed: int = 0):
+    """Recordings spread over users and voices, as written by build_recording_doc."""
+    rng = random.Random(seed)
+    for u in range(users):
+        db.put(f"users/bench-user{u}", {"email": f"user{u}@benchmark.invalid"})
+    for i in range(count):
+        uid = f"bench-user{i % users}"
+        voice = f"xx_BENCH-voice{rng.randrange(voices):05d}-low"
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize() + "."
+        duration = round(rng.uniform(0.5, 400), 2)
+        recording_id = f"bench{i:07d}"
+        doc = server.build_recording_doc(
+            uid, voice, text, recording_id, f"https://storage.benchmark.invalid/audio/{recording_id}.wav",
+            f"audio/{recording_id}.wav", duration, 1,
+        )
+        doc["created"] = 1_700_000_000 + i
+        db.put(f"users/{uid}/recordings/{recording_id}", doc)
+
+
+def _from_env():
+    bucket, db = install(
+        float(os.environ.get("BENCH_STORAGE_LATENCY", "0")),
+        float(os.environ.get("BENCH_FIRESTORE_LATENCY", "0")),
+    )
+    if os.environ.get("BENCH_MODEL"):
+        seed_model(bucket, os.environ["BENCH_MODEL"])
+    seed_catalog_voices(bucket, int(os.environ.get("BENCH_CATALOG_VOICES", "0")))
+    seed_recordings(db, int(os.environ.get("BENCH_RECORDINGS", "0")))
+
+
+_from_env()
+app = server.app
@@ -0,0 +1,431 @@
+"""In-process stand-ins for Firebase Storage, Firestore and the RevenueCat API.
+
+They implement just the parts of the client libraries the server uses, keep
+everything in memory and can add a fixed delay to every remote call so
+benchmarks see realistic round trips without touching the network.
+"""
+import base64
+import copy
+import hashlib
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.cloud.firestore_v1 import transforms
+
+_generations = itertools.count(1_000_000)
+
+
+class _Remote:
+    """Base for fakes of remote services: one lock and an optional per-call delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.RLock()
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+# --- Storage ---
+
+class FakeBlob:
+    def __init__(self, bucket, name: str):
+        self.bucket = bucket
+        self.name = name
+        self.metadata = None
+        self._load(bucket._objects.get(name))
+
+    def _load(self, stored):
+        self.generation = stored["generation"] if stored else None
+        self.md5_hash = stored["md5"] if stored else None
+        self.size = len(stored["data"]) if stored else None
+        self.content_type = stored["content_type"] if stored else None
+        if stored:
+            self.metadata = copy.deepcopy(stored["metadata"])
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.benchmark.invalid/{self.bucket.name}/{self.name}"
+
+    def exists(self) -> bool:
+        self.bucket._call()
+        return self.name in self.bucket._objects
+
+    def reload(self):
+        self.bucket._call()
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            from google.api_core.exceptions import NotFound
+            raise NotFound(self.name)
+        self._load(stored)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        self.bucket._call()
+        return self.bucket._objects[self.name]["data"]
+
+    def download_to_filename(self, filename, **kwargs):
+        data = self.download_as_bytes()
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        self.bucket._call()
+        if isinstance(data, str):
+            data = data.encode()
+        self._load(self.bucket._store(self.name, bytes(data), content_type, self.metadata))
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_string(f.read(), content_type=content_type)
+
+    def make_public(self):
+        self.bucket._call()
+
+    def patch(self):
+        self.bucket._call()
+        self.bucket._objects[self.name]["metadata"] = copy.deepcopy(self.metadata)
+
+
+class FakeBucket(_Remote):
+    def __init__(self, name: str = "benchmark-bucket", latency: float = 0.0):
+        super().__init__(latency)
+        self.name = name
+        self._objects = {}
+
+    def _store(self, name: str, data: bytes, content_type=None, metadata=None) -> dict:
+        stored = {
+            "data": data,
+            "generation": next(_generations),
+            "md5": base64.b64encode(hashlib.md5(data).digest()).decode("ascii"),
+            "content_type": content_type,
+            "metadata": copy.deepcopy(metadata),
+        }
+        with self._lock:
+            self._objects[name] = stored
+        return stored
+
+    def put(self, name: str, data: bytes, content_type=None):
+        """Seed an object without counting it as a call."""
+        self._store(name, data, content_type)
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str):
+        self._call()
+        return FakeBlob(self, name) if name in self._objects else None
+
+    def list_blobs(self, prefix: str = ""):
+        self._call()
+        with self._lock:
+            names = sorted(name for name in self._objects if name.startswith(prefix))
+        return [FakeBlob(self, name) for name in names]
+
+
+# --- Firestore ---
+
+def _apply(target: dict, data: dict):
+    """Merge data into target the way Firestore does, including Increment and DELETE_FIELD."""
+    for key, value in data.items():
+        if "." in key:
+            head, rest = key.split(".", 1)
+            if not isinstance(target.get(head), dict):
+                target[head] = {}
+            _apply(target[head], {rest: value})
+        elif isinstance(value, transforms.Increment):
+            target[key] = (target.get(key) or 0) + value.value
+        elif value is transforms.DELETE_FIELD:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _apply(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocument:
+    def __init__(self, db, path: str):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeQuery(self.db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str):
+        return FakeQuery(self.db, f"{self.path}/{name}")
+
+    def get(self, transaction=None, **kwargs):
+        self.db._call()
+        return FakeSnapshot(self, copy.deepcopy(self.db._docs.get(self.path)))
+
+    def _write(self, data: dict, merge: bool = False):
+        with self.db._lock:
+            current = dict(self.db._docs.get(self.path) or {}) if merge else {}
+            _apply(current, data)
+            self.db._docs[self.path] = current
+
+    def set(self, data: dict, merge: bool = False):
+        self.db._call()
+        self._write(data, merge)
+
+    def update(self, data: dict):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self.db._call()
+        with self.db._lock:
+            self.db._docs.pop(self.path, None)
+
+
+_OPERATORS = {
+    "==": lambda field, value: field == value,
+    "<": lambda field, value: field is not None and field < value,
+    "<=": lambda field, value: field is not None and field <= value,
+    ">": lambda field, value: field is not None and field > value,
+    ">=": lambda field, value: field is not None and field >= value,
+    "in": lambda field, value: field in value,
+    "array_contains": lambda field, value: isinstance(field, list) and value in field,
+    "array_contains_any": lambda field, value: isinstance(field, list) and any(v in field for v in value),
+}
+
+
+class _Count:
+    def __init__(self, value):
+        self.value = value
+
+
+class _AggregationQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self, **kwargs):
+        return [[_Count(len(self._query._matches(apply_window=False)))]]
+
+
+class FakeQuery:
+    """A collection, collection group or query over either."""
+
+    def __init__(self, db, path: str, group: bool = False, filters=(), order=None, limit=None, offset=0, after=None):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+        self._group = group
+        self._filters = list(filters)
+        self._order = order
+        self._limit = limit
+        self._offset = offset
+        self._after = after
+
+    def _clone(self, **changes):
+        state = {
+            "filters": self._filters, "order": self._order, "limit": self._limit,
+            "offset": self._offset, "after": self._after,
+        }
+        state.update(changes)
+        return FakeQuery(self.db, self.path, self._group, **state)
+
+    @property
+    def parent(self):
+        return FakeDocument(self.db, self.path.rsplit("/", 1)[0]) if "/" in self.path else None
+
+    def document(self, document_id=None):
+        return FakeDocument(self.db, f"{self.path}/{document_id or uuid.uuid4().hex}")
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._clone(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._clone(order=(field_path, direction))
+
+    def limit(self, count):
+        return self._clone(limit=count)
+
+    def offset(self, count):
+        return self._clone(offset=count)
+
+    def start_after(self, snapshot):
+        return self._clone(after=snapshot)
+
+    def count(self, alias=None):
+        return _AggregationQuery(self)
+
+    def _in_scope(self, path: str) -> bool:
+        parts = path.split("/")
+        if self._group:
+            return len(parts) >= 2 and parts[-2] == self.path
+        return path.rsplit("/", 1)[0] == self.path
+
+    def _matches(self, apply_window: bool = True) -> list:
+        with self.db._lock:
+            docs = [(path, data) for path, data in self.db._docs.items() if self._in_scope(path)]
+        results = [
+            (path, data) for path, data in docs
+            if all(_OPERATORS[op](data.get(field), value) for field, op, value in self._filters)
+        ]
+        if self._order:
+            field, direction = self._order
+            descending = direction == "DESCENDING"
+            results.sort(key=lambda item: (item[1].get(field) is not None, item[1].get(field) or 0), reverse=descending)
+            if self._after is not None:
+                paths = [path for path, _ in results]
+                position = paths.index(self._after.reference.path) if self._after.reference.path in paths else -1
+                results = results[position + 1:]
+        if apply_window:
+            results = results[self._offset:]
+            if self._limit is not None:
+                results = results[:self._limit]
+        return results
+
+    def stream(self, transaction=None, **kwargs):
+        self.db._call()
+        return iter([FakeSnapshot(FakeDocument(self.db, path), copy.deepcopy(data)) for path, data in self._matches()])
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeBatch:
+    """Write batch and transaction: writes are applied together on commit."""
+
+    def __init__(self, db):
+        self.db = db
+        self._writes = []
+
+    def set(self, reference, data: dict, merge: bool = False):
+        self._writes.append(lambda: reference._write(data, merge))
+
+    def update(self, reference, data: dict):
+        self.set(reference, data, merge=True)
+
+    def delete(self, reference):
+        self._writes.append(lambda: self.db._docs.pop(reference.path, None))
+
+    def commit(self):
+        self.db._call()
+        with self.db._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
+
+
+class FakeFirestore(_Remote):
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self._docs = {}
+
+    def collection(self, name: str):
+        return FakeQuery(self, name)
+
+    def collection_group(self, name: str):
+        return FakeQuery(self, name, group=True)
+
+    def document(self, path: str):
+        return FakeDocument(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeBatch(self)
+
+    def get_all(self, references, **kwargs):
+        self._call()
+        return [FakeSnapshot(ref, copy.deepcopy(self._docs.get(ref.path))) for ref in references]
+
+    def put(self, path: str, data: dict):
+        """Seed a document without counting it as a call."""
+        with self._lock:
+            self._docs[path] = copy.deepcopy(data)
+
+
+def fake_transactional(func):
+    """Stand-in for firestore.transactional: run once and commit (no contention to retry)."""
+    def run(transaction, *args, **kwargs):
+        result = func(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+    return run
+
+
+# --- RevenueCat ---
+
+class RevenueCatStub:
+    """Local HTTP server answering GET /subscribers/{uid}.
+
+    uids in `active` have a lifetime entitlement, `expires` maps uids to the
+    expires_date of their entitlement (ISO string or epoch milliseconds) and
+    uids in `failing` get a 500.
+    """
+
+    def __init__(self, active=(), latency: float = 0.0):
+        self.active = set(active)
+        self.expires = {}
+        self.failing = set()
+        self.latency = latency
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                uid = self.path.rstrip("/").rsplit("/", 1)[-1]
+                if uid in stub.failing:
+                    self.send_response(500)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                entitlements = {}
+                if uid in stub.active:
+                    entitlements["pro"] = {"expires_date": None}
+                elif uid in stub.expires:
+                    entitlements["pro"] = {"expires_date": stub.expires[uid]}
+                body = json.dumps({"subscriber": {"entitlements": entitlements}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, name="revenuecat-stub", daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
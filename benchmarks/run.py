@@ -0,0 +1,387 @@
+"""Benchmark the synthesis service against in-process fakes and write the results as JSON.
+
+    python benchmarks/run.py --model voices/en_US-amy-low.onnx --out results.json
+    python benchmarks/run.py --model ... --workers 4 --baseline previous.json
+
+Measures, against fake Storage/Firestore and a local RevenueCat stub:
+  synthesis   cold (download + load) and warm latency, result-cache hits
+  throughput  requests/s and latency at each --clients concurrency
+  voices      /voices latency for each --sizes catalog size
+  dashboard   /dashboard-recordings and /dashboard-voices latency per --sizes recording count
+  memory      RSS/PSS of this process, and of every gunicorn worker with --workers
+Synthesis sections need a real Piper voice (--model); the rest run without one.
+Latency is in seconds. Fake latencies (--storage-latency/--firestore-latency)
+stand in for network round trips; the fakes themselves scan in Python, so
+dashboard numbers compare runs of this suite, not production Firestore.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+
+
+def summarize(samples) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+
+    def percentile(p):
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+    return {
+        "count": len(samples),
+        "mean": statistics.fmean(samples),
+        "min": samples[0],
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": samples[-1],
+    }
+
+
+async def timed(client, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    return time.perf_counter() - started, response
+
+
+def sentence(i: int) -> str:
+    # Distinct texts, so requests aren't answered from the result cache
+    return f"Benchmark sentence number {i}, spoken to measure synthesis."
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self._texts = 0
+
+    def next_text(self) -> str:
+        self._texts += 1
+        return sentence(self._texts)
+
+    async def synthesize(self, client, voice: str, text: str, uid: str = "bench-user0"):
+        return await timed(
+            client, "POST", "/synthesize",
+            json={"text": text, "voice": voice, "format": self.args.format},
+            headers={"Authorization": f"Bearer {self.fake_app.token_for(uid)}"},
+        )
+
+    async def bench_synthesis(self, client, voice: str) -> dict:
+        fake_app = self.fake_app
+        fake_app.server.voice_pool.clear()
+        shutil.rmtree(fake_app.server.model_cache.cache_dir, ignore_errors=True)
+        # Sentences repeat across runs; fragment hits would hide synthesis time
+        shutil.rmtree(fake_app.server.fragment_cache.cache_dir, ignore_errors=True)
+
+        cold, response = await self.synthesize(client, voice, self.next_text())
+        response.raise_for_status()
+        warm = []
+        for _ in range(self.args.requests):
+            seconds, response = await self.synthesize(client, voice, self.next_text())
+            response.raise_for_status()
+            warm.append(seconds)
+        cached_text = self.next_text()
+        await self.synthesize(client, voice, cached_text)
+        cached = []
+        for _ in range(self.args.requests):
+            seconds, response = await self.synthesize(client, voice, cached_text)
+            response.raise_for_status()
+            cached.append(seconds)
+        return {"cold": cold, "warm": summarize(warm), "result_cache_hit": summarize(cached)}
+
+    async def run_clients(self, client, voice: str, clients: int, total: int) -> dict:
+        latencies = []
+        statuses = {}
+
+        async def worker(worker_id: int, count: int):
+            for _ in range(count):
+                seconds, response = await self.synthesize(client, voice, self.next_text(), f"bench-user{worker_id}")
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    latencies.append(seconds)
+
+        per_client = max(1, total // clients)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, per_client) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+        return {
+            "clients": clients,
+            "requests": per_client * clients,
+            "seconds": elapsed,
+            "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "latency": summarize(latencies),
+        }
+
+    async def bench_throughput(self, client, voice: str) -> list:
+        return [await self.run_clients(client, voice, n, self.args.requests * n) for n in self.args.clients]
+
+    async def bench_voices(self, make_client) -> list:
+        results = []
+        for size in self.args.sizes:
+            bucket, _ = self.fake_app.install(self.args.storage_latency, self.args.firestore_latency)
+            self.fake_app.seed_catalog_voices(bucket, size)
+            async with make_client() as client:
+                cold, response = await timed(client, "GET", "/voices")
+                response.raise_for_status()
+                etag = response.headers.get("etag")
+                warm = [(await timed(client, "GET", "/voices"))[0] for _ in range(self.args.requests)]
+                not_modified = [
+                    (await timed(client, "GET", "/voices", headers={"If-None-Match": etag}))[0]
+                    for _ in range(self.args.requests)
+                ]
+            results.append({
+                "voices": size,
+                "cold": cold,
+                "warm": summarize(warm),
+                "not_modified": summarize(not_modified),
+                "storage_calls": bucket.calls,
+            })
+        return results
+
+    async def bench_dashboard(self, make_client) -> list:
+        fake_app = self.fake_app
+        headers = {"Authorization": f"Bearer {fake_app.token_for(fake_app.SUPERUSER_UID)}"}
+        queries = {
+            "first_page": {},
+            "search": {"search": "quick fox"},
+            "voice": {"voice": "xx_BENCH-voice00003-low"},
+            "duration": {"duration": "10-30"},
+            "user": {"user_email": "user7@benchmark.invalid"},
+        }
+        results = []
+        for size in self.args.sizes:
+            _, db = fake_app.install(self.args.storage_latency, self.args.firestore_latency)
+            fake_app.seed_recordings(db, size)
+            entry = {"recordings": size}
+            async with make_client() as client:
+                cold, response = await timed(client, "GET", "/dashboard-voices", headers=headers)
+                response.raise_for_status()
+                facets = [
+                    (await timed(client, "GET", "/dashboard-voices", headers=headers))[0]
+                    for _ in range(self.args.requests)
+                ]
+                entry["dashboard_voices"] = {"cold": cold, "warm": summarize(facets)}
+                for name, params in queries.items():
+                    samples = []
+                    for _ in range(self.args.requests):
+                        seconds, response = await timed(
+                            client, "GET", "/dashboard-recordings", params=params, headers=headers
+                        )
+                        response.raise_for_status()
+                        samples.append(seconds)
+                    entry[name] = summarize(samples)
+            results.append(entry)
+        return results
+
+    async def run_in_process(self) -> dict:
+        import httpx
+
+        # The fakes and the server are imported here, after the environment is set up
+        import fake_app
+        from piper_tts_web.shared_weights import memory_report
+
+        self.fake_app = fake_app
+
+        def make_client():
+            return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app.app), base_url="http://bench", timeout=600)
+
+        results = {"memory_before": memory_report()}
+        if self.args.model:
+            bucket, _ = fake_app.install(self.args.storage_latency, self.args.firestore_latency)
+            voice = fake_app.seed_model(bucket, self.args.model)
+            async with make_client() as client:
+                results["synthesis"] = await self.bench_synthesis(client, voice)
+                results["throughput"] = await self.bench_throughput(client, voice)
+        if self.args.sizes:
+            results["voices"] = await self.bench_voices(make_client)
+            results["dashboard"] = await self.bench_dashboard(make_client)
+        results["memory_after"] = memory_report()
+        return results
+
+    async def run_workers(self, env: dict) -> dict:
+        """Throughput and per-worker memory of a real gunicorn with --workers workers."""
+        import httpx
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        process = subprocess.Popen(
+            [
+                sys.executable, "-m", "gunicorn", "fake_app:app",
+                "--chdir", str(BENCH_DIR),
+                "--workers", str(self.args.workers),
+                "--worker-class", "uvicorn.workers.UvicornWorker",
+                "--bind", f"127.0.0.1:{port}",
+                "--timeout", "600",
+            ],
+            env={**os.environ, **env, "BENCH_MODEL": str(Path(self.args.model).resolve())},
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+                for _ in range(600):
+                    try:
+                        if (await client.get("/readyz")).status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    await asyncio.sleep(0.1)
+                else:
+                    raise RuntimeError("gunicorn did not become ready")
+
+                import fake_app
+                self.fake_app = fake_app
+                voice = Path(self.args.model).name[:-len(".onnx")]
+                # Enough concurrent requests that every worker loads the voice
+                await self.run_clients(client, voice, self.args.workers * 2, self.args.workers * 8)
+                throughput = [
+                    await self.run_clients(client, voice, n, self.args.requests * n) for n in self.args.clients
+                ]
+            return {
+                "workers": self.args.workers,
+                "throughput": throughput,
+                "worker_memory": [worker_memory(pid) for pid in child_pids(process.pid)],
+            }
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def worker_memory(pid: int) -> dict:
+    """RSS/PSS of another process from /proc (Linux)."""
+    report = {"pid": pid}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            for line in rollup:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB" and parts[0] in ("Rss:", "Pss:", "Shared_Clean:", "Private_Dirty:"):
+                    report[parts[0].rstrip(":").lower()] = int(parts[1]) * 1024
+    except OSError:
+        pass
+    return report
+
+
+def flatten_p50(results, prefix="") -> dict:
+    """{path: p50} for every latency summary in a results document."""
+    values = {}
+    if isinstance(results, dict):
+        if "p50" in results:
+            values[prefix] = results["p50"]
+        for key, value in results.items():
+            values.update(flatten_p50(value, f"{prefix}/{key}"))
+    elif isinstance(results, list):
+        for item in results:
+            label = next((f"{k}={item[k]}" for k in ("clients", "voices", "recordings") if isinstance(item, dict) and k in item), "")
+            values.update(flatten_p50(item, f"{prefix}[{label}]"))
+    return values
+
+
+def compare(baseline: dict, results: dict):
+    before = flatten_p50(baseline)
+    after = flatten_p50(results)
+    print(f"{'p50 latency':60} {'baseline':>10} {'current':>10} {'change':>8}")
+    for path in sorted(set(before) & set(after)):
+        change = (after[path] - before[path]) / before[path] * 100 if before[path] else 0.0
+        print(f"{path:60} {before[path]:10.4f} {after[path]:10.4f} {change:+7.1f}%")
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", help="Piper .onnx voice (with .onnx.json) for the synthesis benchmarks")
+    parser.add_argument("--out", default="benchmark-results.json", help="JSON file to write")
+    parser.add_argument("--baseline", help="earlier results JSON to compare p50 latencies with")
+    parser.add_argument("--requests", type=int, default=20, help="samples per measurement (per client for throughput)")
+    parser.add_argument("--clients", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated catalog / dataset sizes ('' to skip)")
+    parser.add_argument("--format", default="wav", help="output format requested from /synthesize")
+    parser.add_argument("--workers", type=int, default=0, help="also run a gunicorn with this many workers")
+    parser.add_argument("--storage-latency", type=float, default=0.0, help="seconds added to each fake Storage call")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="seconds added to each fake Firestore call")
+    args = parser.parse_args(argv)
+    args.clients = [int(n) for n in args.clients.split(",") if n]
+    args.sizes = [int(n) for n in args.sizes.split(",") if n]
+    if args.workers and not args.model:
+        parser.error("--workers needs --model")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from fakes import RevenueCatStub
+
+    work_dir = tempfile.mkdtemp(prefix="piper_tts_web_bench_")
+    revenuecat = RevenueCatStub(active={"bench-user1"})
+    env = {
+        "PIPER_MODEL_CACHE_DIR": os.path.join(work_dir, "models"),
+        "PIPER_JOB_DB_PATH": os.path.join(work_dir, "jobs.sqlite3"),
+        "PIPER_FRAGMENT_CACHE_DIR": os.path.join(work_dir, "fragments"),
+        "REVENUECAT_BASE_URL": revenuecat.url,
+        "BENCH_STORAGE_LATENCY": str(args.storage_latency),
+        "BENCH_FIRESTORE_LATENCY": str(args.firestore_latency),
+    }
+    os.environ.update(env)
+    sys.path.insert(0, str(BENCH_DIR))
+
+    bench = Bench(args)
+    started = time.time()
+    try:
+        results = {
+            "started": started,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {
+                key: value for key, value in vars(args).items() if key not in ("out", "baseline")
+            },
+        }
+        results.update(asyncio.run(bench.run_in_process()))
+        if args.workers:
+            results["gunicorn"] = asyncio.run(bench.run_workers(env))
+        results["revenuecat_requests"] = revenuecat.requests
+        results["seconds"] = time.time() - started
+    finally:
+        revenuecat.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    Path(args.out).write_text(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Wrote {args.out}")
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text()), results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
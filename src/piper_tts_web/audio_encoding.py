@@ -0,0 +1,154 @@
+"""Output audio formats: WAV, or Opus (in Ogg) and MP3 encoded with ffmpeg.
+
+Piper produces 16-bit mono PCM. For compressed formats the PCM is piped into
+an ffmpeg process as it is produced and the encoded stream is read back at
+the same time, so encoding overlaps synthesis and never touches the disk.
+"""
+import asyncio
+import logging
+import os
+import shutil
+
+from .engine import pcm_to_wav_bytes
+
+logger = logging.getLogger("piper_tts_web")
+
+FFMPEG_PATH = os.environ.get("PIPER_FFMPEG_PATH", "ffmpeg")
+DEFAULT_AUDIO_FORMAT = os.environ.get("PIPER_AUDIO_FORMAT", "wav").lower()
+OPUS_BITRATE = os.environ.get("PIPER_OPUS_BITRATE", "32k")
+MP3_BITRATE = os.environ.get("PIPER_MP3_BITRATE", "64k")
+
+AUDIO_FORMATS = {
+    "wav": {"extension": "wav", "media_type": "audio/wav"},
+    "opus": {
+        "extension": "ogg",
+        "media_type": "audio/ogg",
+        # libopus only takes 8/12/16/24/48 kHz input
+        "ffmpeg_args": ["-c:a", "libopus", "-b:a", OPUS_BITRATE, "-ar", "48000", "-f", "ogg"],
+    },
+    "mp3": {
+        "extension": "mp3",
+        "media_type": "audio/mpeg",
+        "ffmpeg_args": ["-c:a", "libmp3lame", "-b:a", MP3_BITRATE, "-f", "mp3"],
+    },
+}
+FORMAT_ALIASES = {"ogg": "opus", "mpeg": "mp3"}
+
+_encoder_available = None
+
+
+def resolve_format(requested=None) -> str:
+    """Canonical format name for a request (None means the server default)."""
+    name = (requested or DEFAULT_AUDIO_FORMAT).lower()
+    name = FORMAT_ALIASES.get(name, name)
+    if name not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {requested} (use one of {', '.join(AUDIO_FORMATS)})")
+    return name
+
+
+def encoder_available() -> bool:
+    """Whether ffmpeg is installed, for the compressed formats."""
+    global _encoder_available
+    if _encoder_available is None:
+        _encoder_available = shutil.which(FFMPEG_PATH) is not None
+        if not _encoder_available:
+            logger.warning(f"ffmpeg not found at '{FFMPEG_PATH}', only WAV output is available")
+    return _encoder_available
+
+
+def media_type(audio_format: str) -> str:
+    return AUDIO_FORMATS[audio_format]["media_type"]
+
+
+def file_extension(audio_format: str) -> str:
+    return AUDIO_FORMATS[audio_format]["extension"]
+
+
+class PcmEncoder:
+    """Encode 16-bit mono PCM fed in chunks: start(), feed() per chunk, then finish() for the file."""
+
+    def __init__(self, audio_format: str, sample_rate: int):
+        self.audio_format = audio_format
+        self.sample_rate = sample_rate
+        self.pcm_bytes = 0
+        self._pcm_parts = []
+        self._process = None
+        self._output = []
+        self._stderr = b""
+        self._readers = []
+
+    @property
+    def duration(self) -> float:
+        """Duration of the audio fed so far, from the sample count."""
+        return self.pcm_bytes / (2 * self.sample_rate)
+
+    async def start(self):
+        if self.audio_format == "wav":
+            return
+        self._process = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH, "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(self.sample_rate), "-ac", "1", "-i", "pipe:0",
+            *AUDIO_FORMATS[self.audio_format]["ffmpeg_args"], "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        # Drain both pipes while feeding so ffmpeg never blocks on a full pipe
+        self._readers = [
+            asyncio.ensure_future(self._read_stdout()),
+            asyncio.ensure_future(self._read_stderr()),
+        ]
+
+    async def _read_stdout(self):
+        while True:
+            data = await self._process.stdout.read(65536)
+            if not data:
+                return
+            self._output.append(data)
+
+    async def _read_stderr(self):
+        self._stderr = await self._process.stderr.read()
+
+    async def feed(self, pcm: bytes):
+        self.pcm_bytes += len(pcm)
+        if self._process is None:
+            self._pcm_parts.append(pcm)
+            return
+        self._process.stdin.write(pcm)
+        await self._process.stdin.drain()
+
+    async def finish(self) -> bytes:
+        """Close the input and return the complete encoded file."""
+        if self._process is None:
+            return pcm_to_wav_bytes(b"".join(self._pcm_parts), self.sample_rate)
+        self._process.stdin.close()
+        await asyncio.gather(*self._readers)
+        returncode = await self._process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {self._stderr.decode(errors='replace')[-500:]}")
+        return b"".join(self._output)
+
+    async def aclose(self):
+        """Abandon the encoding (e.g. the synthesis failed)."""
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        for reader in self._readers:
+            reader.cancel()
+
+
+async def encode_pcm(pcm: bytes, sample_rate: int, audio_format: str) -> bytes:
+    """Encode a complete PCM buffer."""
+    if audio_format == "wav":
+        return pcm_to_wav_bytes(pcm, sample_rate)
+    encoder = PcmEncoder(audio_format, sample_rate)
+    await encoder.start()
+    try:
+        # Feed in slices (without copying) so ffmpeg starts encoding while the rest is written
+        view = memoryview(pcm)
+        for offset in range(0, len(view), 1 << 16):
+            await encoder.feed(view[offset:offset + (1 << 16)])
+        return await encoder.finish()
+    except BaseException:
+        await encoder.aclose()
+        raise
@@ -0,0 +1,171 @@
+"""Caches for Firebase ID-token verification and user roles.
+
+Verified token claims are kept in a bounded LRU until the token expires, so
+repeated requests with the same token skip signature verification. Firebase's
+public signing keys are refreshed by a background thread, so a request that
+does need verifying doesn't wait for the key download.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import firebase_admin
+import firebase_admin.auth
+
+from .metrics import count_cache
+
+logger = logging.getLogger("piper_tts_web")
+
+TOKEN_CACHE_SIZE = int(os.environ.get("PIPER_TOKEN_CACHE_SIZE", "10000"))
+ROLE_CACHE_TTL = float(os.environ.get("PIPER_ROLE_CACHE_TTL", "60"))
+ROLE_CACHE_SIZE = int(os.environ.get("PIPER_ROLE_CACHE_SIZE", "10000"))
+CERT_REFRESH_INTERVAL = float(os.environ.get("PIPER_AUTH_CERT_REFRESH_INTERVAL", "300"))
+
+
+class TokenCache:
+    """Verified ID-token claims keyed by token hash, valid until the token's exp."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._refresher = None
+        # Latest verified token, re-verified by the refresher to keep the signing keys warm
+        self._warm_token = None
+
+    @staticmethod
+    def _key(id_token: str) -> str:
+        # Don't keep raw bearer tokens around in memory
+        return hashlib.sha256(id_token.encode()).hexdigest()
+
+    def get(self, id_token: str):
+        """Cached claims for the token, or None if it has to be verified."""
+        key = self._key(id_token)
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None and claims.get("exp", 0) > time.time():
+                self._claims.move_to_end(key)
+                self.hits += 1
+                count_cache("token", True)
+                return claims
+            if claims is not None:
+                del self._claims[key]
+            self.misses += 1
+        count_cache("token", False)
+        return None
+
+    def verify_and_store(self, id_token: str) -> dict:
+        """Verify the token with Firebase and cache its claims.
+
+        Raises whatever firebase_admin raises for an invalid token.
+        """
+        self._start_cert_refresher()
+        claims = firebase_admin.auth.verify_id_token(id_token)
+        key = self._key(id_token)
+        with self._lock:
+            self._claims[key] = claims
+            self._claims.move_to_end(key)
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+            self._warm_token = id_token
+        return claims
+
+    def verify(self, id_token: str) -> dict:
+        return self.get(id_token) or self.verify_and_store(id_token)
+
+    def _start_cert_refresher(self):
+        if self._refresher is not None or CERT_REFRESH_INTERVAL <= 0:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_certs, name="auth-cert-refresh", daemon=True)
+        self._refresher.start()
+
+    def _refresh_certs(self):
+        # Verifying a token goes through firebase_admin's HTTP-cached key download, so once the
+        # cached keys expire they are fetched here instead of in a request. The keys are fetched
+        # before the token's exp is checked, so an expired token still does the job.
+        while True:
+            time.sleep(CERT_REFRESH_INTERVAL)
+            try:
+                firebase_admin.auth.verify_id_token(self._warm_token)
+            except firebase_admin.auth.ExpiredIdTokenError:
+                pass
+            except Exception as e:
+                logger.warning(f"Could not refresh Firebase public keys: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._claims.clear()
+            self._warm_token = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._claims),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RoleCache:
+    """Short-lived cache of per-user flags (e.g. superuser) read from Firestore."""
+
+    def __init__(self, name: str, ttl: float = ROLE_CACHE_TTL, max_size: int = ROLE_CACHE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._roles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uid: str, load):
+        """Return the cached value for uid, calling load(uid) when missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._roles.get(uid)
+            if entry is not None and entry[1] > now:
+                self._roles.move_to_end(uid)
+                self.hits += 1
+                count_cache(self.name, True)
+                return entry[0]
+            self.misses += 1
+        count_cache(self.name, False)
+        value = load(uid)
+        with self._lock:
+            self._roles[uid] = (value, now + self.ttl)
+            self._roles.move_to_end(uid)
+            while len(self._roles) > self.max_size:
+                self._roles.popitem(last=False)
+        return value
+
+    def invalidate(self, uid: str = None):
+        with self._lock:
+            if uid is None:
+                self._roles.clear()
+            else:
+                self._roles.pop(uid, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._roles),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+token_cache = TokenCache()
+superuser_cache = RoleCache("superuser")
@@ -0,0 +1,259 @@
+"""Resident Piper voice engine.
+
+Keeps loaded PiperVoice (onnxruntime) sessions in memory so each gunicorn
+worker only pays the model load once per voice instead of once per request.
+"""
+import io
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import onnxruntime
+    from piper import PiperVoice
+    from piper.config import PiperConfig
+except ImportError:  # Legacy installs only ship the piper binary
+    PiperVoice = None
+
+from .shared_weights import load_shared_weights
+from .text_processing import cache_phonemes, synthesis_units
+
+logger = logging.getLogger("piper_tts_web")
+
+# Maximum number of voices kept loaded per worker (least recently used is evicted)
+MAX_LOADED_VOICES = int(os.environ.get("PIPER_MAX_LOADED_VOICES", "4"))
+
+# The sentences of long texts are synthesized on a pool of processes
+SYNTHESIS_PROCESSES = int(os.environ.get("PIPER_SYNTHESIS_PROCESSES", str(min(4, os.cpu_count() or 1))))
+PARALLEL_MIN_CHARS = int(os.environ.get("PIPER_PARALLEL_MIN_CHARS", "1000"))
+SENTENCE_SILENCE_MS = int(os.environ.get("PIPER_SENTENCE_SILENCE_MS", "0"))
+
+
+def load_voice(model_path, intra_op_threads=None):
+    """Load a Piper voice, optionally limiting onnxruntime to a number of threads.
+
+    When possible the weights come from a file mapping shared with the other
+    processes that have the same model loaded (see shared_weights), and
+    phonemes of sentences seen before come from the phoneme cache.
+    """
+    shared = load_shared_weights(model_path)
+    if intra_op_threads is None and shared is None:
+        return cache_phonemes(PiperVoice.load(str(model_path)))
+    with open(f"{model_path}.json", "r", encoding="utf-8") as config_file:
+        config = PiperConfig.from_dict(json.load(config_file))
+    sess_options = onnxruntime.SessionOptions()
+    if intra_op_threads is not None:
+        sess_options.intra_op_num_threads = intra_op_threads
+        sess_options.inter_op_num_threads = 1
+    session_path = model_path
+    if shared is not None:
+        shared.apply(sess_options)
+        session_path = shared.graph_path
+    session = onnxruntime.InferenceSession(
+        str(session_path), sess_options=sess_options, providers=["CPUExecutionProvider"]
+    )
+    voice = PiperVoice(session=session, config=config)
+    # The session reads the mapped arrays in place, so they live as long as the voice
+    voice.shared_weights = shared
+    return cache_phonemes(voice)
+
+
+class VoicePool:
+    """LRU cache of loaded Piper voices keyed by (voice name, model version)."""
+
+    def __init__(self, max_voices: int = MAX_LOADED_VOICES, intra_op_threads=None):
+        self.max_voices = max(1, max_voices)
+        self.intra_op_threads = intra_op_threads
+        self._voices = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    @property
+    def available(self) -> bool:
+        return PiperVoice is not None
+
+    def is_loaded(self, key) -> bool:
+        with self._lock:
+            return key in self._voices
+
+    def get(self, key, fetch):
+        """Return the loaded voice for key, loading it if needed.
+
+        fetch is only called on a miss and must return the local model path.
+        """
+        if PiperVoice is None:
+            raise RuntimeError("piper Python package is not installed")
+
+        with self._lock:
+            voice = self._voices.get(key)
+            if voice is not None:
+                self._voices.move_to_end(key)
+                return voice
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given voice; others wait and reuse it
+        with load_lock:
+            with self._lock:
+                voice = self._voices.get(key)
+                if voice is not None:
+                    self._voices.move_to_end(key)
+                    return voice
+
+            model_path = fetch()
+            logger.info(f"Loading voice {key} from {model_path}")
+            voice = load_voice(model_path, self.intra_op_threads)
+
+            with self._lock:
+                # Drop older versions of the same voice before counting against the cap
+                for old_key in [k for k in self._voices if k[0] == key[0]]:
+                    logger.info(f"Unloading outdated voice {old_key}")
+                    del self._voices[old_key]
+                self._voices[key] = voice
+                while len(self._voices) > self.max_voices:
+                    evicted_key, _ = self._voices.popitem(last=False)
+                    logger.info(f"Evicted voice {evicted_key} (max {self.max_voices} loaded)")
+                self._load_locks.pop(key, None)
+            return voice
+
+    def loaded_voices(self) -> list:
+        with self._lock:
+            return list(self._voices.keys())
+
+    def clear(self):
+        with self._lock:
+            self._voices.clear()
+
+
+def wav_header(sample_rate: int, sample_width: int = 2, channels: int = 1, data_size=None) -> bytes:
+    """44-byte PCM WAV header.
+
+    Without data_size the sizes are set to the maximum, which players treat as
+    "read until end of stream" when audio is sent before its length is known.
+    """
+    if data_size is None:
+        data_size = 0xFFFFFFFF - 36
+    byte_rate = sample_rate * sample_width * channels
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", data_size + 36, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, sample_width * channels, sample_width * 8,
+        b"data", data_size,
+    )
+
+
+def pcm_to_wav_bytes(pcm: bytes, sample_rate: int, sample_width: int = 2, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def wav_bytes_to_pcm(data: bytes):
+    """(pcm, sample_rate) from an in-memory 16-bit mono WAV file."""
+    with wave.open(io.BytesIO(data), "rb") as wav_file:
+        return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()
+
+
+def synthesize_chunks(voice, text: str):
+    """Normalize text for the voice's language and synthesize it sentence by sentence."""
+    for unit in synthesis_units(text, voice.config.espeak_voice):
+        yield from voice.synthesize(unit)
+
+
+def synthesize_unit_pcm(voice, unit: str) -> bytes:
+    """Synthesize one sentence already returned by synthesis_units to raw 16-bit mono PCM."""
+    return b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(unit))
+
+
+def synthesize_pcm(voice, text: str) -> bytes:
+    """Synthesize text to raw 16-bit mono PCM."""
+    return b"".join(chunk.audio_int16_bytes for chunk in synthesize_chunks(voice, text))
+
+
+def sentence_silence(sample_rate: int, silence_ms: int = SENTENCE_SILENCE_MS) -> bytes:
+    """PCM silence inserted between sentences."""
+    return b"\x00\x00" * int(sample_rate * silence_ms / 1000)
+
+
+def join_pcm(parts, sample_rate: int, silence_ms: int = SENTENCE_SILENCE_MS) -> bytes:
+    """Concatenate PCM chunks in order with optional silence between them."""
+    return sentence_silence(sample_rate, silence_ms).join(parts)
+
+
+# Voices loaded inside each synthesis pool process
+_process_voices = None
+
+
+def _synthesize_in_process(key, model_path, unit):
+    global _process_voices
+    if _process_voices is None:
+        # Each process runs one chunk at a time, so one onnxruntime thread avoids oversubscription
+        _process_voices = VoicePool(intra_op_threads=1)
+    voice = _process_voices.get(key, lambda: model_path)
+    return synthesize_unit_pcm(voice, unit), voice.config.sample_rate
+
+
+class SynthesisProcessPool:
+    """Fans the sentences of long texts out to processes with resident voices."""
+
+    def __init__(self, processes: int = SYNTHESIS_PROCESSES, min_chars: int = PARALLEL_MIN_CHARS):
+        self.processes = processes
+        self.min_chars = min_chars
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def should_split(self, text: str) -> bool:
+        return PiperVoice is not None and self.processes > 1 and len(text) >= self.min_chars
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already holds onnxruntime threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, key, model_path, unit: str):
+        """Start synthesizing one normalized sentence; the future resolves to (pcm, sample_rate)."""
+        try:
+            return self._get_executor().submit(_synthesize_in_process, key, str(model_path), unit)
+        except BrokenProcessPool:
+            self.reset()
+            raise
+
+    def synthesize_units(self, key, model_path, units: list):
+        """Return ([pcm per unit], sample_rate), synthesizing the units in parallel."""
+        futures = [self.submit(key, model_path, unit) for unit in units]
+        try:
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            self.reset()
+            raise
+        sample_rate = results[0][1] if results else 22050
+        return [pcm for pcm, _ in results], sample_rate
+
+    def reset(self):
+        """Start new processes on the next submit, after the pool broke."""
+        with self._lock:
+            self._executor = None
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+voice_pool = VoicePool()
+synthesis_pool = SynthesisProcessPool()
@@ -0,0 +1,25 @@
+"""Bounded thread pools for blocking work done on behalf of async endpoints.
+
+Each resource gets its own pool so a burst of slow uploads cannot starve
+Firestore writes or synthesis, and none of them block the event loop.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+STORAGE_THREADS = int(os.environ.get("PIPER_STORAGE_THREADS", "8"))
+FIRESTORE_THREADS = int(os.environ.get("PIPER_FIRESTORE_THREADS", "8"))
+SYNTHESIS_THREADS = int(os.environ.get("PIPER_SYNTHESIS_THREADS", "2"))
+AUTH_THREADS = int(os.environ.get("PIPER_AUTH_THREADS", "4"))
+
+storage_executor = ThreadPoolExecutor(max_workers=STORAGE_THREADS, thread_name_prefix="storage")
+firestore_executor = ThreadPoolExecutor(max_workers=FIRESTORE_THREADS, thread_name_prefix="firestore")
+synthesis_executor = ThreadPoolExecutor(max_workers=SYNTHESIS_THREADS, thread_name_prefix="synthesis")
+auth_executor = ThreadPoolExecutor(max_workers=AUTH_THREADS, thread_name_prefix="auth")
+
+
+async def run_in(executor, func, *args, **kwargs):
+    """Run a blocking call on the given executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
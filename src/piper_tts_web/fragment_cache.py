@@ -0,0 +1,180 @@
+"""Cache of synthesized audio per sentence, so texts that share sentences share audio.
+
+The result cache in synthesize_speech only helps when the whole text repeats;
+most new requests differ from earlier ones by a sentence or two. Fragments are
+stored as small WAV files named after (voice, model generation, normalized
+sentence) in a size-bounded directory shared by all workers, least recently
+used first out. With PIPER_FRAGMENT_CACHE_SPILL=1 evicted fragments are
+uploaded to the bucket instead of being dropped, and local misses are looked
+up there before synthesizing.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import uuid
+import wave
+from pathlib import Path
+
+from .engine import pcm_to_wav_bytes, wav_bytes_to_pcm
+from .metrics import FRAGMENT_BYTES_SAVED, count_cache
+
+logger = logging.getLogger("piper_tts_web")
+
+FRAGMENT_CACHE_DIR = os.environ.get(
+    "PIPER_FRAGMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "piper_tts_web", "fragments")
+)
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get("PIPER_FRAGMENT_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+FRAGMENT_CACHE_SPILL = os.environ.get("PIPER_FRAGMENT_CACHE_SPILL", "0") == "1"
+FRAGMENT_BUCKET_PREFIX = "fragments/"
+
+
+class FragmentCache:
+    """Size-bounded LRU of sentence PCM on local disk, optionally backed by the bucket."""
+
+    def __init__(self, cache_dir=FRAGMENT_CACHE_DIR, max_bytes: int = FRAGMENT_CACHE_MAX_BYTES, spill: bool = FRAGMENT_CACHE_SPILL):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._lock = threading.Lock()
+        # Bytes written since the last eviction pass; the directory is only scanned now and then
+        self._written = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.spill_hits = 0
+        self.spilled = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, voice: str, generation, sentence: str) -> str:
+        return hashlib.sha256(f"{voice}\0{generation}\0{sentence}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.wav"
+
+    def read(self, key: str):
+        """(pcm, sample_rate) from the local store, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            return wav_bytes_to_pcm(data)
+        except (wave.Error, EOFError) as e:
+            # Truncated or corrupt file: synthesize the sentence again and overwrite it
+            logger.warning(f"Ignoring corrupt fragment {key}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def read_spilled(self, key: str, bucket):
+        """(pcm, sample_rate) from the bucket, kept locally again; None if it was never spilled."""
+        if not (self.enabled and self.spill and bucket):
+            return None
+        from google.api_core.exceptions import NotFound
+
+        try:
+            data = bucket.blob(f"{FRAGMENT_BUCKET_PREFIX}{key}.wav").download_as_bytes()
+        except NotFound:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read spilled fragment {key}: {e}")
+            return None
+        self._store(key, data, bucket)
+        with self._lock:
+            self.spill_hits += 1
+        return wav_bytes_to_pcm(data)
+
+    def write(self, key: str, pcm: bytes, sample_rate: int, bucket=None):
+        if self.enabled:
+            self._store(key, pcm_to_wav_bytes(pcm, sample_rate), bucket)
+
+    def _store(self, key: str, data: bytes, bucket):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache fragment {key}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._written += len(data)
+            due = self._written > self.max_bytes // 16
+            if due:
+                self._written = 0
+        if due:
+            self.evict(bucket)
+
+    def record(self, fragments: list):
+        """Count the outcome of looking up one text's fragments (None for a miss)."""
+        hits = [fragment for fragment in fragments if fragment is not None]
+        saved = sum(len(pcm) for pcm, _ in hits)
+        with self._lock:
+            self.hits += len(hits)
+            self.misses += len(fragments) - len(hits)
+            self.bytes_saved += saved
+        for fragment in fragments:
+            count_cache("fragment", fragment is not None)
+        if saved:
+            FRAGMENT_BYTES_SAVED.inc(saved)
+
+    def evict(self, bucket=None):
+        """Delete least recently used fragments (uploading them first when spilling) until under max_bytes."""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.cache_dir) as scan:
+                for entry in scan:
+                    if not entry.name.endswith(".wav"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, Path(entry.path), stat.st_size))
+                    total += stat.st_size
+        except FileNotFoundError:
+            return
+
+        entries.sort(key=lambda e: e[0])
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if self.spill and bucket:
+                try:
+                    bucket.blob(f"{FRAGMENT_BUCKET_PREFIX}{path.name}").upload_from_filename(str(path), content_type="audio/wav")
+                    with self._lock:
+                        self.spilled += 1
+                except Exception as e:
+                    logger.warning(f"Could not spill fragment {path.name} to the bucket: {e}")
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "spill_hits": self.spill_hits,
+            "spilled": self.spilled,
+            "max_bytes": self.max_bytes,
+            "spill": self.spill,
+        }
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,8 @@
+"""gunicorn settings loaded by start.sh (--config python:piper_tts_web.gunicorn_conf)."""
+
+
+def child_exit(server, worker):
+    # Imported here so the master doesn't load the app just for this hook
+    from .metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
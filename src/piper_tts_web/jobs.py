@@ -0,0 +1,164 @@
+"""Storage for asynchronous synthesis jobs.
+
+Jobs are plain dicts. The store is pluggable: Firestore in production so any
+worker can answer a status poll, or a local SQLite file for development and
+testing (shared by the workers of a single host).
+"""
+import abc
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+JOB_STORE = os.environ.get("PIPER_JOB_STORE", "")
+JOB_DB_PATH = os.environ.get(
+    "PIPER_JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "piper_tts_web", "jobs.sqlite3")
+)
+
+# Unfinished jobs not updated for this long were orphaned by a worker that died
+JOB_STALE_SECONDS = float(os.environ.get("PIPER_JOB_STALE_SECONDS", "600"))
+# Live jobs touch their updated time at least this often, even while waiting
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("PIPER_JOB_HEARTBEAT_SECONDS", "60"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_UNFINISHED = (JOB_QUEUED, JOB_RUNNING)
+
+
+def new_job(uid, voice: str, text: str) -> dict:
+    now = time.time()
+    return {
+        "id": uuid.uuid4().hex,
+        "uid": uid,
+        "voice": voice,
+        "text": text,
+        "status": JOB_QUEUED,
+        "sentences_total": None,
+        "sentences_done": 0,
+        "audioUrl": None,
+        "duration": None,
+        "error": None,
+        "created": now,
+        "updated": now,
+    }
+
+
+class JobStore(abc.ABC):
+    """Interface for job stores."""
+
+    @abc.abstractmethod
+    def create(self, job: dict) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id: str):
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        ...
+
+    @abc.abstractmethod
+    def unfinished_job_ids(self, updated_before: float) -> list:
+        """Ids of queued or running jobs last updated before the given time."""
+
+    def fail_stale(self, error: str, max_age: float = JOB_STALE_SECONDS) -> list:
+        """Mark queued or running jobs that stopped making progress as failed; returns their ids."""
+        job_ids = self.unfinished_job_ids(time.time() - max_age)
+        for job_id in job_ids:
+            self.update(job_id, status=JOB_FAILED, error=error)
+        return job_ids
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path=JOB_DB_PATH):
+        self.path = str(path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            # WAL lets the other gunicorn workers read while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS synthesis_jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def create(self, job: dict) -> dict:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO synthesis_jobs (id, data, updated) VALUES (?, ?, ?)",
+                (job["id"], json.dumps(job), job["updated"]),
+            )
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM synthesis_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM synthesis_jobs WHERE id = ?", (job_id,)).fetchone()
+                if row:
+                    job = json.loads(row[0])
+                    job.update(fields)
+                    self._conn.execute(
+                        "UPDATE synthesis_jobs SET data = ?, updated = ? WHERE id = ?",
+                        (json.dumps(job), fields["updated"], job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def unfinished_job_ids(self, updated_before: float) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, data FROM synthesis_jobs WHERE updated < ?", (updated_before,)
+            ).fetchall()
+        return [job_id for job_id, data in rows if json.loads(data).get("status") in JOB_UNFINISHED]
+
+
+class FirestoreJobStore(JobStore):
+    def __init__(self, db, collection: str = "synthesisJobs"):
+        self.collection = db.collection(collection)
+
+    def create(self, job: dict) -> dict:
+        self.collection.document(job["id"]).set(job)
+        return job
+
+    def get(self, job_id: str):
+        doc = self.collection.document(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        self.collection.document(job_id).set(fields, merge=True)
+
+    def unfinished_job_ids(self, updated_before: float) -> list:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        # Few jobs are unfinished at a time; filtering on updated here avoids a composite index
+        unfinished = self.collection.where(filter=FieldFilter("status", "in", list(JOB_UNFINISHED))).stream()
+        return [doc.id for doc in unfinished if (doc.to_dict().get("updated") or 0) < updated_before]
+
+
+def create_job_store(db=None) -> JobStore:
+    """Pick the job store from PIPER_JOB_STORE ("firestore" or "sqlite")."""
+    kind = JOB_STORE or ("firestore" if db is not None else "sqlite")
+    if kind == "firestore":
+        if db is None:
+            raise RuntimeError("PIPER_JOB_STORE=firestore requires Firestore")
+        return FirestoreJobStore(db)
+    if kind == "sqlite":
+        return SQLiteJobStore(JOB_DB_PATH)
+    raise ValueError(f"Unknown job store: {kind}")
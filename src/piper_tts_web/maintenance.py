@@ -0,0 +1,109 @@
+"""Maintenance commands for the Piper TTS Web Interface.
+
+Usage:
+    python -m piper_tts_web.maintenance backfill-usage [--uid UID]
+    python -m piper_tts_web.maintenance backfill-recording-index
+    python -m piper_tts_web.maintenance rebuild-facets
+    python -m piper_tts_web.maintenance rebuild-search-index
+"""
+import argparse
+import sys
+
+from . import server
+from .search_index import search_index
+from .server import logger
+
+
+def backfill_usage(uid=None):
+    """Recompute the maintained usage counters from users' recordings."""
+    if uid:
+        uids = [uid]
+    else:
+        uids = {user.id for user in server.db.collection("users").stream()}
+        # Users that already have counters but no user doc
+        uids.update(doc.id for doc in server.db.collection(server.USAGE_COLLECTION).stream())
+        uids = sorted(uids)
+    for user_id in uids:
+        usage = server.reconcile_user_usage(user_id)
+        logger.info(f"Reconciled usage for {user_id}: {usage}")
+    logger.info(f"Reconciled usage for {len(uids)} users")
+
+
+def backfill_recording_index():
+    """Add the fields the dashboard queries filter on to recordings written before they existed."""
+    batch = server.db.batch()
+    pending = 0
+    updated = 0
+    for doc in server.db.collection_group("recordings").stream():
+        data = doc.to_dict()
+        fields = {}
+        parent = doc.reference.parent.parent
+        if parent is not None and data.get("uid") != parent.id:
+            fields["uid"] = parent.id
+        if data.get("voice") and "voiceLower" not in data:
+            fields["voiceLower"] = data["voice"].lower()
+        if "durationBucket" not in data:
+            fields["durationBucket"] = server.duration_bucket(data.get("duration"))
+        if data.get("text") and "textWords" not in data:
+            fields["textWords"] = server.text_search_words(data["text"])
+        if not fields:
+            continue
+        batch.set(doc.reference, fields, merge=True)
+        pending += 1
+        updated += 1
+        if pending >= 400:
+            batch.commit()
+            batch = server.db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+    logger.info(f"Backfilled index fields on {updated} recordings")
+
+
+def rebuild_facets():
+    """Recompute the dashboard facets from all recordings."""
+    facets = server.rebuild_dashboard_facets()
+    logger.info(
+        f"Rebuilt dashboard facets: {facets['total_count']} recordings, "
+        f"{len(facets['voices'])} voices, {facets['total_duration']:.1f}s total"
+    )
+
+
+def rebuild_search_index():
+    """Rebuild the local dashboard search index from Firestore."""
+    if search_index is None:
+        print("PIPER_SEARCH_INDEX_PATH is not set", file=sys.stderr)
+        return 1
+    search_index.rebuild(server.db)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m piper_tts_web.maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    usage_parser = subparsers.add_parser("backfill-usage", help="recompute per-user usage counters")
+    usage_parser.add_argument("--uid", help="only reconcile this user")
+
+    subparsers.add_parser("backfill-recording-index", help="add dashboard filter fields to older recordings")
+    subparsers.add_parser("rebuild-facets", help="recompute the dashboard voice/duration facets")
+    subparsers.add_parser("rebuild-search-index", help="rebuild the local dashboard search index from Firestore")
+
+    args = parser.parse_args(argv)
+    if not server.db:
+        print("Firestore is not available (is FIREBASE_SERVICE_ACCOUNT_JSON set?)", file=sys.stderr)
+        return 1
+
+    if args.command == "backfill-usage":
+        backfill_usage(args.uid)
+    elif args.command == "backfill-recording-index":
+        backfill_recording_index()
+    elif args.command == "rebuild-facets":
+        rebuild_facets()
+    elif args.command == "rebuild-search-index":
+        return rebuild_search_index()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Prometheus metrics for /metrics.
+
+Under gunicorn every worker is its own process, so metrics are kept in
+prometheus_client's multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set
+(start.sh does this): each worker writes its values to files in that
+directory and /metrics, whichever worker answers, reports the sum over all
+of them. Without the variable the metrics cover only the current process.
+"""
+import os
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "piper_stage_seconds",
+    "Time spent in each stage of handling a synthesis request",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "piper_cache_lookups_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"],
+)
+PIPER_CLI_ATTEMPTS = Counter(
+    "piper_cli_attempts_total",
+    "Piper CLI fallback invocations by command format and result",
+    ["format", "result"],
+)
+ERRORS = Counter(
+    "piper_errors_total",
+    "Failed requests by endpoint and error type",
+    ["endpoint", "type"],
+)
+FRAGMENT_BYTES_SAVED = Counter(
+    "piper_fragment_cache_bytes_saved_total",
+    "PCM bytes served from the sentence fragment cache instead of being synthesized",
+)
+SYNTHESIS_QUEUE_DEPTH = Gauge(
+    "piper_synthesis_queue_depth",
+    "Requests waiting for a synthesis slot",
+    multiprocess_mode="livesum",
+)
+SYNTHESES_ACTIVE = Gauge(
+    "piper_syntheses_active",
+    "Syntheses currently running",
+    multiprocess_mode="livesum",
+)
+SYNTHESIS_REJECTED = Counter(
+    "piper_synthesis_rejected_total",
+    "Requests turned away because the synthesis queue was full",
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Record how long the block takes as one observation of the stage."""
+    with STAGE_SECONDS.labels(stage=stage).time():
+        yield
+
+
+def count_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def count_error(endpoint: str, error: BaseException):
+    # HTTP errors by status, anything else by exception class
+    status_code = getattr(error, "status_code", None)
+    error_type = f"http_{status_code}" if status_code is not None else type(error).__name__
+    ERRORS.labels(endpoint=endpoint, type=error_type).inc()
+
+
+def render_metrics():
+    """(body, content type) for the /metrics endpoint."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead(pid: int):
+    """Drop a finished worker's live gauges (called from the gunicorn child_exit hook)."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,163 @@
+"""Persistent on-disk cache for voice models stored in Firebase Storage.
+
+Models are stored as {voice}.{generation}.onnx (plus the matching .onnx.json)
+so a re-uploaded model gets a new file name. Downloads go to a temporary file
+that is verified against the blob md5 and then atomically renamed into place,
+which lets all gunicorn workers share one cache directory.
+"""
+import base64
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("piper_tts_web")
+
+MODEL_CACHE_DIR = os.environ.get(
+    "PIPER_MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "piper_tts_web", "models")
+)
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("PIPER_MODEL_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+def _file_md5(path: Path) -> str:
+    """Base64 md5 of a file, in the same format as blob.md5_hash."""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode("ascii")
+
+
+class ModelCache:
+    """Size-bounded LRU cache of .onnx/.onnx.json files on local disk."""
+
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def model_path(self, voice: str, generation) -> Path:
+        return self.cache_dir / f"{voice}.{generation}.onnx"
+
+    def is_cached(self, voice: str, generation) -> bool:
+        return self.model_path(voice, generation).exists()
+
+    def fetch(self, voice: str, onnx_blob, json_blob) -> Path:
+        """Return the local path of the model for onnx_blob, downloading it if needed.
+
+        onnx_blob must have its metadata loaded (e.g. from bucket.get_blob) so
+        the generation and md5 are known without another round-trip.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        model_path = self.model_path(voice, onnx_blob.generation)
+        config_path = Path(f"{model_path}.json")
+
+        if model_path.exists():
+            self._touch(model_path)
+            return model_path
+
+        # Serialize downloads of the same model across worker processes
+        lock_path = self.cache_dir / f"{voice}.lock"
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if model_path.exists():
+                    self._touch(model_path)
+                    return model_path
+
+                # Config first: the .onnx appearing is what marks the entry complete
+                if json_blob is not None and json_blob.exists():
+                    self._download(json_blob, config_path)
+                if not self._reuse_previous_generation(voice, onnx_blob, model_path):
+                    self._download(onnx_blob, model_path, expected_md5=onnx_blob.md5_hash)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        self.evict(keep={model_path})
+        return model_path
+
+    def _reuse_previous_generation(self, voice: str, onnx_blob, model_path: Path) -> bool:
+        """Rename an older cached generation into place if its content is unchanged."""
+        if not onnx_blob.md5_hash:
+            return False
+        for old_path in self.cache_dir.glob(f"{voice}.*.onnx"):
+            if old_path == model_path or not old_path.name[len(voice) + 1:-5].isdigit():
+                continue
+            try:
+                if _file_md5(old_path) == onnx_blob.md5_hash:
+                    os.replace(old_path, model_path)
+                    Path(f"{old_path}.json").unlink(missing_ok=True)
+                    self._remove_shared_files(old_path)
+                    logger.info(f"Model {voice} unchanged (md5 match), reusing {old_path.name}")
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def _download(self, blob, dest: Path, expected_md5=None):
+        tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            blob.download_to_filename(str(tmp_path))
+            if expected_md5:
+                actual_md5 = _file_md5(tmp_path)
+                if actual_md5 != expected_md5:
+                    raise IOError(f"Checksum mismatch for {blob.name}: {actual_md5} != {expected_md5}")
+            os.replace(tmp_path, dest)
+            logger.info(f"Cached {blob.name} at {dest}")
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _shared_files(self, model_path: Path) -> list:
+        # Mappable weights written by shared_weights next to the model
+        return list(self.cache_dir.glob(f"{model_path.name}.shared.*"))
+
+    def _remove_shared_files(self, model_path: Path):
+        # Workers that still map the weights keep them until they unload the voice
+        for shared_path in self._shared_files(model_path):
+            shared_path.unlink(missing_ok=True)
+
+    def _touch(self, model_path: Path):
+        try:
+            os.utime(model_path)
+        except OSError:
+            pass
+
+    def evict(self, keep=()):
+        """Delete least recently used models until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*.onnx"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            size = stat.st_size
+            for extra_path in [Path(f"{path}.json"), *self._shared_files(path)]:
+                try:
+                    size += extra_path.stat().st_size
+                except OSError:
+                    pass
+            entries.append((stat.st_mtime, path, size))
+            total += size
+
+        entries.sort(key=lambda e: e[0])
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                # Unlinking is safe even if another worker has the file open
+                path.unlink()
+                Path(f"{path}.json").unlink(missing_ok=True)
+                self._remove_shared_files(path)
+                total -= size
+                logger.info(f"Evicted cached model {path.name}")
+            except OSError as e:
+                logger.warning(f"Could not evict cached model {path.name}: {e}")
+
+
+model_cache = ModelCache()
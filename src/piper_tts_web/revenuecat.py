@@ -0,0 +1,223 @@
+"""RevenueCat subscription lookups with a shared HTTP client and an entitlement cache.
+
+One pooled httpx client (keep-alive, HTTP/2 when the h2 package is installed)
+is used for every lookup instead of a new connection per call. Results are
+cached per uid: active entitlements until they expire, inactive ones for a
+short negative TTL. The RevenueCat webhook invalidates a user's entry as soon
+as their subscription changes, in every worker: it touches a per-user marker
+file in a directory shared by the workers, and cached entries older than the
+marker are looked up again.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+from .metrics import count_cache
+
+logger = logging.getLogger("piper_tts_web")
+
+REVENUECAT_TIMEOUT = float(os.environ.get("PIPER_REVENUECAT_TIMEOUT", "5"))
+ENTITLEMENT_CACHE_SIZE = int(os.environ.get("PIPER_ENTITLEMENT_CACHE_SIZE", "10000"))
+# Upper bound for caching an active entitlement (refunds and revocations arrive via webhook)
+ENTITLEMENT_MAX_TTL = float(os.environ.get("PIPER_ENTITLEMENT_MAX_TTL", "600"))
+ENTITLEMENT_NEGATIVE_TTL = float(os.environ.get("PIPER_ENTITLEMENT_NEGATIVE_TTL", "60"))
+# After a failed lookup, avoid retrying RevenueCat on every request for a short while
+ENTITLEMENT_ERROR_TTL = float(os.environ.get("PIPER_ENTITLEMENT_ERROR_TTL", "10"))
+ENTITLEMENT_INVALIDATION_DIR = os.environ.get(
+    "PIPER_ENTITLEMENT_INVALIDATION_DIR",
+    os.path.join(tempfile.gettempdir(), "piper_tts_web", "entitlement_invalidations"),
+)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def entitlement_expiry(entitlement: dict):
+    """Expiry of an entitlement in epoch seconds, or None for a lifetime entitlement."""
+    expires_date = entitlement.get("expires_date")
+    if expires_date is None:
+        return None
+    if isinstance(expires_date, (int, float)):
+        # Milliseconds since the epoch
+        return expires_date / 1000
+    return datetime.fromisoformat(expires_date.replace("Z", "+00:00")).timestamp()
+
+
+def active_until(subscriber: dict):
+    """(active, until) for a subscriber; until is None when an entitlement never expires."""
+    now = time.time()
+    active = False
+    latest = 0.0
+    for entitlement_id, entitlement in (subscriber.get("entitlements") or {}).items():
+        expiry = entitlement_expiry(entitlement)
+        if expiry is None:
+            logger.info(f"Found lifetime subscription for entitlement {entitlement_id}")
+            return True, None
+        if expiry > now:
+            logger.info(f"Found active subscription for entitlement {entitlement_id}")
+            active = True
+            latest = max(latest, expiry)
+    return active, latest if active else None
+
+
+class EntitlementCache:
+    """uid -> has active entitlement, each entry with its own expiry."""
+
+    def __init__(self, max_size: int = ENTITLEMENT_CACHE_SIZE, invalidation_dir=ENTITLEMENT_INVALIDATION_DIR):
+        self.max_size = max_size
+        self.invalidation_dir = Path(invalidation_dir)
+        # uid -> (active, expires at, looked up at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, uid: str):
+        """Cached result for uid, or None if it has to be looked up."""
+        with self._lock:
+            entry = self._entries.get(uid)
+            if entry is not None and entry[1] > time.time() and not self._invalidated_since(uid, entry[2]):
+                self._entries.move_to_end(uid)
+                self.hits += 1
+                count_cache("entitlement", True)
+                return entry[0]
+            if entry is not None:
+                del self._entries[uid]
+            self.misses += 1
+        count_cache("entitlement", False)
+        return None
+
+    def set(self, uid: str, active: bool, ttl: float, looked_up_at: float = None):
+        """Cache a result; looked_up_at is when the lookup started (default now)."""
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[uid] = (active, now + ttl, now if looked_up_at is None else looked_up_at)
+            self._entries.move_to_end(uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _marker(self, uid: str) -> Path:
+        return self.invalidation_dir / hashlib.sha256(uid.encode()).hexdigest()
+
+    def _invalidated_since(self, uid: str, looked_up_at: float) -> bool:
+        try:
+            return self._marker(uid).stat().st_mtime >= looked_up_at
+        except OSError:
+            return False
+
+    def invalidate(self, uid: str):
+        """Drop uid's entry here and, through its marker file, in the other workers."""
+        try:
+            self.invalidation_dir.mkdir(parents=True, exist_ok=True)
+            marker = self._marker(uid)
+            marker.touch()
+            # Set explicitly: the file system's own timestamps can lag time.time()
+            now = time.time()
+            os.utime(marker, (now, now))
+        except OSError as e:
+            logger.warning(f"Could not share entitlement invalidation of {uid}: {e}")
+        with self._lock:
+            if self._entries.pop(uid, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class RevenueCatClient:
+    def __init__(self, base_url: str, api_key, cache: EntitlementCache = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.cache = cache or EntitlementCache()
+        self._client = None
+        self._client_loop = None
+        # uid -> in-flight lookup, so concurrent requests share one API call
+        self._pending = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client_loop = loop
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                http2=HTTP2_AVAILABLE,
+                timeout=REVENUECAT_TIMEOUT,
+                limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+            )
+        return self._client
+
+    async def has_active_entitlement(self, uid: str) -> bool:
+        """Check if user has active subscription via RevenueCat"""
+        if not self.api_key:
+            logger.warning("RevenueCat API key not configured")
+            return False
+        cached = self.cache.get(uid)
+        if cached is not None:
+            return cached
+
+        pending = self._pending.get(uid)
+        if pending is None:
+            pending = asyncio.ensure_future(self._lookup(uid))
+            self._pending[uid] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(uid, None))
+        return await asyncio.shield(pending)
+
+    async def _lookup(self, uid: str) -> bool:
+        # A webhook arriving while the lookup is in flight invalidates its result too
+        started = time.time()
+        try:
+            response = await self._get_client().get(f"/subscribers/{uid}")
+            if response.status_code != 200:
+                logger.warning(f"RevenueCat API error: {response.status_code}")
+                self.cache.set(uid, False, ENTITLEMENT_ERROR_TTL, started)
+                return False
+            subscriber = response.json().get("subscriber", {})
+            active, until = active_until(subscriber)
+        except Exception as e:
+            logger.error(f"Error checking RevenueCat subscription: {e}")
+            self.cache.set(uid, False, ENTITLEMENT_ERROR_TTL, started)
+            return False
+
+        if active:
+            ttl = ENTITLEMENT_MAX_TTL if until is None else min(ENTITLEMENT_MAX_TTL, until - time.time())
+        else:
+            ttl = ENTITLEMENT_NEGATIVE_TTL
+        self.cache.set(uid, active, ttl, started)
+        return active
+
+    def invalidate(self, *uids):
+        for uid in uids:
+            if uid:
+                self.cache.invalidate(uid)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
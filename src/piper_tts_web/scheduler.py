@@ -0,0 +1,139 @@
+"""Admission control for synthesis.
+
+Limits how many syntheses run at once in a worker and keeps a bounded,
+prioritized queue of waiting requests. When the queue is full new requests
+are rejected immediately instead of piling up models in RAM.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from .metrics import SYNTHESES_ACTIVE, SYNTHESIS_QUEUE_DEPTH, SYNTHESIS_REJECTED
+
+MAX_CONCURRENT_SYNTHESES = int(os.environ.get("PIPER_MAX_CONCURRENT_SYNTHESES", "2"))
+MAX_QUEUED_SYNTHESES = int(os.environ.get("PIPER_MAX_QUEUED_SYNTHESES", "16"))
+QUEUE_RETRY_AFTER = int(os.environ.get("PIPER_QUEUE_RETRY_AFTER", "5"))
+
+# Lower value is served first
+PRIORITY_SUBSCRIBER = 0
+PRIORITY_FREE = 1
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Synthesis queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SynthesisSlot:
+    """A granted synthesis slot; release() is safe to call more than once."""
+
+    def __init__(self, scheduler, wait_seconds: float):
+        self._scheduler = scheduler
+        self._released = False
+        self.wait_seconds = wait_seconds
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+
+class SynthesisScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_SYNTHESES,
+        max_queue: int = MAX_QUEUED_SYNTHESES,
+        retry_after: int = QUEUE_RETRY_AFTER,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def has_free_slot(self) -> bool:
+        return self._active < self.max_concurrent and not self._queue
+
+    async def acquire(self, priority: int = PRIORITY_FREE) -> SynthesisSlot:
+        """Wait for a synthesis slot, or raise QueueFullError if the queue is full."""
+        started = time.monotonic()
+        if self.has_free_slot():
+            self._active += 1
+            self._update_gauges()
+            return self._admit(started)
+
+        if len(self._queue) >= self.max_queue:
+            self.rejected_total += 1
+            SYNTHESIS_REJECTED.inc()
+            raise QueueFullError(self.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        self._update_gauges()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._update_gauges()
+            elif future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self._release()
+            raise
+        return self._admit(started)
+
+    def _admit(self, started: float) -> SynthesisSlot:
+        wait_seconds = time.monotonic() - started
+        self.admitted_total += 1
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+        return SynthesisSlot(self, wait_seconds)
+
+    def _release(self):
+        # Hand the slot straight to the highest-priority waiter, if any
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def _update_gauges(self):
+        SYNTHESIS_QUEUE_DEPTH.set(len(self._queue))
+        SYNTHESES_ACTIVE.set(self._active)
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": len(self._queue),
+            "max_queue": self.max_queue,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted_total if self.admitted_total else 0.0,
+        }
+
+
+synthesis_scheduler = SynthesisScheduler()
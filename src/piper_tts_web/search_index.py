@@ -0,0 +1,187 @@
+"""Local full-text index of recording texts for the superuser dashboard.
+
+An SQLite FTS5 table on local disk, fed from recording writes and rebuildable
+from Firestore. Searches support word prefixes ("hel" finds "hello") and
+"quoted phrases", are ranked with bm25 and can be combined with the voice,
+user and duration filters of the dashboard.
+
+Enabled by setting PIPER_SEARCH_INDEX_PATH. The index only sees writes made
+by this host, so deployments with several instances should rebuild it
+periodically (python -m piper_tts_web.maintenance rebuild-search-index).
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("piper_tts_web")
+
+SEARCH_INDEX_PATH = os.environ.get("PIPER_SEARCH_INDEX_PATH")
+
+_QUERY_RE = re.compile(r'"([^"]*)"|([^\s"]+)')
+_TOKEN_RE = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    rowid INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    uid TEXT,
+    voice_lower TEXT,
+    duration_bucket TEXT,
+    created REAL,
+    text TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recordings_created ON recordings (created DESC);
+CREATE VIRTUAL TABLE IF NOT EXISTS recordings_fts USING fts5(
+    text, content='recordings', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS recordings_ai AFTER INSERT ON recordings BEGIN
+    INSERT INTO recordings_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS recordings_ad AFTER DELETE ON recordings BEGIN
+    INSERT INTO recordings_fts (recordings_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS recordings_au AFTER UPDATE ON recordings BEGIN
+    INSERT INTO recordings_fts (recordings_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO recordings_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def build_match_query(search: str) -> str:
+    """Turn dashboard search text into an FTS5 query: quoted phrases, other words as prefixes."""
+    terms = []
+    for phrase, word in _QUERY_RE.findall(search):
+        if phrase:
+            tokens = _TOKEN_RE.findall(phrase.lower())
+            if tokens:
+                terms.append('"' + " ".join(tokens) + '"')
+        else:
+            terms.extend(f'"{token}"*' for token in _TOKEN_RE.findall(word.lower()))
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        if self.path != ":memory:":
+            # WAL lets the other gunicorn workers search while one writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._building = False
+
+    def is_built(self) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        return row is not None
+
+    def _row(self, path: str, uid, recording: dict) -> tuple:
+        return (
+            path,
+            uid,
+            (recording.get("voice") or "").lower() or None,
+            recording.get("durationBucket"),
+            recording.get("created"),
+            recording.get("text") or "",
+            json.dumps(recording, default=str),
+        )
+
+    def index_recording(self, path: str, uid, recording: dict) -> None:
+        """Add or replace one recording."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO recordings (path, uid, voice_lower, duration_bucket, created, text, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET uid = excluded.uid, voice_lower = excluded.voice_lower, "
+                "duration_bucket = excluded.duration_bucket, created = excluded.created, "
+                "text = excluded.text, data = excluded.data",
+                self._row(path, uid, recording),
+            )
+
+    def search(self, search: str, voice=None, duration_bucket=None, uids=None, limit: int = 50, offset: int = 0):
+        """Return (recordings, total); each recording is (path, uid, data) ranked best first."""
+        match = build_match_query(search or "")
+        where = []
+        params = []
+        if match:
+            source = "recordings_fts JOIN recordings r ON r.rowid = recordings_fts.rowid"
+            where.append("recordings_fts MATCH ?")
+            params.append(match)
+            order = "bm25(recordings_fts), r.created DESC"
+        else:
+            source = "recordings r"
+            order = "r.created DESC"
+        if voice:
+            where.append("r.voice_lower = ?")
+            params.append(voice.lower())
+        if duration_bucket:
+            where.append("r.duration_bucket = ?")
+            params.append(duration_bucket)
+        if uids is not None:
+            if not uids:
+                return [], 0
+            where.append(f"r.uid IN ({', '.join('?' * len(uids))})")
+            params.extend(uids)
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT count(*) FROM {source}{where_sql}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT r.path, r.uid, r.data FROM {source}{where_sql} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [(path, uid, json.loads(data)) for path, uid, data in rows], total
+
+    def rebuild(self, db) -> int:
+        """Replace the index with every recording in Firestore."""
+        rows = []
+        for doc in db.collection_group("recordings").stream():
+            parent = doc.reference.parent.parent
+            rows.append(self._row(doc.reference.path, parent.id if parent is not None else None, doc.to_dict()))
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM recordings")
+                self._conn.executemany(
+                    "INSERT INTO recordings (path, uid, voice_lower, duration_bucket, created, text, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)", (str(time.time()),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"Search index rebuilt with {len(rows)} recordings")
+        return len(rows)
+
+    def rebuild_in_background(self, db) -> None:
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.rebuild(db)
+            except Exception as e:
+                logger.error(f"Search index rebuild failed: {e}")
+            finally:
+                self._building = False
+
+        threading.Thread(target=run, name="search-index-rebuild", daemon=True).start()
+
+
+search_index = SearchIndex(SEARCH_INDEX_PATH) if SEARCH_INDEX_PATH else None
@@ -2,23 +2,62 @@ import hashlib
 import json
 import logging
 import os
-import subprocess
 import tempfile
 from pathlib import Path
 import shutil
 import time
+import asyncio
+import random
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
 
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
 import firebase_admin
 from firebase_admin import credentials, firestore, auth, storage
+from google.cloud.firestore_v1.base_query import FieldFilter
 import base64
-from typing import Optional
-import httpx
+from typing import List, Optional
+
+from .auth_cache import superuser_cache, token_cache
+from .executors import auth_executor, firestore_executor, run_in, storage_executor, synthesis_executor
+from .scheduler import PRIORITY_FREE, PRIORITY_SUBSCRIBER, QueueFullError, synthesis_scheduler
+from .engine import (
+    join_pcm,
+    sentence_silence,
+    synthesis_pool,
+    synthesize_chunks,
+    synthesize_pcm,
+    synthesize_unit_pcm,
+    voice_pool,
+    wav_bytes_to_pcm,
+    wav_header,
+)
+from .jobs import (
+    JOB_FAILED,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_RUNNING,
+    JOB_STALE_SECONDS,
+    JOB_SUCCEEDED,
+    create_job_store,
+    new_job,
+)
+from .model_cache import model_cache
+from .fragment_cache import fragment_cache
+from .text_processing import synthesis_units
+from .voice_catalog import VoiceCatalog
+from .search_index import search_index
+from .metrics import PIPER_CLI_ATTEMPTS, STAGE_SECONDS, count_cache, count_error, observe_stage, render_metrics
+from .shared_weights import memory_report
+from .revenuecat import RevenueCatClient
+from .warmup import WARMUP_TEXT, WARMUP_TIMEOUT, WARMUP_TOP_N, select_warmup_voices, warmup_state
+from .audio_encoding import PcmEncoder, encode_pcm, encoder_available, file_extension, media_type, resolve_format
 
 app = FastAPI()
 
@@ -86,14 +125,51 @@ else:
 # Set the Firebase Storage models path
 FIREBASE_MODELS_PATH = "models/"
 
+# Cached list of voices served by /voices
+voice_catalog = VoiceCatalog(FIREBASE_MODELS_PATH)
+
+# Asynchronous synthesis jobs (/synthesis-jobs)
+job_store = create_job_store(db)
+
+# Items accepted by one /synthesize/batch request
+MAX_BATCH_ITEMS = int(os.environ.get("PIPER_MAX_BATCH_ITEMS", "200"))
+
 # RevenueCat configuration
 REVENUECAT_API_KEY = os.getenv("REVENUECAT_API_KEY")
-REVENUECAT_BASE_URL = "https://api.revenuecat.com/v1"
+REVENUECAT_BASE_URL = os.getenv("REVENUECAT_BASE_URL", "https://api.revenuecat.com/v1")
+# Value RevenueCat sends in the Authorization header of webhook calls
+REVENUECAT_WEBHOOK_AUTH = os.getenv("REVENUECAT_WEBHOOK_AUTH")
+revenuecat = RevenueCatClient(REVENUECAT_BASE_URL, REVENUECAT_API_KEY)
 
 # Usage limits
 FREE_FIRST_FILE = True  # First file is always free
 FREE_DURATION_SECONDS = 15 * 60  # 15 minutes of additional free audio
 
+# Dashboard duration filters: name -> [low, high) in seconds
+DURATION_BUCKETS = {
+    "<5": (0, 5),
+    "5-10": (5, 10),
+    "10-30": (10, 30),
+    "30-60": (30, 60),
+    "60-300": (60, 300),
+    ">300": (300, None),
+}
+# Upper bound on recordings read per dashboard page when filters can't all be indexed
+DASHBOARD_MAX_SCAN = 2000
+
+# Per-user usage counters ({total_duration, recordings_count}), maintained on every recording write
+USAGE_COLLECTION = "userUsage"
+
+# Dashboard facets (voice counts, duration bucket counts, totals), maintained on every recording
+# write. Spread over shards so a busy service doesn't contend on a single document.
+FACETS_COLLECTION = "dashboardFacets"
+FACET_SHARDS = int(os.environ.get("PIPER_FACET_SHARDS", "8"))
+# Marks the facets as seeded from the existing recordings; also holds the rebuild lease
+FACETS_META_DOC = "meta"
+FACET_REBUILD_LEASE = 900
+# How long a worker waits for another one to seed the facets before scanning itself
+FACET_SEED_WAIT = float(os.environ.get("PIPER_FACET_SEED_WAIT", "60"))
+
 # Endpoint to serve Firebase config to frontend
 @app.get("/firebase-config")
 async def get_firebase_config():
@@ -115,23 +191,70 @@ async def get_revenuecat_config():
     }
     return config
 
+@app.on_event("shutdown")
+async def close_revenuecat_client():
+    await revenuecat.aclose()
+
+_warmup_task = None
+
+@app.on_event("startup")
+async def start_warmup():
+    # In the background, so /healthz answers while the voices load
+    global _warmup_task
+    _warmup_task = asyncio.create_task(run_warmup())
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 503 until this worker has warmed its voices."""
+    snapshot = warmup_state.snapshot()
+    snapshot["loaded_voices"] = [f"{voice}@{generation}" for voice, generation in voice_pool.loaded_voices()]
+    snapshot["firebase"] = bool(db and bucket)
+    return JSONResponse(content=snapshot, status_code=200 if snapshot["ready"] else 503)
+
 # --- Firestore User & Recording Endpoints ---
 from fastapi import Depends, Header
 
 # Helper: get user UID from Authorization header (Firebase ID token)
-def get_user_uid(authorization: Optional[str] = Header(None)):
-    logger.info(f"get_user_uid called. Authorization header: {authorization}")
+async def get_user_uid(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """uid of the Firebase ID token in the Authorization header, or None if missing or invalid."""
     if not authorization or not authorization.startswith("Bearer "):
-        logger.warning("No or invalid Authorization header.")
         return None
     id_token = authorization.split(" ", 1)[1]
-    try:
-        decoded = firebase_admin.auth.verify_id_token(id_token)
-        logger.info(f"Token verified for uid: {decoded['uid']}")
-        return decoded["uid"]
-    except Exception as e:
-        logger.error(f"Failed to verify ID token: {e}")
-        return None
+    with observe_stage("auth"):
+        decoded = token_cache.get(id_token)
+        if decoded is None:
+            try:
+                decoded = await run_in(auth_executor, token_cache.verify_and_store, id_token)
+            except Exception as e:
+                logger.error(f"Failed to verify ID token: {e}")
+                return None
+    return decoded["uid"]
+
+async def require_user_uid(uid: Optional[str] = Depends(get_user_uid)) -> str:
+    if not uid:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return uid
+
+def _load_superuser(uid: str) -> bool:
+    user_doc = db.collection("users").document(uid).get()
+    return bool(user_doc.exists and user_doc.to_dict().get("superuser"))
+
+async def require_superuser(uid: str = Depends(require_user_uid)) -> str:
+    if not db:
+        raise HTTPException(status_code=500, detail="Firestore not available")
+    if not await run_in(firestore_executor, superuser_cache.get, uid, _load_superuser):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return uid
+
+@app.get("/auth-cache")
+async def get_auth_cache_stats(uid: str = Depends(require_superuser)):
+    """Hit rates of the ID-token and superuser caches."""
+    return {"tokens": token_cache.stats(), "superuser": superuser_cache.stats()}
 
 @app.post("/user")
 async def create_or_update_user(user: dict, uid: str = Depends(get_user_uid)):
@@ -152,8 +275,7 @@ async def create_or_update_user(user: dict, uid: str = Depends(get_user_uid)):
 async def save_recording(recording: dict, uid: str = Depends(get_user_uid)):
     if not db or not uid:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    ref = db.collection("users").document(uid).collection("recordings").document(recording["id"])
-    ref.set(recording)
+    await run_in(firestore_executor, write_user_recording, uid, recording["id"], recording)
     return {"status": "ok"}
 
 @app.get("/recordings")
@@ -169,220 +291,238 @@ async def list_recordings(uid: str = Depends(get_user_uid)):
 async def delete_recording(recording_id: str, uid: str = Depends(get_user_uid)):
     if not db or not uid:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    ref = db.collection("users").document(uid).collection("recordings").document(recording_id)
     # Mark as deleted instead of deleting
-    ref.set({"deleted": True}, merge=True)
+    await run_in(firestore_executor, write_user_recording, uid, recording_id, {"deleted": True}, merge=True)
     return {"status": "marked_deleted"}
 
 @app.get("/dashboard-recordings")
 async def dashboard_recordings(
-    authorization: Optional[str] = Header(None), 
+    uid: str = Depends(require_superuser),
     page: int = 1, 
     limit: int = 50,
     search: Optional[str] = None,
     voice: Optional[str] = None,
     user_email: Optional[str] = None,
-    duration: Optional[str] = None
+    duration: Optional[str] = None,
+    cursor: Optional[str] = None
 ):
-    if not db:
-        raise HTTPException(status_code=500, detail="Firestore not available")
-    # Authenticate and check superuser
-    uid = None
-    if authorization and authorization.startswith("Bearer "):
-        id_token = authorization.split(" ", 1)[1]
+    if duration and duration not in DURATION_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Unknown duration filter: {duration}")
+    page = max(1, page)
+    limit = max(1, min(limit, 200))
+    return await run_in(
+        firestore_executor, query_dashboard_recordings,
+        page, limit, search, voice, user_email, duration, cursor,
+    )
+
+def find_uids_by_email(user_email: str) -> list:
+    # Emails are matched as a substring, so resolve them to uids first (O(users), not O(recordings))
+    return [
+        user.id for user in db.collection("users").stream()
+        if user_email.lower() in (user.to_dict().get("email") or "").lower()
+    ]
+
+def get_user_emails(uids) -> dict:
+    """uid -> email for the given users, in one batched read."""
+    uids = sorted(set(uids))
+    if not uids:
+        return {}
+    return {
+        user.id: user.to_dict().get("email", "")
+        for user in db.get_all([db.collection("users").document(u) for u in uids])
+        if user.exists
+    }
+
+def dashboard_recording_entry(rec_data: dict, rec_uid, user_id_to_email: dict) -> dict:
+    return {
+        "id": rec_data.get("id"),
+        "voice": rec_data.get("voice"),
+        "text": rec_data.get("text"),
+        "created": rec_data.get("created"),
+        "audioUrl": rec_data.get("audioUrl"),
+        "storagePath": rec_data.get("storagePath"),
+        "duration": rec_data.get("duration"),
+        "user_email": user_id_to_email.get(rec_uid, "") if rec_uid else None,
+        "user_uid": rec_uid,
+    }
+
+def search_dashboard_index(page, limit, search, voice, uids, duration):
+    """Dashboard search served from the local full-text index, best matches first."""
+    matches, total_count = search_index.search(
+        search, voice=voice, duration_bucket=duration, uids=uids, limit=limit, offset=(page - 1) * limit
+    )
+    user_id_to_email = get_user_emails(rec_uid for _, rec_uid, _ in matches if rec_uid)
+    total_pages = (total_count + limit - 1) // limit
+    return {
+        "recordings": [dashboard_recording_entry(data, rec_uid, user_id_to_email) for _, rec_uid, data in matches],
+        "pagination": {
+            "page": page,
+            "limit": limit,
+            "total": total_count,
+            "total_pages": total_pages,
+            "has_next": page < total_pages,
+            "has_prev": page > 1,
+            "next_cursor": None
+        }
+    }
+
+def query_dashboard_recordings(page, limit, search, voice, user_email, duration, cursor):
+    """One page of recordings (user and anonymous), newest first, filtered in the query."""
+    empty = {
+        "recordings": [],
+        "pagination": {"page": page, "limit": limit, "total": 0, "total_pages": 0,
+                       "has_next": False, "has_prev": page > 1, "next_cursor": None}
+    }
+
+    # Recordings that can't be filtered by the index are checked here
+    residual_uids = None
+    residual_words = []
+
+    if user_email:
+        uids = find_uids_by_email(user_email)
+        if not uids:
+            return empty
+
+    if search and search_index is not None:
+        if search_index.is_built():
+            return search_dashboard_index(page, limit, search, voice, uids if user_email else None, duration)
+        # Until the local index has been built, search through Firestore
+        search_index.rebuild_in_background(db)
+    if user_email and len(uids) == 1:
+        query = db.collection("users").document(uids[0]).collection("recordings")
+    else:
+        # Matches both users/{uid}/recordings and the top-level anonymous 'recordings'
+        query = db.collection_group("recordings")
+        if user_email:
+            if len(uids) <= 30:
+                # Recordings older than the uid field need backfill-recording-index (see README)
+                query = query.where(filter=FieldFilter("uid", "in", uids))
+            else:
+                residual_uids = set(uids)
+
+    if voice:
+        query = query.where(filter=FieldFilter("voiceLower", "==", voice.lower()))
+    if duration:
+        query = query.where(filter=FieldFilter("durationBucket", "==", duration))
+    if search:
+        search_words = text_search_words(search)
+        if search_words:
+            # Index lookup on the most selective (longest) word, the rest are checked on the page
+            indexed_word = max(search_words, key=len)
+            query = query.where(filter=FieldFilter("textWords", "array_contains", indexed_word))
+            residual_words = [w for w in search_words if w != indexed_word]
+        else:
+            residual_words = [search.lower()]
+
+    query = query.order_by("created", direction=firestore.Query.DESCENDING)
+
+    total_count = None
+    if residual_uids is None and not residual_words:
         try:
-            decoded = firebase_admin.auth.verify_id_token(id_token)
-            uid = decoded["uid"]
-        except Exception:
-            uid = None
-    if not uid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    user_doc = db.collection("users").document(uid).get()
-    if not user_doc.exists or not user_doc.to_dict().get("superuser"):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+            total_count = query.count().get()[0][0].value
+        except Exception as e:
+            logger.warning(f"Could not count dashboard recordings: {e}")
 
-    # Build user email lookup
-    user_id_to_email = {}
-    for user in db.collection("users").stream():
-        user_id_to_email[user.id] = user.to_dict().get("email", "")
-
-    def duration_matches_filter(duration_value, duration_filter):
-        """Check if duration matches the filter criteria"""
-        if not duration_filter or not duration_value:
-            return True
-        
-        duration_secs = float(duration_value)
-        
-        if duration_filter == "<5":
-            return duration_secs < 5
-        elif duration_filter == "5-10":
-            return 5 <= duration_secs < 10
-        elif duration_filter == "10-30":
-            return 10 <= duration_secs < 30
-        elif duration_filter == "30-60":
-            return 30 <= duration_secs < 60
-        elif duration_filter == "60-300":
-            return 60 <= duration_secs < 300
-        elif duration_filter == ">300":
-            return duration_secs >= 300
-        
+    def matches(rec_data, rec_uid):
+        if residual_uids is not None and rec_uid not in residual_uids:
+            return False
+        if residual_words:
+            words = rec_data.get("textWords") or text_search_words(rec_data.get("text", ""))
+            text_content = rec_data.get("text", "").lower()
+            if not all(w in words or w in text_content for w in residual_words):
+                return False
         return True
 
-    results = []
-    
-    # Query user recordings
-    for user_id, email in user_id_to_email.items():
-        if user_email and user_email.lower() not in email.lower():
-            continue
-            
-        # Get all recordings for this user (no Firestore filters for compatibility)
-        query = db.collection("users").document(user_id).collection("recordings")
-        
-        # Get results and filter in Python (for compatibility with existing records)
-        for doc in query.stream():
-            rec_data = doc.to_dict()
-            
-            # Apply voice filter
-            if voice and rec_data.get("voice", "").lower() != voice.lower():
-                continue
-                
-            # Apply text search filter
-            if search:
-                text_content = rec_data.get("text", "").lower()
-                if search.lower() not in text_content:
-                    continue
-            
-            # Apply duration filter
-            if not duration_matches_filter(rec_data.get("duration"), duration):
-                continue
-            
-            entry = {
-                "id": rec_data.get("id"),
-                "voice": rec_data.get("voice"),
-                "text": rec_data.get("text"),
-                "created": rec_data.get("created"),
-                "audioUrl": rec_data.get("audioUrl"),
-                "storagePath": rec_data.get("storagePath"),
-                "duration": rec_data.get("duration"),
-                "user_email": email,
-                "user_uid": user_id,
-            }
-            results.append(entry)
-    
-    # Query anonymous recordings
-    if not user_email:  # Only include anonymous if not filtering by user
-        query = db.collection("recordings")
-        
-        # Get results and filter in Python (for compatibility with existing records)
-        for doc in query.stream():
+    if cursor:
+        try:
+            cursor_doc = db.document(base64.urlsafe_b64decode(cursor.encode()).decode()).get()
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not cursor_doc.exists:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        page_query = query.start_after(cursor_doc)
+    else:
+        page_query = query
+
+    # Page numbers without a cursor still work, at the cost of skipping entries. An offset would
+    # also count documents the residual filters drop, so then earlier pages are skipped by
+    # counting matches instead.
+    skip = 0
+    if page > 1 and not cursor:
+        if residual_uids is None and not residual_words:
+            page_query = query.offset((page - 1) * limit)
+        else:
+            skip = (page - 1) * limit
+
+    # Fetch one extra match to know whether there is a next page
+    matched = []
+    scanned = 0
+    batch_size = skip + limit + 1
+    last_doc = None
+    while len(matched) <= limit and scanned < DASHBOARD_MAX_SCAN:
+        batch_query = page_query.limit(batch_size)
+        if last_doc is not None:
+            batch_query = query.start_after(last_doc).limit(batch_size)
+        docs = list(batch_query.stream())
+        for doc in docs:
+            scanned += 1
+            last_doc = doc
+            parent = doc.reference.parent.parent
+            rec_uid = parent.id if parent is not None else None
             rec_data = doc.to_dict()
-            
-            # Apply voice filter
-            if voice and rec_data.get("voice", "").lower() != voice.lower():
-                continue
-                
-            # Apply text search filter
-            if search:
-                text_content = rec_data.get("text", "").lower()
-                if search.lower() not in text_content:
+            if matches(rec_data, rec_uid):
+                if skip:
+                    skip -= 1
                     continue
-            
-            # Apply duration filter
-            if not duration_matches_filter(rec_data.get("duration"), duration):
-                continue
-            
-            entry = {
-                "id": rec_data.get("id"),
-                "voice": rec_data.get("voice"),
-                "text": rec_data.get("text"),
-                "created": rec_data.get("created"),
-                "audioUrl": rec_data.get("audioUrl"),
-                "storagePath": rec_data.get("storagePath"),
-                "duration": rec_data.get("duration"),
-                "user_email": None,
-                "user_uid": None,
-            }
-            results.append(entry)
-    
-    # Sort by creation time
-    results.sort(key=lambda r: r.get("created", 0), reverse=True)
-    
-    # Apply pagination
-    total_count = len(results)
-    start_index = (page - 1) * limit
-    end_index = start_index + limit
-    paginated_results = results[start_index:end_index]
-    
+                matched.append((doc, rec_uid, rec_data))
+                if len(matched) > limit:
+                    break
+        if len(docs) < batch_size:
+            break
+    if skip and scanned >= DASHBOARD_MAX_SCAN:
+        raise HTTPException(status_code=400, detail="Page is too deep to reach without a cursor; use next_cursor")
+
+    has_next = len(matched) > limit
+    matched = matched[:limit]
+
+    # Emails for the users on this page only
+    user_id_to_email = get_user_emails(rec_uid for _, rec_uid, _ in matched if rec_uid)
+    results = [dashboard_recording_entry(rec_data, rec_uid, user_id_to_email) for _, rec_uid, rec_data in matched]
+
+    next_cursor = None
+    if has_next and matched:
+        next_cursor = base64.urlsafe_b64encode(matched[-1][0].reference.path.encode()).decode()
+
     return {
-        "recordings": paginated_results,
+        "recordings": results,
         "pagination": {
             "page": page,
             "limit": limit,
             "total": total_count,
-            "total_pages": (total_count + limit - 1) // limit,
-            "has_next": end_index < total_count,
-            "has_prev": page > 1
+            "total_pages": (total_count + limit - 1) // limit if total_count is not None else None,
+            "has_next": has_next,
+            "has_prev": page > 1,
+            "next_cursor": next_cursor
         }
     }
 
 @app.get("/dashboard-voices")
-async def get_dashboard_voices(authorization: Optional[str] = Header(None)):
-    if not db:
-        raise HTTPException(status_code=500, detail="Firestore not available")
-    # Authenticate and check superuser
-    uid = None
-    if authorization and authorization.startswith("Bearer "):
-        id_token = authorization.split(" ", 1)[1]
-        try:
-            decoded = firebase_admin.auth.verify_id_token(id_token)
-            uid = decoded["uid"]
-        except Exception:
-            uid = None
-    if not uid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    user_doc = db.collection("users").document(uid).get()
-    if not user_doc.exists or not user_doc.to_dict().get("superuser"):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-
-    voices = set()
-    
-    # Get voices from user recordings
-    for user in db.collection("users").stream():
-        for rec in db.collection("users").document(user.id).collection("recordings").stream():
-            rec_data = rec.to_dict()
-            voice = rec_data.get("voice")
-            if voice:
-                voices.add(voice)
-    
-    # Get voices from anonymous recordings
-    for rec in db.collection("recordings").stream():
-        rec_data = rec.to_dict()
-        voice = rec_data.get("voice")
-        if voice:
-            voices.add(voice)
-    
-    # Convert to sorted list
-    sorted_voices = sorted(list(voices))
-    return {"voices": sorted_voices}
+async def get_dashboard_voices(uid: str = Depends(require_superuser)):
+    facets = await run_in(firestore_executor, read_dashboard_facets)
+    return {
+        "voices": sorted(voice for voice, count in facets["voices"].items() if count > 0),
+        "voice_counts": facets["voices"],
+        "duration_buckets": facets["duration_buckets"],
+        "total_count": facets["total_count"],
+        "total_duration": facets["total_duration"],
+    }
 
 @app.get("/user-usage")
-async def get_user_usage_endpoint(authorization: Optional[str] = Header(None)):
+async def get_user_usage_endpoint(uid: str = Depends(require_user_uid)):
     """Get user's current usage statistics"""
     if not db:
         raise HTTPException(status_code=500, detail="Database not available")
     
-    uid = None
-    if authorization and authorization.startswith("Bearer "):
-        id_token = authorization.split(" ", 1)[1]
-        try:
-            decoded = firebase_admin.auth.verify_id_token(id_token)
-            uid = decoded["uid"]
-        except Exception:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    
-    if not uid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    
     usage = await get_user_usage(uid)
     can_generate = await check_user_can_generate(uid)
     
@@ -398,17 +538,12 @@ async def get_user_usage_endpoint(authorization: Optional[str] = Header(None)):
 @app.post("/check-generation-limits")
 async def check_generation_limits(
     request: dict,
-    authorization: Optional[str] = Header(None)
+    authorization: Optional[str] = Header(None),
+    uid: Optional[str] = Depends(get_user_uid)
 ):
     """Check if user can generate audio with estimated duration"""
-    uid = None
-    if authorization and authorization.startswith("Bearer "):
-        id_token = authorization.split(" ", 1)[1]
-        try:
-            decoded = firebase_admin.auth.verify_id_token(id_token)
-            uid = decoded["uid"]
-        except Exception:
-            return {"can_generate": False, "reason": "invalid_token"}
+    if not uid and authorization and authorization.startswith("Bearer "):
+        return {"can_generate": False, "reason": "invalid_token"}
     
     if not uid:
         return {"can_generate": False, "reason": "login_required"}
@@ -421,19 +556,9 @@ async def check_generation_limits(
     return result
 
 @app.get("/user-info")
-async def get_user_info(authorization: Optional[str] = Header(None)):
+async def get_user_info(uid: str = Depends(require_user_uid)):
     if not db:
         raise HTTPException(status_code=500, detail="Firestore not available")
-    uid = None
-    if authorization and authorization.startswith("Bearer "):
-        id_token = authorization.split(" ", 1)[1]
-        try:
-            decoded = firebase_admin.auth.verify_id_token(id_token)
-            uid = decoded["uid"]
-        except Exception:
-            uid = None
-    if not uid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
     user_doc = db.collection("users").document(uid).get()
     if not user_doc.exists:
         raise HTTPException(status_code=404, detail="User not found")
@@ -443,35 +568,323 @@ async def get_user_info(authorization: Optional[str] = Header(None)):
 class SynthesisRequest(BaseModel):
     text: str
     voice: str
+    # "wav", "opus" (Ogg) or "mp3"; defaults to PIPER_AUDIO_FORMAT
+    format: Optional[str] = None
+
+class BatchSynthesisItem(BaseModel):
+    text: str
+    voice: str
+
+class BatchSynthesisRequest(BaseModel):
+    items: List[BatchSynthesisItem]
+    # Output format of every item, as for /synthesize
+    format: Optional[str] = None
+
+class StreamingSynthesisRequest(SynthesisRequest):
+    # "wav" (header + PCM, playable as it arrives) or "pcm" (raw 16-bit mono samples)
+    container: str = "wav"
 
 async def get_user_usage(uid: str) -> dict:
     """Get user's audio generation usage"""
     if not db or not uid:
         return {"total_duration": 0, "recordings_count": 0}
-    
+    return await run_in(firestore_executor, _read_user_usage, uid)
+
+def _read_user_usage(uid: str) -> dict:
     try:
-        recordings_ref = db.collection("users").document(uid).collection("recordings")
-        recordings = recordings_ref.stream()
-        
-        total_duration = 0
-        recordings_count = 0
-        
-        for recording in recordings:
-            data = recording.to_dict()
-            if not data.get("deleted", False):  # Don't count deleted recordings
-                recordings_count += 1
-                duration = data.get("duration", 0)
-                if duration:
-                    total_duration += duration
-        
-        return {
-            "total_duration": total_duration,
-            "recordings_count": recordings_count
-        }
+        # Maintained counters (one read); users not backfilled yet fall back to a scan
+        usage_doc = db.collection(USAGE_COLLECTION).document(uid).get()
+        if usage_doc.exists:
+            data = usage_doc.to_dict()
+            return {
+                "total_duration": data.get("total_duration", 0),
+                "recordings_count": data.get("recordings_count", 0)
+            }
+        return scan_user_usage(uid)
     except Exception as e:
         logger.error(f"Error getting user usage: {e}")
         return {"total_duration": 0, "recordings_count": 0}
 
+def scan_user_usage(uid: str, transaction=None) -> dict:
+    """Compute usage by reading every recording of the user."""
+    recordings_ref = db.collection("users").document(uid).collection("recordings")
+    recordings = recordings_ref.stream(transaction=transaction) if transaction else recordings_ref.stream()
+
+    total_duration = 0
+    recordings_count = 0
+
+    for recording in recordings:
+        count, duration = _usage_contribution(recording.to_dict())
+        recordings_count += count
+        total_duration += duration
+
+    return {
+        "total_duration": total_duration,
+        "recordings_count": recordings_count
+    }
+
+def _usage_contribution(recording) -> tuple:
+    """(count, duration) a recording adds to its user's usage."""
+    if not recording or recording.get("deleted", False):  # Don't count deleted recordings
+        return 0, 0
+    return 1, recording.get("duration") or 0
+
+def write_user_recording(uid: str, recording_id: str, data: dict, merge: bool = False) -> dict:
+    """Write a user's recording doc and update their usage counters in one transaction; returns the new usage."""
+    return write_user_recordings(uid, {recording_id: data}, merge=merge)
+
+def write_user_recordings(uid: str, recordings: dict, merge: bool = False) -> dict:
+    """Write several of a user's recording docs ({id: data}) and their usage counters in one transaction.
+
+    Returns the usage as stored by the transaction, so overwritten recordings are only counted once.
+    """
+    recordings_ref = db.collection("users").document(uid).collection("recordings")
+    refs = {recording_id: recordings_ref.document(recording_id) for recording_id in recordings}
+    usage_ref = db.collection(USAGE_COLLECTION).document(uid)
+
+    @firestore.transactional
+    def write(transaction):
+        snapshots = {snapshot.id: snapshot for snapshot in db.get_all(list(refs.values()), transaction=transaction)}
+        usage_snapshot = usage_ref.get(transaction=transaction)
+        if usage_snapshot.exists:
+            usage = usage_snapshot.to_dict()
+        else:
+            # First write since counters were introduced: start from the current recordings
+            usage = scan_user_usage(uid, transaction=transaction)
+
+        count_change = 0
+        duration_change = 0
+        changes = []
+        written = {}
+        for recording_id, data in recordings.items():
+            snapshot = snapshots.get(recording_id)
+            old = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+            new = {**(old or {}), **data} if merge else data
+            old_count, old_duration = _usage_contribution(old)
+            new_count, new_duration = _usage_contribution(new)
+            count_change += new_count - old_count
+            duration_change += new_duration - old_duration
+            changes.append((old, new))
+            written[recording_id] = new
+            transaction.set(refs[recording_id], data, merge=merge)
+
+        new_usage = {
+            "total_duration": (usage.get("total_duration") or 0) + duration_change,
+            "recordings_count": (usage.get("recordings_count") or 0) + count_change,
+        }
+        transaction.set(usage_ref, {**new_usage, "updated": int(time.time())})
+        delta = facet_delta(changes)
+        if delta:
+            transaction.set(facet_shard_ref(), delta, merge=True)
+        return written, new_usage
+
+    written, new_usage = write(db.transaction())
+    for recording_id, new in written.items():
+        index_recording_for_search(refs[recording_id].path, uid, new)
+    return new_usage
+
+def write_anonymous_recording(recording_id: str, data: dict):
+    """Write an anonymous recording doc and update the dashboard facets in one transaction."""
+    write_anonymous_recordings({recording_id: data})
+
+def write_anonymous_recordings(recordings: dict):
+    """Write several anonymous recording docs ({id: data}) and the dashboard facets in one transaction."""
+    refs = {recording_id: db.collection("recordings").document(recording_id) for recording_id in recordings}
+
+    @firestore.transactional
+    def write(transaction):
+        snapshots = {snapshot.id: snapshot for snapshot in db.get_all(list(refs.values()), transaction=transaction)}
+        changes = []
+        for recording_id, data in recordings.items():
+            snapshot = snapshots.get(recording_id)
+            old = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+            changes.append((old, data))
+            transaction.set(refs[recording_id], data)
+        delta = facet_delta(changes)
+        if delta:
+            transaction.set(facet_shard_ref(), delta, merge=True)
+
+    write(db.transaction())
+    for recording_id, data in recordings.items():
+        index_recording_for_search(refs[recording_id].path, None, data)
+
+def index_recording_for_search(path: str, uid, recording: dict):
+    """Feed the local dashboard search index; it can always be rebuilt, so failures only log."""
+    if search_index is None:
+        return
+    try:
+        search_index.index_recording(path, uid, recording)
+    except Exception as e:
+        logger.warning(f"Could not index recording {path} for search: {e}")
+
+def _facet_contribution(recording):
+    """(voice, duration bucket, duration) a recording adds to the dashboard facets."""
+    if not recording or recording.get("deleted", False):
+        return None
+    duration = recording.get("duration") or 0
+    return recording.get("voice"), duration_bucket(recording.get("duration")), duration
+
+def facet_delta(changes) -> Optional[dict]:
+    """Increments that move the facets from the old versions of recordings to the new ones.
+
+    changes is a list of (old, new) recording dicts; either may be None.
+    """
+    voices = {}
+    buckets = {}
+    totals = {"total_count": 0, "total_duration": 0}
+    for old, new in changes:
+        for contribution, sign in ((_facet_contribution(old), -1), (_facet_contribution(new), 1)):
+            if contribution is None:
+                continue
+            voice, bucket_name, duration = contribution
+            totals["total_count"] += sign
+            totals["total_duration"] += sign * duration
+            if voice:
+                voices[voice] = voices.get(voice, 0) + sign
+            if bucket_name:
+                buckets[bucket_name] = buckets.get(bucket_name, 0) + sign
+
+    delta = {name: firestore.Increment(value) for name, value in totals.items() if value}
+    voices = {name: firestore.Increment(value) for name, value in voices.items() if value}
+    buckets = {name: firestore.Increment(value) for name, value in buckets.items() if value}
+    if voices:
+        delta["voices"] = voices
+    if buckets:
+        delta["duration_buckets"] = buckets
+    return delta or None
+
+def facet_shard_ref():
+    return db.collection(FACETS_COLLECTION).document(f"shard-{random.randrange(max(1, FACET_SHARDS))}")
+
+def _facet_shard_refs() -> list:
+    return [db.collection(FACETS_COLLECTION).document(f"shard-{i}") for i in range(max(1, FACET_SHARDS))]
+
+def _facets_meta_ref():
+    return db.collection(FACETS_COLLECTION).document(FACETS_META_DOC)
+
+def _empty_facets() -> dict:
+    return {"voices": {}, "duration_buckets": {}, "total_count": 0, "total_duration": 0}
+
+def _sum_facet_shards(shards) -> dict:
+    facets = _empty_facets()
+    for shard in shards:
+        facets["total_count"] += shard.get("total_count") or 0
+        facets["total_duration"] += shard.get("total_duration") or 0
+        for key in ("voices", "duration_buckets"):
+            for name, count in (shard.get(key) or {}).items():
+                facets[key][name] = facets[key].get(name, 0) + count
+    return facets
+
+def _scan_recording_facets(read_time=None) -> dict:
+    facets = _empty_facets()
+    for rec in db.collection_group("recordings").stream(read_time=read_time):
+        contribution = _facet_contribution(rec.to_dict())
+        if contribution is None:
+            continue
+        voice, bucket_name, duration = contribution
+        facets["total_count"] += 1
+        facets["total_duration"] += duration
+        if voice:
+            facets["voices"][voice] = facets["voices"].get(voice, 0) + 1
+        if bucket_name:
+            facets["duration_buckets"][bucket_name] = facets["duration_buckets"].get(bucket_name, 0) + 1
+    return facets
+
+_facet_seed_lock = threading.Lock()
+
+def read_dashboard_facets(seed: bool = True):
+    """Sum the facet shards; seeds them from the recordings the first time.
+
+    Shards exist as soon as anything is written, so only the meta doc says
+    whether they also count the recordings made before the facets existed.
+    With seed=False unseeded facets give None instead.
+    """
+    snapshots = db.get_all([_facets_meta_ref(), *_facet_shard_refs()])
+    meta = next((snapshot for snapshot in snapshots if snapshot.id == FACETS_META_DOC), None)
+    if meta is None or not meta.exists or not meta.get("seeded"):
+        return seed_dashboard_facets() if seed else None
+    return _sum_facet_shards(snapshot.to_dict() for snapshot in snapshots if snapshot.id != FACETS_META_DOC and snapshot.exists)
+
+def seed_dashboard_facets() -> dict:
+    """First use: one worker rebuilds the facets while the others wait for it."""
+    with _facet_seed_lock:
+        deadline = time.time() + FACET_SEED_WAIT
+        while True:
+            meta = _facets_meta_ref().get()
+            if meta.exists and meta.get("seeded"):
+                return _sum_facet_shards(shard.to_dict() for shard in db.get_all(_facet_shard_refs()) if shard.exists)
+            if _claim_facet_rebuild():
+                return rebuild_dashboard_facets()
+            if time.time() > deadline:
+                logger.warning("Dashboard facets are still being seeded elsewhere, counting recordings directly")
+                return _scan_recording_facets()
+            time.sleep(1)
+
+def _claim_facet_rebuild() -> bool:
+    """Take the rebuild lease unless another worker holds it."""
+    meta_ref = _facets_meta_ref()
+
+    @firestore.transactional
+    def claim(transaction):
+        meta = meta_ref.get(transaction=transaction)
+        if meta.exists and (meta.get("rebuilding_until") or 0) > time.time():
+            return False
+        transaction.set(meta_ref, {"rebuilding_until": time.time() + FACET_REBUILD_LEASE}, merge=True)
+        return True
+
+    return claim(db.transaction())
+
+def rebuild_dashboard_facets() -> dict:
+    """Recompute the facets from every recording (first use / drift correction).
+
+    Recordings and shards are read as of one point in time and only the
+    difference is added to the shards, so increments from recordings written
+    meanwhile are kept. Firestore serves such reads for about an hour, which
+    bounds how long the scan may take.
+    """
+    meta_ref = _facets_meta_ref()
+    meta = meta_ref.get()
+    previous_rebuild = meta.get("rebuilt") if meta.exists else None
+    read_time = datetime.now(timezone.utc) - timedelta(seconds=1)
+    facets = _scan_recording_facets(read_time=read_time)
+    counted = _sum_facet_shards(
+        shard.to_dict() for shard in db.get_all(_facet_shard_refs(), read_time=read_time) if shard.exists
+    )
+
+    correction = {}
+    for key in ("total_count", "total_duration"):
+        if facets[key] != counted[key]:
+            correction[key] = firestore.Increment(facets[key] - counted[key])
+    for key in ("voices", "duration_buckets"):
+        changes = {
+            name: firestore.Increment(facets[key].get(name, 0) - counted[key].get(name, 0))
+            for name in set(facets[key]) | set(counted[key])
+            if facets[key].get(name, 0) != counted[key].get(name, 0)
+        }
+        if changes:
+            correction[key] = changes
+
+    @firestore.transactional
+    def apply(transaction):
+        current = meta_ref.get(transaction=transaction)
+        if (current.get("rebuilt") if current.exists else None) != previous_rebuild:
+            # Another rebuild finished meanwhile; adding this correction too would count it twice
+            return False
+        if correction:
+            transaction.set(db.collection(FACETS_COLLECTION).document("shard-0"), correction, merge=True)
+        transaction.set(meta_ref, {"seeded": True, "rebuilt": time.time(), "rebuilding_until": 0}, merge=True)
+        return True
+
+    if not apply(db.transaction()):
+        logger.info("Dashboard facets were rebuilt concurrently, keeping that result")
+    return facets
+
+def reconcile_user_usage(uid: str) -> dict:
+    """Recompute a user's usage counters from their recordings (backfill / drift correction)."""
+    usage = scan_user_usage(uid)
+    db.collection(USAGE_COLLECTION).document(uid).set({**usage, "updated": int(time.time())})
+    return usage
+
 async def check_user_can_generate(uid: str, estimated_duration: float = 60) -> dict:
     """Check if user can generate audio based on usage limits"""
     if not uid:
@@ -507,51 +920,32 @@ async def check_user_can_generate(uid: str, estimated_duration: float = 60) -> d
     return {"can_generate": True, "reason": "free_usage"}
 
 async def check_revenuecat_subscription(uid: str) -> bool:
-    """Check if user has active subscription via RevenueCat"""
-    if not REVENUECAT_API_KEY:
-        logger.warning("RevenueCat API key not configured")
-        return False
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {REVENUECAT_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            response = await client.get(
-                f"{REVENUECAT_BASE_URL}/subscribers/{uid}",
-                headers=headers
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                subscriber = data.get("subscriber", {})
-                entitlements = subscriber.get("entitlements", {})
-                
-                # Check if user has any active entitlements
-                for entitlement_id, entitlement in entitlements.items():
-                    # Check for lifetime subscription (no expiration date)
-                    if entitlement.get("expires_date") is None:
-                        logger.info(f"Found lifetime subscription for entitlement {entitlement_id}")
-                        return True
-                    
-                    # Check if subscription is still active
-                    expires_date = entitlement.get("expires_date")
-                    current_time_ms = time.time() * 1000
-                    
-                    if expires_date and expires_date > current_time_ms:
-                        logger.info(f"Found active subscription for entitlement {entitlement_id}")
-                        return True
-                
-                return False
-            else:
-                logger.warning(f"RevenueCat API error: {response.status_code}")
-                return False
-                
-    except Exception as e:
-        logger.error(f"Error checking RevenueCat subscription: {e}")
-        return False
+    """Check if user has active subscription via RevenueCat (cached, see revenuecat.py)"""
+    return await revenuecat.has_active_entitlement(uid)
+
+@app.post("/revenuecat/webhook")
+async def revenuecat_webhook(request: Request, authorization: Optional[str] = Header(None)):
+    """Drop cached entitlements of the user a RevenueCat event is about."""
+    if not REVENUECAT_WEBHOOK_AUTH:
+        raise HTTPException(status_code=503, detail="RevenueCat webhook not configured")
+    if authorization != REVENUECAT_WEBHOOK_AUTH:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    event = (await request.json()).get("event") or {}
+    uids = {event.get("app_user_id"), event.get("original_app_user_id"), *(event.get("aliases") or [])}
+    uids.update(event.get("transferred_from") or [])
+    uids.update(event.get("transferred_to") or [])
+    revenuecat.invalidate(*uids)
+    logger.info(f"RevenueCat {event.get('type')} event, invalidated entitlements for {sorted(u for u in uids if u)}")
+    return {"status": "ok"}
+
+@app.get("/revenuecat/cache")
+async def get_entitlement_cache_stats(uid: str = Depends(require_superuser)):
+    return revenuecat.cache.stats()
+
+@app.get("/fragment-cache")
+async def get_fragment_cache_stats(uid: str = Depends(require_superuser)):
+    """Hit rate and PCM bytes saved by the sentence fragment cache in this worker."""
+    return fragment_cache.stats()
 
 
 def find_piper_executable():
@@ -594,6 +988,480 @@ def find_piper_executable():
     )
 
 
+async def synthesize_with_piper_cli(model_path, text: str) -> Optional[bytes]:
+    """Run the piper CLI, trying each known command-line format in turn; returns the WAV bytes."""
+    piper_path = find_piper_executable()
+    logger.info(f"Using piper executable: {piper_path}")
+    # The CLI can only write a WAV file; it is read back and removed right away
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = Path(temp_dir) / "speech.wav"
+        if await _run_piper_cli(piper_path, model_path, output_file, text):
+            return output_file.read_bytes()
+    return None
+
+
+async def _run_piper_cli(piper_path, model_path, output_file, text: str) -> bool:
+    attempts = [
+        # First try: new piper1-gpl CLI format with -m and -f (Python module format as documented)
+        ("new", ["python3", "-m", "piper", "-m", str(model_path), "-f", str(output_file), "--", text], None),
+        # Second try: Direct binary approach (in case pip installed a binary)
+        ("direct binary", [piper_path, "-m", str(model_path), "-f", str(output_file), "--", text], None),
+        # Third try: legacy format with --model and stdin (fallback only)
+        ("legacy", [
+            piper_path,
+            "--model", str(model_path),
+            "--output_file", str(output_file),
+            "--espeak-data", "/usr/share/espeak-ng-data",
+        ], text),
+    ]
+
+    stderr = None
+    for name, cmd, stdin_text in attempts:
+        try:
+            logger.info(f"Trying {name} format: {' '.join(cmd)}")
+            # asyncio subprocess so the event loop keeps serving while piper runs
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE if stdin_text is not None else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr_bytes = await process.communicate(
+                input=stdin_text.encode() if stdin_text is not None else None
+            )
+            stderr = stderr_bytes.decode(errors="replace")
+            if process.returncode == 0 and output_file.exists():
+                logger.info(f"{name.capitalize()} format succeeded")
+                PIPER_CLI_ATTEMPTS.labels(format=name, result="succeeded").inc()
+                return True
+            logger.warning(f"{name.capitalize()} format failed - return code: {process.returncode}, file exists: {output_file.exists()}, stderr: {stderr}")
+        except Exception as e:
+            logger.warning(f"Exception with {name} format: {e}")
+        PIPER_CLI_ATTEMPTS.labels(format=name, result="failed").inc()
+
+    logger.error(f"All piper formats failed. Last error: {stderr}")
+    return False
+
+
+async def enforce_usage_limit(uid: Optional[str]) -> dict:
+    """Raise a 402 if the user is already over the free limit without a subscription; returns their usage."""
+    with observe_stage("usage_check"):
+        current_usage = await get_user_usage(uid or "anonymous")
+        if uid and current_usage["total_duration"] > FREE_DURATION_SECONDS:
+            # User has already exceeded free limit and needs subscription
+            has_subscription = await check_revenuecat_subscription(uid)
+            if not has_subscription:
+                error_detail = {
+                    "error": "usage_limit_exceeded", 
+                    "message": "You've reached your free usage limit. Please upgrade to continue.",
+                    "reason": "limit_exceeded",
+                    "usage": {
+                        "used_duration": current_usage["total_duration"],
+                        "free_duration": FREE_DURATION_SECONDS,
+                        "recordings_count": current_usage["recordings_count"]
+                    }
+                }
+                logger.info(f"User already over limit, raising 402 HTTPException")
+                raise HTTPException(status_code=402, detail=error_detail)
+    return current_usage
+
+
+async def get_post_generation_paywall(uid: str, updated_usage: Optional[dict] = None) -> dict:
+    """Paywall fields to add to the response if this generation put the user over the limit.
+
+    updated_usage is the usage including this generation, as returned by the recording
+    transaction; it is read from Firestore when not given.
+    """
+    if updated_usage is None:
+        updated_usage = await get_user_usage(uid)
+    if updated_usage["total_duration"] > FREE_DURATION_SECONDS:
+        # User has now exceeded the limit, check if they have subscription
+        has_subscription = await check_revenuecat_subscription(uid)
+        if not has_subscription:
+            logger.info(f"User {uid} exceeded limit after this generation, will show paywall")
+            return {
+                "show_paywall": True,
+                "usage": {
+                    "used_duration": updated_usage["total_duration"],
+                    "free_duration": FREE_DURATION_SECONDS,
+                    "recordings_count": updated_usage["recordings_count"]
+                },
+                "message": "You've now used all your free audio generation. Upgrade to continue creating more audio.",
+            }
+    return {}
+
+
+async def acquire_synthesis_slot(uid: Optional[str]):
+    """Wait for a synthesis slot, subscribers ahead of free users; 429 when the queue is full."""
+    priority = PRIORITY_FREE
+    # Only pay for the RevenueCat lookup when the request actually has to queue
+    if uid and not synthesis_scheduler.has_free_slot():
+        if await check_revenuecat_subscription(uid):
+            priority = PRIORITY_SUBSCRIBER
+    try:
+        slot = await synthesis_scheduler.acquire(priority)
+    except QueueFullError as e:
+        logger.warning(f"Synthesis queue full ({synthesis_scheduler.queue_depth} waiting), rejecting request")
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "server_busy", "message": "Too many requests in progress. Please try again shortly."},
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    STAGE_SECONDS.labels(stage="queue_wait").observe(slot.wait_seconds)
+    if slot.wait_seconds > 0.1:
+        logger.info(f"Waited {slot.wait_seconds:.2f}s for a synthesis slot (priority {priority})")
+    return slot
+
+
+def get_voice_blobs(voice: str):
+    """Look up the .onnx model and .onnx.json metadata blobs for a voice."""
+    logger.info(f"Synthesize: Preparing voice: {voice}")
+    if not bucket:
+        raise HTTPException(status_code=500, detail="Firebase Storage not available")
+    onnx_blob_name = f"{FIREBASE_MODELS_PATH}{voice}.onnx"
+    json_blob_name = f"{FIREBASE_MODELS_PATH}{voice}.onnx.json"
+    # get_blob also loads the generation/md5 used by the model and result caches
+    with observe_stage("voice_lookup"):
+        onnx_blob = bucket.get_blob(onnx_blob_name)
+    if onnx_blob is None:
+        logger.error(f"Model file not found in Firebase Storage: {onnx_blob_name}")
+        raise HTTPException(status_code=404, detail=f"Voice {voice} not found")
+    return onnx_blob, bucket.blob(json_blob_name)
+
+
+def fetch_voice_model(voice: str, onnx_blob, json_blob):
+    """Local path of the model, served from the shared on-disk cache unless this generation is new."""
+    cached = model_cache.is_cached(voice, onnx_blob.generation)
+    count_cache("model", cached)
+    if cached:
+        return model_cache.fetch(voice, onnx_blob, json_blob)
+    with observe_stage("model_download"):
+        return model_cache.fetch(voice, onnx_blob, json_blob)
+
+
+def get_recording_ref(uid: Optional[str], recording_id: str):
+    if not db:
+        return None
+    if uid:
+        return db.collection("users").document(uid).collection("recordings").document(recording_id)
+    # Anonymous recordings live in the top-level 'recordings' collection
+    return db.collection("recordings").document(recording_id)
+
+
+def text_search_words(text: str) -> list:
+    """Lowercased words longer than two characters, as stored in textWords."""
+    return [word.lower().strip('.,!?;:"()[]{}') for word in text.lower().split() if len(word.strip('.,!?;:"()[]{}')) > 2]
+
+
+def duration_bucket(duration) -> Optional[str]:
+    """Dashboard duration filter bucket for a duration in seconds."""
+    if duration is None:
+        return None
+    duration_secs = float(duration)
+    for bucket_name, (low, high) in DURATION_BUCKETS.items():
+        if duration_secs >= low and (high is None or duration_secs < high):
+            return bucket_name
+    return None
+
+
+def build_recording_doc(uid, voice, text, recording_id, firebase_url, storage_path, duration, model_generation, audio_format="wav") -> dict:
+    # Create searchable fields
+    text_words = text_search_words(text)
+    recording_doc = {
+        "id": recording_id,
+        "voice": voice,
+        "text": text,
+        "created": int(time.time()),
+        "audioUrl": firebase_url,
+        "storagePath": storage_path,
+        "duration": duration,
+        "textWords": text_words,
+        "voiceLower": voice.lower(),
+        "durationBucket": duration_bucket(duration),
+        "modelGeneration": str(model_generation),
+        "format": audio_format,
+        "mediaType": media_type(audio_format)
+    }
+    if uid:
+        recording_doc["uid"] = uid
+    else:
+        recording_doc["anonymous"] = True
+    return recording_doc
+
+
+def save_batch_recordings(uid, recordings: dict) -> Optional[dict]:
+    """Write the recording docs ({id: doc}) of a batch, with the usage and facet updates, in one transaction.
+
+    Returns the user's new usage (None for anonymous users or when nothing was written).
+    """
+    if not db or not recordings:
+        return None
+    with observe_stage("firestore_write"):
+        if uid:
+            return write_user_recordings(uid, recordings)
+        write_anonymous_recordings(recordings)
+    return None
+
+
+def save_synthesis_recording(recording_ref, uid, voice, text, recording_id, firebase_url, storage_path, duration, model_generation, audio_format="wav") -> Optional[dict]:
+    """Write the recording doc with its usage and facet updates; returns the user's new usage (None if anonymous)."""
+    if recording_ref is None:
+        return None
+    recording_doc = build_recording_doc(
+        uid, voice, text, recording_id, firebase_url, storage_path, duration, model_generation, audio_format
+    )
+    with observe_stage("firestore_write"):
+        if uid:
+            return write_user_recording(uid, recording_id, recording_doc)
+        write_anonymous_recording(recording_id, recording_doc)
+    return None
+
+
+def _pooled_voice(voice_key, fetch_model):
+    loaded = voice_pool.is_loaded(voice_key)
+    count_cache("voice", loaded)
+    if loaded:
+        return voice_pool.get(voice_key, fetch_model)
+    with observe_stage("model_load"):
+        return voice_pool.get(voice_key, fetch_model)
+
+
+def synthesize_with_voice_pool(voice_key, fetch_model, text: str):
+    """(pcm, sample_rate) from the resident voice."""
+    voice = _pooled_voice(voice_key, fetch_model)
+    with observe_stage("synthesis"):
+        return synthesize_pcm(voice, text), voice.config.sample_rate
+
+
+def synthesize_units_with_voice_pool(voice_key, fetch_model, units: list):
+    """([pcm per unit], sample_rate) from the resident voice."""
+    voice = _pooled_voice(voice_key, fetch_model)
+    with observe_stage("synthesis"):
+        return [synthesize_unit_pcm(voice, unit) for unit in units], voice.config.sample_rate
+
+
+async def warm_voice(voice: str):
+    """Download, load and run a short synthesis so the first real request is fast."""
+    onnx_blob, json_blob = await run_in(storage_executor, get_voice_blobs, voice)
+
+    def fetch_model():
+        return fetch_voice_model(voice, onnx_blob, json_blob)
+
+    await run_in(storage_executor, fetch_model)
+    if voice_pool.available:
+        # The first run allocates onnxruntime's buffers
+        await run_in(synthesis_executor, synthesize_with_voice_pool, (voice, onnx_blob.generation), fetch_model, WARMUP_TEXT)
+
+
+async def run_warmup():
+    voice_counts = None
+    if WARMUP_TOP_N > 0 and db:
+        try:
+            # Never seed here: every worker warms up at once, and all but one would wait and then scan
+            facets = await run_in(firestore_executor, read_dashboard_facets, False)
+            if facets is None:
+                logger.info("Dashboard facets are not seeded yet, warming only PIPER_WARMUP_VOICES")
+            else:
+                voice_counts = facets["voices"]
+        except Exception as e:
+            logger.warning(f"Could not read voice usage for warmup: {e}")
+    voices = select_warmup_voices(voice_counts)
+    warmup_state.start(voices)
+    if voices and bucket:
+        logger.info(f"Warming up voices: {', '.join(voices)}")
+
+    async def warm_all():
+        for voice in voices:
+            started = time.monotonic()
+            try:
+                await warm_voice(voice)
+                warmup_state.voice_done(voice, time.monotonic() - started)
+                logger.info(f"Warmed up {voice} in {time.monotonic() - started:.2f}s")
+            except Exception as e:
+                warmup_state.voice_done(voice, time.monotonic() - started, error=e)
+                logger.warning(f"Warmup of {voice} failed: {e}")
+
+    timed_out = False
+    if voices and bucket:
+        try:
+            await asyncio.wait_for(warm_all(), WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.warning(f"Warmup did not finish within {WARMUP_TIMEOUT:.0f}s, reporting ready anyway")
+    warmup_state.finish(timed_out)
+
+
+def upload_audio_bytes(storage_path: str, audio: bytes, model_generation, duration, content_type="audio/wav") -> str:
+    """Upload rendered audio from memory as a public object and return its URL."""
+    blob = bucket.blob(storage_path)
+    blob.metadata = {
+        "modelGeneration": str(model_generation),
+        "duration": str(duration) if duration is not None else "",
+    }
+    # The ACL goes with the upload instead of a separate make_public round trip
+    with observe_stage("upload"):
+        blob.upload_from_string(audio, content_type=content_type, predefined_acl="publicRead")
+    return blob.public_url
+
+
+def resolve_output_format(requested) -> str:
+    """Output format for a request; falls back to WAV when ffmpeg isn't installed."""
+    try:
+        audio_format = resolve_format(requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if audio_format != "wav" and not encoder_available():
+        logger.warning(f"Cannot encode {audio_format} without ffmpeg, returning WAV")
+        return "wav"
+    return audio_format
+
+
+def synthesis_recording_id(voice: str, text_hash: str, audio_format: str) -> str:
+    # WAV keeps the original id so existing recordings and cached files are still found
+    if audio_format == "wav":
+        return f"{voice}_{text_hash}"
+    return f"{voice}_{text_hash}_{audio_format}"
+
+
+def find_cached_audio(storage_path: str, model_generation, recording_ref=None):
+    """Return (audioUrl, duration) if this audio was already rendered with this model generation."""
+    generation = str(model_generation)
+    with observe_stage("result_cache_lookup"):
+        cached = _find_cached_audio(storage_path, generation, recording_ref)
+    count_cache("result", cached is not None)
+    return cached
+
+
+def _find_cached_audio(storage_path: str, generation: str, recording_ref):
+    try:
+        blob = bucket.get_blob(storage_path) if bucket else None
+        if blob is not None:
+            metadata = blob.metadata or {}
+            if metadata.get("modelGeneration") == generation and metadata.get("duration"):
+                return blob.public_url, float(metadata["duration"])
+        # Fall back to the recording doc written by an earlier request
+        if blob is not None and recording_ref is not None:
+            doc = recording_ref.get()
+            if doc.exists:
+                data = doc.to_dict()
+                if (
+                    data.get("modelGeneration") == generation
+                    and data.get("storagePath") == storage_path
+                    and data.get("audioUrl")
+                    and data.get("duration") is not None
+                ):
+                    return data["audioUrl"], data["duration"]
+    except Exception as e:
+        logger.warning(f"Result cache lookup failed for {storage_path}: {e}")
+    return None
+
+
+async def lookup_fragments(voice_name: str, generation, units: list) -> list:
+    """Cached (pcm, sample_rate) of each unit, None where it has to be synthesized."""
+    keys = [fragment_cache.key(voice_name, generation, unit) for unit in units]
+    with observe_stage("fragment_lookup"):
+        fragments = await run_in(storage_executor, lambda: [fragment_cache.read(key) for key in keys])
+        if fragment_cache.spill and bucket:
+            misses = [i for i, fragment in enumerate(fragments) if fragment is None]
+            spilled = await asyncio.gather(
+                *(run_in(storage_executor, fragment_cache.read_spilled, keys[i], bucket) for i in misses)
+            )
+            for i, fragment in zip(misses, spilled):
+                fragments[i] = fragment
+    fragment_cache.record(fragments)
+    return fragments
+
+
+def store_fragments(voice_name: str, generation, units: list, parts: list, sample_rate: int):
+    try:
+        for unit, pcm in zip(units, parts):
+            fragment_cache.write(fragment_cache.key(voice_name, generation, unit), pcm, sample_rate, bucket)
+    except Exception as e:
+        logger.warning(f"Could not cache fragments of {voice_name}: {e}")
+
+
+async def synthesize_units(voice_name: str, onnx_blob, json_blob, units: list):
+    """([pcm per unit], sample_rate) from the process pool or the resident voice; (None, None) if both fail."""
+    # The blob generation changes whenever the model is re-uploaded
+    voice_key = (voice_name, onnx_blob.generation)
+
+    def fetch_model():
+        return fetch_voice_model(voice_name, onnx_blob, json_blob)
+
+    split = synthesis_pool.should_split(" ".join(units))
+    # Make sure the model is on local disk before taking a synthesis thread
+    if not voice_pool.is_loaded(voice_key) or split:
+        model_path = await run_in(storage_executor, fetch_model)
+
+    # Long texts: synthesize sentences in parallel on the process pool
+    if split:
+        try:
+            with observe_stage("synthesis"):
+                result = await run_in(synthesis_executor, synthesis_pool.synthesize_units, voice_key, model_path, units)
+            logger.info(f"Parallel synthesis succeeded for {voice_key}")
+            return result
+        except Exception as e:
+            logger.warning(f"Parallel synthesis failed for {voice_key}, using a single voice: {e}")
+
+    # Preferred: resident in-process voice (model stays loaded between requests)
+    if voice_pool.available:
+        try:
+            result = await run_in(synthesis_executor, synthesize_units_with_voice_pool, voice_key, fetch_model, units)
+            logger.info(f"Resident engine synthesis succeeded for {voice_key}")
+            return result
+        except Exception as e:
+            logger.warning(f"Resident engine failed for {voice_key}, falling back to piper CLI: {e}")
+    return None, None
+
+
+async def synthesize_texts_with_piper_cli(voice_name: str, onnx_blob, json_blob, texts: list) -> list:
+    """[(pcm, sample_rate) per text] from the piper CLI, the fallback when no resident voice works."""
+    model_path = await run_in(storage_executor, fetch_voice_model, voice_name, onnx_blob, json_blob)
+    results = []
+    for text in texts:
+        with observe_stage("synthesis"):
+            wav_audio = await synthesize_with_piper_cli(model_path, text)
+        if wav_audio is None:
+            raise HTTPException(status_code=500, detail=f"Piper synthesis failed with all formats tried")
+        results.append(wav_bytes_to_pcm(wav_audio))
+    return results
+
+
+async def render_pcm(voice_name: str, onnx_blob, json_blob, text: str, uid: Optional[str]):
+    """(pcm, sample_rate) for text, assembled from cached sentence fragments plus synthesized misses."""
+    return (await render_pcm_many(voice_name, onnx_blob, json_blob, [text], uid))[0]
+
+
+async def render_pcm_many(voice_name: str, onnx_blob, json_blob, texts: list, uid: Optional[str]) -> list:
+    """[(pcm, sample_rate) per text] in one voice, from cached sentence fragments plus synthesized misses.
+
+    Sentences shared by several texts are synthesized once, and a synthesis
+    slot is only taken when some sentence is not cached.
+    """
+    generation = onnx_blob.generation
+    # Piper voice names start with their locale (en_US-lessac-medium)
+    language = voice_name.split("-", 1)[0]
+    text_units = [synthesis_units(text, language) or [text] for text in texts]
+    units = list(dict.fromkeys(unit for units in text_units for unit in units))
+    fragments = dict(zip(units, await lookup_fragments(voice_name, generation, units)))
+    missing = [unit for unit, fragment in fragments.items() if fragment is None]
+    if missing:
+        # Wait for a synthesis slot (subscribers first); 429 if the queue is full
+        slot = await acquire_synthesis_slot(uid)
+        try:
+            parts, sample_rate = await synthesize_units(voice_name, onnx_blob, json_blob, missing)
+            if parts is None:
+                return await synthesize_texts_with_piper_cli(voice_name, onnx_blob, json_blob, texts)
+        finally:
+            slot.release()
+        storage_executor.submit(store_fragments, voice_name, generation, missing, parts, sample_rate)
+        fragments.update((unit, (pcm, sample_rate)) for unit, pcm in zip(missing, parts))
+    else:
+        logger.info(f"Assembled {len(units)} sentences of {voice_name} from the fragment cache")
+    sample_rate = next(iter(fragments.values()))[1]
+    return [(join_pcm([fragments[unit][0] for unit in units], sample_rate), sample_rate) for units in text_units]
+
+
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
     """Serve the main page at /."""
@@ -642,289 +1510,586 @@ async def get_dashboard_html():
     return FileResponse(dashboard_path)
 
 
+_voice_catalog_loading = None
+
+async def load_voice_catalog():
+    """Fill the cold voice catalog off the event loop, once for all the requests waiting on it."""
+    global _voice_catalog_loading
+    if _voice_catalog_loading is None:
+        _voice_catalog_loading = asyncio.ensure_future(run_in(storage_executor, voice_catalog.refresh, bucket))
+
+        def done(_):
+            global _voice_catalog_loading
+            _voice_catalog_loading = None
+
+        _voice_catalog_loading.add_done_callback(done)
+    await asyncio.shield(_voice_catalog_loading)
+
 @app.get("/voices")
-async def list_voices():
-    """List all available voices from Firebase Storage."""
+async def list_voices(request: Request):
+    """List all available voices from the cached Firebase Storage catalog."""
     try:
-        logger.info("Listing voices from Firebase Storage...")
-        voices = []
         if not bucket:
             logger.error("Firebase Storage bucket not initialized.")
             raise HTTPException(status_code=500, detail="Firebase Storage not available")
-        # List all .onnx files in the models/ folder in the bucket
-        blobs = bucket.list_blobs(prefix=FIREBASE_MODELS_PATH)
-        onnx_files = [blob.name for blob in blobs if blob.name.endswith('.onnx') and not blob.name.endswith('.onnx.json')]
-        logger.info(f"Found {len(onnx_files)} .onnx files in Firebase Storage: {onnx_files}")
-        for onnx_blob_name in onnx_files:
-            base_name = Path(onnx_blob_name).stem
-            json_blob_name = f"{FIREBASE_MODELS_PATH}{base_name}.onnx.json"
-            # Download the .onnx.json metadata file to a temp location
-            with tempfile.NamedTemporaryFile(suffix=".json", delete=True) as temp_json:
-                try:
-                    json_blob = bucket.blob(json_blob_name)
-                    if not json_blob.exists():
-                        logger.warning(f"No JSON file found for {onnx_blob_name}")
-                        continue
-                    json_blob.download_to_filename(temp_json.name)
-                    with open(temp_json.name) as f:
-                        voice_info = json.load(f)
-                    language_code = base_name.split("-")[0]
-                    voice_data = {
-                        "name": base_name,
-                        "language": language_code,
-                        "description": voice_info.get("description", "No description available"),
-                    }
-                    voices.append(voice_data)
-                    logger.info(f"Added voice: {voice_data}")
-                except Exception as e:
-                    logger.error(f"Error processing voice {onnx_blob_name}: {e}")
-        logger.info(f"Returning {len(voices)} voices from Firebase Storage.")
-        return voices
+        if voice_catalog.etag is None:
+            await load_voice_catalog()
+        voices, etag = voice_catalog.get(bucket)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=voices, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing voices from Firebase Storage: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/synthesize")
-async def synthesize_speech(request: SynthesisRequest, req: Request, authorization: Optional[str] = Header(None)):
+async def synthesize_speech(request: SynthesisRequest, req: Request, uid: Optional[str] = Depends(get_user_uid)):
     """Synthesize speech from text using the specified voice. Download model from Firebase Storage."""
     try:
-        # Check user authorization and limits first
-        uid = None
-        if authorization and authorization.startswith("Bearer "):
-            id_token = authorization.split(" ", 1)[1]
-            try:
-                decoded = firebase_admin.auth.verify_id_token(id_token)
-                uid = decoded["uid"]
-            except Exception:
-                uid = None
-        
         # Check if user has already exceeded limits (hard stop)
-        current_usage = await get_user_usage(uid or "anonymous")
-        if uid and current_usage["total_duration"] > FREE_DURATION_SECONDS:
-            # User has already exceeded free limit and needs subscription
-            has_subscription = await check_revenuecat_subscription(uid)
-            if not has_subscription:
-                error_detail = {
-                    "error": "usage_limit_exceeded", 
-                    "message": "You've reached your free usage limit. Please upgrade to continue.",
-                    "reason": "limit_exceeded",
-                    "usage": {
-                        "used_duration": current_usage["total_duration"],
-                        "free_duration": FREE_DURATION_SECONDS,
-                        "recordings_count": current_usage["recordings_count"]
-                    }
-                }
-                logger.info(f"User already over limit, raising 402 HTTPException")
-                raise HTTPException(status_code=402, detail=error_detail)
-        
-        logger.info(f"Synthesize: Downloading model for voice: {request.voice}")
-        if not bucket:
-            raise HTTPException(status_code=500, detail="Firebase Storage not available")
-        # Download the .onnx model and .onnx.json metadata from Firebase Storage
-        onnx_blob_name = f"{FIREBASE_MODELS_PATH}{request.voice}.onnx"
-        json_blob_name = f"{FIREBASE_MODELS_PATH}{request.voice}.onnx.json"
-        onnx_blob = bucket.blob(onnx_blob_name)
-        json_blob = bucket.blob(json_blob_name)
-        if not onnx_blob.exists():
-            logger.error(f"Model file not found in Firebase Storage: {onnx_blob_name}")
-            raise HTTPException(status_code=404, detail=f"Voice {request.voice} not found")
-        import shutil
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_dir_path = Path(temp_dir)
-            model_filename = f"{request.voice}.onnx"
-            config_filename = f"{request.voice}.onnx.json"
-            model_path = temp_dir_path / model_filename
-            config_path = temp_dir_path / config_filename
-            onnx_blob.download_to_filename(str(model_path))
-            logger.info(f"Downloaded model to {model_path}")
-            if json_blob.exists():
-                json_blob.download_to_filename(str(config_path))
-                logger.info(f"Downloaded metadata to {config_path}")
-            text_hash = hashlib.md5(request.text.encode()).hexdigest()
-            filename = f"{request.voice}_{text_hash}.wav"
-            output_file = temp_dir_path / filename
-            piper_path = find_piper_executable()
-            logger.info(f"Using piper executable: {piper_path}")
-            
-            # Try to determine the correct piper format
-            success = False
-            
-            # First try: new piper1-gpl CLI format with -m and -f
-            try:
-                # Use the Python module format as documented
-                cmd = [
-                    "python3", "-m", "piper",
-                    "-m", str(model_path),
-                    "-f", str(output_file),
-                    "--", request.text
-                ]
-                logger.info(f"Trying new format: {' '.join(cmd)}")
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                )
-                stdout, stderr = process.communicate()
-                if process.returncode == 0 and output_file.exists():
-                    success = True
-                    logger.info("New piper1-gpl format succeeded")
-                else:
-                    logger.warning(f"New format failed - return code: {process.returncode}, file exists: {output_file.exists()}, stderr: {stderr}")
-            except Exception as e:
-                logger.warning(f"Exception with new format: {e}")
-            
-            # Second try: Direct binary approach (in case pip installed a binary)
-            if not success:
-                try:
-                    cmd = [
-                        piper_path,
-                        "-m", str(model_path),
-                        "-f", str(output_file),
-                        "--", request.text
-                    ]
-                    logger.info(f"Trying direct binary format: {' '.join(cmd)}")
-                    process = subprocess.Popen(
-                        cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                    )
-                    stdout, stderr = process.communicate()
-                    if process.returncode == 0 and output_file.exists():
-                        success = True
-                        logger.info("Direct binary format succeeded")
-                    else:
-                        logger.warning(f"Direct binary format failed - return code: {process.returncode}, file exists: {output_file.exists()}, stderr: {stderr}")
-                except Exception as e:
-                    logger.warning(f"Exception with direct binary format: {e}")
-            
-            # Third try: legacy format with --model and stdin (fallback only)
-            if not success:
-                try:
-                    cmd = [
-                        piper_path,
-                        "--model", str(model_path),
-                        "--output_file", str(output_file),
-                        "--espeak-data", "/usr/share/espeak-ng-data",
-                    ]
-                    logger.info(f"Trying legacy format: {' '.join(cmd)}")
-                    process = subprocess.Popen(
-                        cmd,
-                        stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                    )
-                    stdout, stderr = process.communicate(input=request.text)
-                    if process.returncode == 0 and output_file.exists():
-                        success = True
-                        logger.info("Legacy format succeeded")
-                    else:
-                        logger.warning(f"Legacy format failed - return code: {process.returncode}, file exists: {output_file.exists()}, stderr: {stderr}")
-                except Exception as e:
-                    logger.warning(f"Exception with legacy format: {e}")
-            
-            if not success:
-                logger.error(f"All piper formats failed. Last error: {stderr}")
-                raise HTTPException(status_code=500, detail=f"Piper synthesis failed with all formats tried")
-            if not output_file.exists():
-                logger.error(f"Output file not found: {output_file}")
-                raise HTTPException(status_code=500, detail="Failed to generate audio file")
+        usage = await enforce_usage_limit(uid)
+
+        audio_format = resolve_output_format(request.format)
+        onnx_blob, json_blob = await run_in(storage_executor, get_voice_blobs, request.voice)
+        text_hash = hashlib.md5(request.text.encode()).hexdigest()
+        recording_id = synthesis_recording_id(request.voice, text_hash, audio_format)
+        audio_path = f"audio/{recording_id}.{file_extension(audio_format)}"
+        recording_ref = get_recording_ref(uid, recording_id)
+
+        firebase_url = None
+        storage_path = None
+        duration = None
+        local_audio = None
+
+        def save(url, path):
+            return run_in(
+                firestore_executor, save_synthesis_recording,
+                recording_ref, uid, request.voice, request.text, recording_id,
+                url, path, duration, onnx_blob.generation, audio_format,
+            )
+
+        # Reuse audio already rendered for this exact text with this model version
+        cached = await run_in(storage_executor, find_cached_audio, audio_path, onnx_blob.generation, recording_ref)
+        if cached:
+            firebase_url, duration = cached
+            storage_path = audio_path
+            logger.info(f"Result cache hit for {recording_id} (model generation {onnx_blob.generation})")
+            saved_usage = await save(firebase_url, storage_path)
+        else:
+            # Audio stays in memory as 16-bit mono PCM from synthesis to upload
+            pcm, sample_rate = await render_pcm(request.voice, onnx_blob, json_blob, request.text, uid)
             logger.info("Speech synthesis completed successfully")
-            firebase_url = None
-            storage_path = None
+            duration = len(pcm) / (2 * sample_rate)
+            with observe_stage("encode"):
+                audio = await encode_pcm(pcm, sample_rate, audio_format)
             if bucket:
-                try:
-                    storage_path = f"audio/{filename}"
-                    blob = bucket.blob(storage_path)
-                    blob.upload_from_filename(str(output_file))
-                    blob.make_public()
-                    firebase_url = blob.public_url
-                    logger.info(f"Uploaded to Firebase Storage: {firebase_url}")
-                except Exception as e:
-                    logger.error(f"Failed to upload to Firebase Storage: {e}")
+                # The URL is known before the upload, so the recording transaction runs alongside it
+                storage_path = audio_path
+                firebase_url = bucket.blob(storage_path).public_url
+                uploaded, saved_usage = await asyncio.gather(
+                    run_in(
+                        storage_executor, upload_audio_bytes, storage_path, audio,
+                        onnx_blob.generation, duration, media_type(audio_format),
+                    ),
+                    save(firebase_url, storage_path),
+                    return_exceptions=True,
+                )
+                if isinstance(uploaded, Exception):
+                    logger.error(f"Failed to upload to Firebase Storage: {uploaded}")
                     firebase_url = None
                     storage_path = None
-            logger.info(f"uid: {uid}")
-            # Calculate audio duration
-            duration = None
-            try:
-                import wave
-                with wave.open(str(output_file), 'rb') as wav_file:
-                    frames = wav_file.getnframes()
-                    sample_rate = wav_file.getframerate()
-                    duration = frames / sample_rate
-            except Exception as e:
-                logger.warning(f"Could not calculate audio duration: {e}")
-            
-            if db:
-                # Create searchable fields
-                text_words = [word.lower().strip('.,!?;:"()[]{}') for word in request.text.lower().split() if len(word.strip('.,!?;:"()[]{}')) > 2]
-                
-                if uid:
-                    recording_doc = {
-                        "id": f"{request.voice}_{text_hash}",
-                        "voice": request.voice,
-                        "text": request.text,
-                        "created": int(time.time()),
-                        "audioUrl": firebase_url,
-                        "storagePath": storage_path,
-                        "duration": duration,
-                        "textWords": text_words,
-                        "voiceLower": request.voice.lower()
-                    }
-                    db.collection("users").document(uid).collection("recordings").document(recording_doc["id"]).set(recording_doc)
+                    # Point the doc at no audio before responding instead of at the failed upload
+                    saved_usage = await save(None, None)
                 else:
-                    # Store anonymous recording in top-level 'recordings' collection
-                    recording_doc = {
-                        "id": f"{request.voice}_{text_hash}",
-                        "voice": request.voice,
-                        "text": request.text,
-                        "created": int(time.time()),
-                        "audioUrl": firebase_url,
-                        "storagePath": storage_path,
-                        "anonymous": True,
-                        "duration": duration,
-                        "textWords": text_words,
-                        "voiceLower": request.voice.lower()
-                    }
-                    db.collection("recordings").document(recording_doc["id"]).set(recording_doc)
-            # Check if this generation puts user over the limit (show paywall after generation)
-            show_paywall = False
-            if uid:
-                updated_usage = await get_user_usage(uid)
-                if updated_usage["total_duration"] > FREE_DURATION_SECONDS:
-                    # User has now exceeded the limit, check if they have subscription
-                    has_subscription = await check_revenuecat_subscription(uid)
-                    if not has_subscription:
-                        show_paywall = True
-                        logger.info(f"User {uid} exceeded limit after this generation, will show paywall")
-            
-            # Return the audio file with optional paywall indicator
-            response_data = {"audioUrl": firebase_url if firebase_url else "/audio/local"}
-            
-            if show_paywall:
-                response_data["show_paywall"] = True
-                response_data["usage"] = {
-                    "used_duration": updated_usage["total_duration"],
-                    "free_duration": FREE_DURATION_SECONDS,
-                    "recordings_count": updated_usage["recordings_count"]
-                }
-                response_data["message"] = "You've now used all your free audio generation. Upgrade to continue creating more audio."
-            
-            if firebase_url:
-                return response_data
+                    logger.info(f"Uploaded to Firebase Storage: {firebase_url}")
+                    if isinstance(saved_usage, Exception):
+                        raise saved_usage
             else:
-                return FileResponse(output_file, media_type="audio/wav", filename="speech.wav")
+                saved_usage = await save(None, None)
+            if not firebase_url:
+                local_audio = audio
+        logger.info(f"uid: {uid}")
+
+        response_data = {
+            "audioUrl": firebase_url if firebase_url else "/audio/local",
+            "format": audio_format,
+            "mediaType": media_type(audio_format),
+        }
+        if uid:
+            # Check if this generation puts user over the limit (show paywall after generation),
+            # from the usage the recording transaction just stored
+            response_data.update(await get_post_generation_paywall(uid, saved_usage or usage))
+
+        if firebase_url:
+            return response_data
+        else:
+            return Response(
+                content=local_audio,
+                media_type=media_type(audio_format),
+                headers={"Content-Disposition": f'attachment; filename="speech.{file_extension(audio_format)}"'},
+            )
+    except HTTPException as e:
+        count_error("synthesize", e)
+        raise
     except FileNotFoundError as e:
         logger.error(f"File not found error: {e}")
+        count_error("synthesize", e)
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"Error synthesizing speech: {e}", exc_info=True)
+        count_error("synthesize", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _item_error(error: Exception) -> dict:
+    if isinstance(error, HTTPException):
+        return {"status": error.status_code, "error": error.detail}
+    return {"status": 500, "error": str(error)}
+
+
+async def render_batch_voice(voice_name: str, entries: list, audio_format: str, uid: Optional[str]):
+    """Render the batch entries of one voice; fills in each entry's result and recording doc."""
+    onnx_blob, json_blob = await run_in(storage_executor, get_voice_blobs, voice_name)
+    for entry in entries:
+        text_hash = hashlib.md5(entry["text"].encode()).hexdigest()
+        entry["recording_id"] = synthesis_recording_id(voice_name, text_hash, audio_format)
+        entry["storage_path"] = f"audio/{entry['recording_id']}.{file_extension(audio_format)}"
+
+    cached = await asyncio.gather(*(
+        run_in(
+            storage_executor, find_cached_audio, entry["storage_path"], onnx_blob.generation,
+            get_recording_ref(uid, entry["recording_id"]),
+        )
+        for entry in entries
+    ))
+    to_render = []
+    for entry, hit in zip(entries, cached):
+        if hit:
+            entry["result"] = {"audioUrl": hit[0], "duration": hit[1], "cached": True}
+        else:
+            to_render.append(entry)
+
+    if to_render:
+        rendered = await render_pcm_many(voice_name, onnx_blob, json_blob, [entry["text"] for entry in to_render], uid)
+        encode_slots = asyncio.Semaphore(os.cpu_count() or 1)
+
+        async def encode_and_upload(entry, pcm, sample_rate):
+            try:
+                duration = len(pcm) / (2 * sample_rate)
+                async with encode_slots:
+                    with observe_stage("encode"):
+                        audio = await encode_pcm(pcm, sample_rate, audio_format)
+                firebase_url = await run_in(
+                    storage_executor, upload_audio_bytes, entry["storage_path"], audio,
+                    onnx_blob.generation, duration, media_type(audio_format),
+                )
+                entry["result"] = {"audioUrl": firebase_url, "duration": duration, "cached": False}
+            except Exception as e:
+                logger.error(f"Batch item {entry['recording_id']} failed: {e}")
+                count_error("synthesize_batch", e)
+                entry["result"] = _item_error(e)
+
+        await asyncio.gather(*(
+            encode_and_upload(entry, pcm, sample_rate) for entry, (pcm, sample_rate) in zip(to_render, rendered)
+        ))
+
+    for entry in entries:
+        if "audioUrl" in entry["result"]:
+            entry["doc"] = build_recording_doc(
+                uid, voice_name, entry["text"], entry["recording_id"], entry["result"]["audioUrl"],
+                entry["storage_path"], entry["result"]["duration"], onnx_blob.generation, audio_format,
+            )
+
+
+@app.post("/synthesize/batch")
+async def synthesize_batch(request: BatchSynthesisRequest, uid: Optional[str] = Depends(get_user_uid)):
+    """Synthesize many (text, voice) items with one usage check, one model load per voice and one Firestore write."""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items to synthesize")
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {MAX_BATCH_ITEMS} items")
+    try:
+        usage = await enforce_usage_limit(uid)
+        audio_format = resolve_output_format(request.format)
+
+        # Repeated items are rendered once
+        entries = {}
+        for item in request.items:
+            entries.setdefault((item.voice, item.text), {"voice": item.voice, "text": item.text})
+        by_voice = {}
+        for entry in entries.values():
+            by_voice.setdefault(entry["voice"], []).append(entry)
+        logger.info(f"Batch of {len(request.items)} items ({len(entries)} distinct) in {len(by_voice)} voices")
+
+        outcomes = await asyncio.gather(
+            *(render_batch_voice(voice_name, voice_entries, audio_format, uid) for voice_name, voice_entries in by_voice.items()),
+            return_exceptions=True,
+        )
+        for (voice_name, voice_entries), outcome in zip(by_voice.items(), outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, HTTPException):
+                    logger.error(f"Batch synthesis failed for {voice_name}: {outcome}", exc_info=outcome)
+                count_error("synthesize_batch", outcome)
+                for entry in voice_entries:
+                    entry.setdefault("result", _item_error(outcome))
+
+        recordings = {entry["recording_id"]: entry["doc"] for entry in entries.values() if "doc" in entry}
+        saved_usage = await run_in(firestore_executor, save_batch_recordings, uid, recordings)
+
+        response_data = {
+            "items": [
+                {"index": index, "voice": item.voice, **entries[(item.voice, item.text)]["result"]}
+                for index, item in enumerate(request.items)
+            ],
+            "format": audio_format,
+            "mediaType": media_type(audio_format),
+        }
+        if uid:
+            response_data.update(await get_post_generation_paywall(uid, saved_usage or usage))
+        return response_data
+    except HTTPException as e:
+        count_error("synthesize_batch", e)
+        raise
+    except Exception as e:
+        logger.error(f"Error synthesizing batch: {e}", exc_info=True)
+        count_error("synthesize_batch", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+_job_tasks = set()
+
+
+@app.on_event("startup")
+async def fail_orphaned_jobs():
+    """Jobs left running by a worker that was restarted will never finish; report them as failed."""
+    try:
+        failed = await run_in(
+            firestore_executor, job_store.fail_stale, "Interrupted by a server restart, please try again"
+        )
+    except Exception as e:
+        logger.warning(f"Could not check for orphaned synthesis jobs: {e}")
+        return
+    if failed:
+        logger.info(f"Marked {len(failed)} synthesis jobs idle for over {JOB_STALE_SECONDS:.0f}s as failed")
+
+
+@app.post("/synthesis-jobs", status_code=202)
+async def create_synthesis_job(request: SynthesisRequest, uid: Optional[str] = Depends(get_user_uid)):
+    """Queue a synthesis and return a job id to poll instead of holding the connection open."""
+    await enforce_usage_limit(uid)
+    audio_format = resolve_output_format(request.format)
+    # Fail fast on unknown voices rather than in the background
+    onnx_blob, json_blob = await run_in(storage_executor, get_voice_blobs, request.voice)
+
+    job = new_job(uid, request.voice, request.text)
+    job["format"] = audio_format
+    await run_in(firestore_executor, job_store.create, job)
+    task = asyncio.create_task(
+        run_synthesis_job(job["id"], uid, request.voice, request.text, onnx_blob, json_blob, audio_format)
+    )
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    logger.info(f"Created synthesis job {job['id']} for uid {uid}")
+    return {"id": job["id"], "status": job["status"], "statusUrl": f"/synthesis-jobs/{job['id']}"}
+
+
+@app.get("/synthesis-jobs/{job_id}")
+async def get_synthesis_job(job_id: str, uid: Optional[str] = Depends(get_user_uid)):
+    """Status, progress in sentences and (once finished) the audio URL of a synthesis job."""
+    job = await run_in(firestore_executor, job_store.get, job_id)
+    # Jobs are only visible to the user who created them
+    if not job or job.get("uid") != uid:
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = {
+        "id": job["id"],
+        "status": job["status"],
+        "voice": job["voice"],
+        "format": job.get("format", "wav"),
+        "progress": {
+            "sentences_done": job.get("sentences_done", 0),
+            "sentences_total": job.get("sentences_total"),
+        },
+        "audioUrl": job.get("audioUrl"),
+        "duration": job.get("duration"),
+        "error": job.get("error"),
+        "created": job.get("created"),
+        "updated": job.get("updated"),
+    }
+    for key in ("show_paywall", "usage", "message"):
+        if key in job:
+            result[key] = job[key]
+    return result
+
+
+async def with_job_heartbeat(job_id: str, awaitable):
+    """Await awaitable, touching the job meanwhile so a long wait isn't taken for an orphaned job."""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait([task], timeout=JOB_HEARTBEAT_SECONDS)
+            if done:
+                return task.result()
+            try:
+                await run_in(firestore_executor, job_store.update, job_id)
+            except Exception as e:
+                logger.warning(f"Could not update synthesis job {job_id}: {e}")
+    finally:
+        task.cancel()
+
+
+async def run_synthesis_job(job_id: str, uid, voice_name: str, text: str, onnx_blob, json_blob, audio_format="wav"):
+    slot = None
+    try:
+        voice_key = (voice_name, onnx_blob.generation)
+        text_hash = hashlib.md5(text.encode()).hexdigest()
+        recording_id = synthesis_recording_id(voice_name, text_hash, audio_format)
+        storage_path = f"audio/{recording_id}.{file_extension(audio_format)}"
+        recording_ref = get_recording_ref(uid, recording_id)
+
+        cached = await run_in(storage_executor, find_cached_audio, storage_path, onnx_blob.generation, recording_ref)
+        if cached:
+            firebase_url, duration = cached
+            logger.info(f"Job {job_id}: result cache hit for {recording_id}")
+        else:
+            model_path = await run_in(storage_executor, fetch_voice_model, voice_name, onnx_blob, json_blob)
+            # Piper voice names start with their locale (en_US-lessac-medium)
+            sentences = synthesis_units(text, voice_name.split("-", 1)[0])
+            if not sentences:
+                raise ValueError("No text to synthesize")
+            # Jobs queue with the other syntheses; the job fails if the queue is full
+            slot = await with_job_heartbeat(job_id, acquire_synthesis_slot(uid))
+            await run_in(
+                firestore_executor, job_store.update, job_id, status=JOB_RUNNING, sentences_total=len(sentences)
+            )
+
+            async def rendered():
+                """(sentences done, pcm, sample_rate) in order, as the audio becomes available.
+
+                Falls back like synthesize_units: process pool, then resident voice, then piper CLI.
+                """
+                done = 0
+                if synthesis_pool.should_split(text):
+                    # Sentences run in parallel on the process pool and are collected in order
+                    futures = []
+                    try:
+                        futures = [asyncio.wrap_future(synthesis_pool.submit(voice_key, model_path, s)) for s in sentences]
+                        for future in futures:
+                            pcm, sample_rate = await future
+                            done += 1
+                            yield done, pcm, sample_rate
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool):
+                            synthesis_pool.reset()
+                        for future in futures:
+                            future.cancel()
+                        logger.warning(f"Parallel synthesis failed for job {job_id}, using a single voice: {e}")
+                if done == len(sentences):
+                    return
+
+                voice = None
+                if voice_pool.available:
+                    try:
+                        voice = await run_in(synthesis_executor, voice_pool.get, voice_key, lambda: model_path)
+                    except Exception as e:
+                        logger.warning(f"Resident engine failed for job {job_id}, falling back to piper CLI: {e}")
+                if voice is not None:
+                    for sentence in sentences[done:]:
+                        pcm = await run_in(synthesis_executor, synthesize_unit_pcm, voice, sentence)
+                        done += 1
+                        yield done, pcm, voice.config.sample_rate
+                else:
+                    # Fallback: the piper CLI renders the rest of the text at once
+                    [(pcm, sample_rate)] = await with_job_heartbeat(
+                        job_id, synthesize_texts_with_piper_cli(voice_name, onnx_blob, json_blob, [" ".join(sentences[done:])])
+                    )
+                    yield len(sentences), pcm, sample_rate
+
+            encoder = None
+            last_progress_update = time.monotonic()
+            try:
+                async for sentences_done, pcm, sample_rate in rendered():
+                    if encoder is None:
+                        encoder = PcmEncoder(audio_format, sample_rate)
+                        await encoder.start()
+                    else:
+                        # Encoded while the following sentences are synthesized
+                        await encoder.feed(sentence_silence(sample_rate))
+                    await encoder.feed(pcm)
+                    # Throttle progress writes to about one per second
+                    if time.monotonic() - last_progress_update >= 1.0:
+                        await run_in(firestore_executor, job_store.update, job_id, sentences_done=sentences_done)
+                        last_progress_update = time.monotonic()
+                slot.release()
+                audio = await encoder.finish()
+            except BaseException:
+                if encoder is not None:
+                    await encoder.aclose()
+                raise
+
+            duration = encoder.duration
+            firebase_url = await run_in(
+                storage_executor, upload_audio_bytes,
+                storage_path, audio, onnx_blob.generation, duration, media_type(audio_format),
+            )
+
+        saved_usage = await run_in(
+            firestore_executor, save_synthesis_recording,
+            recording_ref, uid, voice_name, text, recording_id,
+            firebase_url, storage_path, duration, onnx_blob.generation, audio_format,
+        )
+        result = {"status": JOB_SUCCEEDED, "audioUrl": firebase_url, "duration": duration}
+        if not cached:
+            result["sentences_done"] = len(sentences)
+        if uid:
+            result.update(await get_post_generation_paywall(uid, saved_usage))
+        await run_in(firestore_executor, job_store.update, job_id, **result)
+        logger.info(f"Synthesis job {job_id} finished: {firebase_url}")
+    except Exception as e:
+        logger.error(f"Synthesis job {job_id} failed: {e}", exc_info=True)
+        count_error("synthesis_job", e)
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        if isinstance(error, dict):
+            error = error.get("message", str(error))
+        try:
+            await run_in(firestore_executor, job_store.update, job_id, status=JOB_FAILED, error=error)
+        except Exception as store_error:
+            logger.error(f"Could not record failure of job {job_id}: {store_error}")
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+@app.get("/synthesis-queue")
+async def get_synthesis_queue(uid: str = Depends(require_superuser)):
+    """Synthesis queue depth and wait time for this worker."""
+    return synthesis_scheduler.stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics, summed over all workers."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/memory")
+async def get_memory_report(uid: str = Depends(require_superuser)):
+    """Memory of this worker, with the part of it that is model weights shared with other workers."""
+    report = memory_report()
+    report["loaded_voices"] = [f"{voice}@{generation}" for voice, generation in voice_pool.loaded_voices()]
+    return report
+
+
+@app.post("/synthesize/stream")
+async def synthesize_speech_stream(request: StreamingSynthesisRequest, uid: Optional[str] = Depends(get_user_uid)):
+    """Stream audio sentence by sentence while Piper is still generating.
+
+    The complete recording is uploaded and saved after the stream finishes.
+    """
+    if request.container not in ("wav", "pcm"):
+        raise HTTPException(status_code=400, detail="container must be 'wav' or 'pcm'")
+    if not voice_pool.available:
+        raise HTTPException(status_code=503, detail="Streaming synthesis requires the piper Python package")
+
+    await enforce_usage_limit(uid)
+    # Format of the stored recording; the stream itself is always WAV/PCM
+    audio_format = resolve_output_format(request.format)
+
+    onnx_blob, json_blob = await run_in(storage_executor, get_voice_blobs, request.voice)
+    voice_key = (request.voice, onnx_blob.generation)
+    # Held until the stream finishes (released by the generator or the background task)
+    slot = await acquire_synthesis_slot(uid)
+    try:
+        if not voice_pool.is_loaded(voice_key):
+            await run_in(storage_executor, fetch_voice_model, request.voice, onnx_blob, json_blob)
+        voice = await run_in(
+            synthesis_executor, voice_pool.get, voice_key, lambda: fetch_voice_model(request.voice, onnx_blob, json_blob)
+        )
+    except Exception as e:
+        slot.release()
+        logger.error(f"Could not load voice {voice_key} for streaming: {e}", exc_info=True)
+        count_error("stream", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    sample_rate = voice.config.sample_rate
+    text_hash = hashlib.md5(request.text.encode()).hexdigest()
+    recording_id = synthesis_recording_id(request.voice, text_hash, audio_format)
+    storage_path = f"audio/{recording_id}.{file_extension(audio_format)}"
+    # The stored recording is encoded as the chunks are streamed
+    encoder = PcmEncoder(audio_format, sample_rate)
+    state = {"completed": False}
+
+    async def generate():
+        if request.container == "wav":
+            yield wav_header(sample_rate)
+        # Piper splits the text into sentences and yields one chunk per sentence
+        try:
+            await encoder.start()
+            audio_chunks = synthesize_chunks(voice, request.text)
+            while True:
+                audio_chunk = await run_in(synthesis_executor, next, audio_chunks, None)
+                if audio_chunk is None:
+                    break
+                pcm = audio_chunk.audio_int16_bytes
+                await encoder.feed(pcm)
+                yield pcm
+            state["completed"] = True
+        except BaseException as e:
+            await encoder.aclose()
+            # GeneratorExit and CancelledError are a client hanging up, not an error
+            if isinstance(e, Exception):
+                count_error("stream", e)
+            raise
+        finally:
+            slot.release()
+
+    async def finalize():
+        slot.release()
+        if not state["completed"]:
+            logger.info(f"Stream for {recording_id} did not complete, not saving recording")
+            await encoder.aclose()
+            return
+        if not bucket:
+            await encoder.aclose()
+        duration = encoder.duration
+        firebase_url = None
+        saved_path = None
+        if bucket:
+            try:
+                audio = await encoder.finish()
+                firebase_url = await run_in(
+                    storage_executor, upload_audio_bytes,
+                    storage_path, audio, onnx_blob.generation, duration, media_type(audio_format),
+                )
+                saved_path = storage_path
+                logger.info(f"Uploaded streamed audio to Firebase Storage: {firebase_url}")
+            except Exception as e:
+                logger.error(f"Failed to upload streamed audio to Firebase Storage: {e}")
+        try:
+            await run_in(
+                firestore_executor, save_synthesis_recording,
+                get_recording_ref(uid, recording_id), uid, request.voice, request.text, recording_id,
+                firebase_url, saved_path, duration, onnx_blob.generation, audio_format,
+            )
+        except Exception as e:
+            logger.error(f"Failed to save streamed recording {recording_id}: {e}")
+
+    headers = {
+        "X-Sample-Rate": str(sample_rate),
+        "X-Sample-Width": "2",
+        "X-Channels": "1",
+        "X-Recording-Id": recording_id,
+    }
+    if bucket:
+        # Where the full recording will be available once the stream completes
+        headers["X-Audio-Url"] = bucket.blob(storage_path).public_url
+    stream_media_type = "audio/wav" if request.container == "wav" else "audio/L16"
+    return StreamingResponse(generate(), media_type=stream_media_type, headers=headers, background=BackgroundTask(finalize))
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,188 @@
+"""Model weights shared between worker processes through memory-mapped files.
+
+onnxruntime normally copies every weight of a model into the heap of each
+process that loads it, so four gunicorn workers hold four copies of each
+voice. Instead, the weights of a cached model are written once to a flat
+file next to it ({model}.shared.weights, described by {model}.shared.json,
+with the graph minus its weights in {model}.shared.graph). Workers map that
+file and hand the mapped arrays to onnxruntime as user-owned initializers,
+which it uses in place, so all processes share the same page-cache pages.
+
+Preparing the files needs the onnx package; without it (or with
+PIPER_SHARED_WEIGHTS=0) models are loaded the usual way.
+"""
+import fcntl
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger("piper_tts_web")
+
+SHARED_WEIGHTS_ENABLED = os.environ.get("PIPER_SHARED_WEIGHTS", "1").lower() not in ("0", "false", "no")
+# Smaller tensors stay inside the graph; mapping them isn't worth a page each
+SHARED_WEIGHTS_MIN_BYTES = int(os.environ.get("PIPER_SHARED_WEIGHTS_MIN_BYTES", "4096"))
+_ALIGNMENT = 4096
+
+try:
+    import numpy
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    import onnx
+    from onnx import external_data_helper, numpy_helper
+except ImportError:
+    onnx = None
+
+
+def shared_paths(model_path) -> dict:
+    model_path = Path(model_path)
+    return {
+        "manifest": Path(f"{model_path}.shared.json"),
+        "graph": Path(f"{model_path}.shared.graph"),
+        "weights": Path(f"{model_path}.shared.weights"),
+    }
+
+
+def is_prepared(model_path) -> bool:
+    # The manifest is written last, so its presence marks a complete set of files
+    return shared_paths(model_path)["manifest"].exists()
+
+
+def prepare(model_path) -> bool:
+    """Split a model into a weightless graph and a mappable weights file (once per model)."""
+    if onnx is None:
+        return False
+    paths = shared_paths(model_path)
+    if paths["manifest"].exists():
+        return True
+
+    lock_path = Path(f"{model_path}.shared.lock")
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if paths["manifest"].exists():
+                return True
+            _write_shared_files(model_path, paths)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return True
+
+
+def _write_shared_files(model_path, paths: dict):
+    model = onnx.load(str(model_path))
+    suffix = f".{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    tmp_paths = {name: path.with_name(f".{path.name}{suffix}") for name, path in paths.items()}
+    tensors = []
+    try:
+        offset = 0
+        with open(tmp_paths["weights"], "wb") as weights_file:
+            for tensor in model.graph.initializer:
+                if tensor.data_type == onnx.TensorProto.STRING or tensor.data_location == onnx.TensorProto.EXTERNAL:
+                    continue
+                array = numpy_helper.to_array(tensor)
+                if array.nbytes < SHARED_WEIGHTS_MIN_BYTES:
+                    continue
+                # Page-aligned, so every tensor can be mapped on its own
+                padding = -offset % _ALIGNMENT
+                weights_file.write(b"\0" * padding)
+                offset += padding
+                weights_file.write(numpy.ascontiguousarray(array).tobytes())
+                tensors.append({
+                    "name": tensor.name,
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "offset": offset,
+                })
+                # The graph keeps a reference to the data instead of the data itself
+                tensor.CopyFrom(numpy_helper.from_array(array, tensor.name))
+                external_data_helper.set_external_data(tensor, paths["weights"].name, offset, array.nbytes)
+                tensor.ClearField("raw_data")
+                tensor.data_location = onnx.TensorProto.EXTERNAL
+                offset += array.nbytes
+        with open(tmp_paths["graph"], "wb") as graph_file:
+            graph_file.write(model.SerializeToString())
+        with open(tmp_paths["manifest"], "w") as manifest_file:
+            json.dump({"tensors": tensors, "size": offset}, manifest_file)
+
+        os.replace(tmp_paths["weights"], paths["weights"])
+        os.replace(tmp_paths["graph"], paths["graph"])
+        os.replace(tmp_paths["manifest"], paths["manifest"])
+        logger.info(f"Prepared shared weights for {Path(model_path).name}: {len(tensors)} tensors, {offset / 1024 ** 2:.1f} MiB")
+    finally:
+        for tmp_path in tmp_paths.values():
+            tmp_path.unlink(missing_ok=True)
+
+
+class SharedWeights:
+    """A model's mapped weights, to be added to onnxruntime session options."""
+
+    def __init__(self, model_path):
+        paths = shared_paths(model_path)
+        with open(paths["manifest"], "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        self.graph_path = paths["graph"]
+        self.weights_path = paths["weights"]
+        self.size = manifest["size"]
+        # Copy-on-write mapping: onnxruntime wants writable arrays but never writes weights,
+        # so the pages stay shared with every other process mapping the file
+        mapping = numpy.memmap(self.weights_path, dtype=numpy.uint8, mode="c") if self.size else None
+        self._values = []
+        for tensor in manifest["tensors"]:
+            dtype = numpy.dtype(tensor["dtype"])
+            count = int(numpy.prod(tensor["shape"], dtype=numpy.int64))
+            array = mapping[tensor["offset"]:tensor["offset"] + count * dtype.itemsize].view(dtype).reshape(tensor["shape"])
+            # onnxruntime uses these buffers without copying; they must outlive the session
+            self._values.append((tensor["name"], onnxruntime.OrtValue.ortvalue_from_numpy(array)))
+
+    def apply(self, sess_options) -> None:
+        for name, value in self._values:
+            sess_options.add_initializer(name, value)
+        # Pre-packed weights would be private per-process copies again
+        sess_options.add_session_config_entry("session.disable_prepacking", "1")
+
+
+def load_shared_weights(model_path):
+    """SharedWeights for a model, preparing the files on first use; None to load normally."""
+    if not SHARED_WEIGHTS_ENABLED or onnxruntime is None:
+        return None
+    try:
+        if not is_prepared(model_path) and not prepare(model_path):
+            return None
+        return SharedWeights(model_path)
+    except Exception as e:
+        logger.warning(f"Could not use shared weights for {model_path}, loading normally: {e}")
+        return None
+
+
+def memory_report() -> dict:
+    """Memory of this process from /proc (Linux), including how much of it is shared model weights."""
+    report = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as rollup:
+            for line in rollup:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    report[parts[0].rstrip(":").lower()] = int(parts[1]) * 1024
+    except OSError:
+        return report
+
+    weights = {"mapped": 0, "rss": 0, "pss": 0}
+    in_weights = False
+    try:
+        with open("/proc/self/smaps", "r") as smaps:
+            for line in smaps:
+                parts = line.split()
+                if parts and "-" in parts[0] and len(parts) >= 5:
+                    # A mapping header line; the path (if any) is the last field
+                    in_weights = parts[-1].endswith(".shared.weights")
+                elif in_weights and parts[0] in ("Size:", "Rss:", "Pss:"):
+                    key = {"Size:": "mapped", "Rss:": "rss", "Pss:": "pss"}[parts[0]]
+                    weights[key] += int(parts[1]) * 1024
+    except OSError:
+        pass
+    report["shared_weights"] = weights
+    return report
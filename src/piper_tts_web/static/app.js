@@ -202,7 +202,8 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Set up download button (only visible on mobile via CSS)
             downloadButton.href = audioUrl;
-            downloadButton.download = `speech-${Date.now()}.wav`;
+            const extension = { opus: 'ogg', mp3: 'mp3' }[data.format] || 'wav';
+            downloadButton.download = `speech-${Date.now()}.${extension}`;
             downloadButton.style.display = 'block';
             downloadButton.classList.add('show-mobile');
             
@@ -4,6 +4,10 @@ const dashboardList = document.getElementById('dashboard-list');
 
 let currentPage = 1;
 let totalPages = 1;
+let hasNextPage = false;
+let totalKnown = true;
+// Cursor returned by the server for each page we've seen (page 1 needs none)
+let pageCursors = {};
 let currentSearch = '';
 let currentVoiceFilter = '';
 let currentUserFilter = '';
@@ -66,6 +70,8 @@ async function loadDashboardList(page = 1) {
       page: page.toString(),
       limit: '50'
     });
+    if (page === 1) pageCursors = {};
+    if (pageCursors[page]) params.append('cursor', pageCursors[page]);
     
     if (currentSearch) params.append('search', currentSearch);
     if (currentVoiceFilter) params.append('voice', currentVoiceFilter);
@@ -84,7 +90,11 @@ async function loadDashboardList(page = 1) {
     const pagination = data.pagination;
     
     currentPage = pagination.page;
-    totalPages = pagination.total_pages;
+    hasNextPage = pagination.has_next;
+    if (pagination.next_cursor) pageCursors[currentPage + 1] = pagination.next_cursor;
+    // The total isn't known when some filters can't be counted server-side
+    totalKnown = pagination.total_pages != null;
+    totalPages = totalKnown ? pagination.total_pages : (hasNextPage ? currentPage + 1 : currentPage);
     
     // Store recordings for modal navigation
     currentRecordings = recordings;
@@ -335,15 +345,15 @@ function updatePaginationControls() {
   }
   
   paginationControls.style.display = 'block';
-  pageInfo.textContent = `Page ${currentPage} of ${totalPages}`;
+  pageInfo.textContent = totalKnown ? `Page ${currentPage} of ${totalPages}` : `Page ${currentPage}`;
   
   prevBtn.disabled = currentPage === 1;
-  nextBtn.disabled = currentPage === totalPages;
+  nextBtn.disabled = !hasNextPage;
   
   prevBtn.style.opacity = currentPage === 1 ? '0.5' : '1';
-  nextBtn.style.opacity = currentPage === totalPages ? '0.5' : '1';
+  nextBtn.style.opacity = !hasNextPage ? '0.5' : '1';
   prevBtn.style.cursor = currentPage === 1 ? 'not-allowed' : 'pointer';
-  nextBtn.style.cursor = currentPage === totalPages ? 'not-allowed' : 'pointer';
+  nextBtn.style.cursor = !hasNextPage ? 'not-allowed' : 'pointer';
   
   prevBtn.onclick = () => {
     if (currentPage > 1) {
@@ -352,7 +362,7 @@ function updatePaginationControls() {
   };
   
   nextBtn.onclick = () => {
-    if (currentPage < totalPages) {
+    if (hasNextPage) {
       loadDashboardList(currentPage + 1);
     }
   };
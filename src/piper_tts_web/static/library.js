@@ -87,7 +87,8 @@ function createKebabMenu(rec, audioUrl, onDelete) {
     menu.querySelector('#download-audio').onclick = () => {
         const a = document.createElement('a');
         a.href = audioUrl;
-        a.download = rec.id + '.wav';
+        const extension = { opus: 'ogg', mp3: 'mp3' }[rec.format] || 'wav';
+        a.download = rec.id + '.' + extension;
         document.body.appendChild(a);
         a.click();
         a.remove();
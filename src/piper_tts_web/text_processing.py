@@ -0,0 +1,204 @@
+"""Text clean-up before synthesis, and a cache of phonemized sentences.
+
+normalize_text() tidies whitespace and rewrites URLs, and for English also
+numbers with separators or units and common abbreviations, into words espeak
+reads naturally. split_units() cuts text into sentences, the unit Piper
+synthesizes and the phoneme cache stores.
+
+Phonemizing with espeak-ng is a noticeable share of the CPU time of short
+requests, and the same sentences come up again and again, so each worker
+keeps an LRU of sentence -> phonemes per voice language.
+"""
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from .metrics import count_cache
+
+PHONEME_CACHE_SIZE = int(os.environ.get("PIPER_PHONEME_CACHE_SIZE", "20000"))
+
+# Expanded for English voices; the trailing period is part of the abbreviation
+ABBREVIATIONS = {
+    "Mr.": "Mister",
+    "Mrs.": "Missus",
+    "Ms.": "Miz",
+    "Dr.": "Doctor",
+    "Prof.": "Professor",
+    "Jr.": "Junior",
+    "Sr.": "Senior",
+    "vs.": "versus",
+    "etc.": "et cetera",
+    "e.g.": "for example",
+    "i.e.": "that is",
+    "approx.": "approximately",
+}
+# Abbreviations that can also end a sentence (keep the period when they do)
+_SENTENCE_FINAL_ABBREVIATIONS = {"etc."}
+# Left as written, but a sentence is not split after them either
+COMMON_ABBREVIATIONS = {
+    "U.S.", "U.K.", "U.N.", "E.U.", "Ph.D.", "a.m.", "p.m.", "St.", "Mt.", "Ave.", "Vol.", "Fig.",
+    "Inc.", "Ltd.", "Co.", "Corp.", "Gen.", "Gov.", "Sen.", "Rep.", "Capt.", "Lt.", "Col.", "Sgt.",
+    "Jan.", "Feb.", "Mar.", "Apr.", "Aug.", "Sep.", "Sept.", "Oct.", "Nov.", "Dec.",
+}
+# Never treated as a sentence end when splitting, whatever the language; nor are initials ("J. Smith")
+_NON_FINAL = (set(ABBREVIATIONS) - _SENTENCE_FINAL_ABBREVIATIONS) | COMMON_ABBREVIATIONS
+_NON_FINAL_RE = re.compile(
+    r"(?:^|[\s(\"“])(?:" + "|".join(re.escape(a) for a in sorted(_NON_FINAL, key=len, reverse=True)) + r"|[A-HJ-Z]\.)$"
+)
+
+_ABBREVIATION_RE = re.compile(
+    r"(?<![\w.])(" + "|".join(re.escape(a) for a in sorted(ABBREVIATIONS, key=len, reverse=True)) + r")(?=\s|$)"
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+|\n\s*\n")
+# Trailing punctuation belongs to the sentence, not the URL
+_URL_RE = re.compile(r"\b(?:https?://|www\.)[^\s<>\"')\]]+(?<![.,;:!?])", re.IGNORECASE)
+_SPACES_RE = re.compile(r"[^\S\n]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}(?!\d))")
+# Whole amounts or exactly two decimals; "$3.14159" is left as it is
+_CURRENCY_RE = re.compile(r"([$£€])\s?(\d+)(?:\.(\d{2}))?(?!\.?\d)")
+_PERCENT_RE = re.compile(r"(\d)\s?%")
+_RANGE_RE = re.compile(r"(\d)\s?–\s?(\d)")
+
+_CURRENCIES = {"$": ("dollar", "cent"), "£": ("pound", "penny"), "€": ("euro", "cent")}
+
+
+def _spoken_url(match) -> str:
+    """Read a URL as its host name: "https://www.example.com/a?b" -> "example dot com"."""
+    url = re.sub(r"^(?:https?://)?(?:www\.)?", "", match.group(0), flags=re.IGNORECASE)
+    host = re.split(r"[/?#:]", url, 1)[0].rstrip(".,;")
+    return " dot ".join(part for part in host.split(".") if part)
+
+
+def _spoken_amount(match) -> str:
+    unit, minor_unit = _CURRENCIES[match.group(1)]
+    whole, cents = int(match.group(2)), match.group(3)
+    spoken = f"{whole} {unit}" + ("" if whole == 1 else "s")
+    if cents and int(cents):
+        minor = "pence" if minor_unit == "penny" and int(cents) != 1 else minor_unit + ("" if int(cents) == 1 else "s")
+        spoken += f" {int(cents)} {minor}"
+    return spoken
+
+
+def _expand_abbreviation(match) -> str:
+    abbreviation = match.group(1)
+    expansion = ABBREVIATIONS[abbreviation]
+    if abbreviation in _SENTENCE_FINAL_ABBREVIATIONS:
+        rest = match.string[match.end():]
+        if not rest.strip() or re.match(r"\s+[A-Z\"“]", rest):
+            return expansion + "."
+    return expansion
+
+
+def normalize_text(text: str, language: str = "en") -> str:
+    """Clean up text for synthesis; language is an espeak voice or locale ("en-us", "en_US")."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _URL_RE.sub(_spoken_url, text)
+    if re.split(r"[-_]", language)[0].lower() == "en":
+        text = _ABBREVIATION_RE.sub(_expand_abbreviation, text)
+        text = _THOUSANDS_RE.sub("", text)
+        text = _CURRENCY_RE.sub(_spoken_amount, text)
+        text = _PERCENT_RE.sub(r"\1 percent", text)
+        text = _RANGE_RE.sub(r"\1 to \2", text)
+    # Collapse runs of spaces and tabs, keep paragraph breaks
+    text = _SPACES_RE.sub(" ", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text)
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+def split_units(text: str) -> list:
+    """Split text into sentences at . ! ? and blank lines (not after abbreviations such as "Dr." or "U.S.")."""
+    units = []
+    pending = ""
+    for part in _SENTENCE_END_RE.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        pending = f"{pending} {part}" if pending else part
+        if not _NON_FINAL_RE.search(pending):
+            units.append(pending)
+            pending = ""
+    if pending:
+        units.append(pending)
+    return units
+
+
+def synthesis_units(text: str, language: str = "en") -> list:
+    """Normalized sentences of text, the unit synthesis and the caches work in."""
+    return split_units(normalize_text(text, language))
+
+
+class PhonemeCache:
+    """LRU of (voice language, sentence) -> phonemes, as returned by PiperVoice.phonemize."""
+
+    def __init__(self, max_size: int = PHONEME_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            phonemes = self._entries.get(key)
+            if phonemes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        count_cache("phonemes", phonemes is not None)
+        return phonemes
+
+    def put(self, key, phonemes):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = phonemes
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+phoneme_cache = PhonemeCache()
+
+
+def language_key(voice) -> tuple:
+    """Everything besides the text that the voice's phonemes depend on."""
+    config = voice.config
+    phoneme_type = getattr(config.phoneme_type, "value", config.phoneme_type)
+    return (str(phoneme_type), config.espeak_voice, bool(getattr(voice, "use_tashkeel", False)))
+
+
+def cache_phonemes(voice):
+    """Make the voice look up phonemes in the shared cache before running espeak.
+
+    Phonemes rather than phoneme IDs are cached: IDs come from each model's
+    own phoneme map and are cheap to compute, while phonemes are shared by
+    every voice of a language.
+    """
+    phonemize = voice.phonemize
+    language = language_key(voice)
+
+    def cached_phonemize(text: str):
+        key = (language, text)
+        phonemes = phoneme_cache.get(key)
+        if phonemes is None:
+            phonemes = phonemize(text)
+            phoneme_cache.put(key, phonemes)
+        # Callers may extend the lists; hand out copies
+        return [list(sentence) for sentence in phonemes]
+
+    voice.phonemize = cached_phonemize
+    return voice
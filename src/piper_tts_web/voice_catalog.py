@@ -0,0 +1,148 @@
+"""Cached catalog of the voices available in Firebase Storage.
+
+The catalog is built from a single listing of the models folder. On refresh
+only voices whose .onnx.json generation changed are downloaded again, and
+refreshes after the first one happen in a background thread so /voices never
+waits on the bucket once the catalog is warm.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger("piper_tts_web")
+
+VOICE_CATALOG_TTL = float(os.environ.get("PIPER_VOICE_CATALOG_TTL", "300"))
+VOICE_CATALOG_PATH = os.environ.get("PIPER_VOICE_CATALOG_PATH")
+
+
+class VoiceCatalog:
+    """In-memory voice list with TTL, incremental refresh and an ETag."""
+
+    def __init__(self, models_path: str, ttl: float = VOICE_CATALOG_TTL, persist_path=VOICE_CATALOG_PATH):
+        self.models_path = models_path
+        self.ttl = ttl
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.voices = []
+        self.etag = None
+        self.refreshed_at = 0.0
+        # onnx blob name -> {"generation", "json_generation", "voice"}
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Held for the duration of a refresh so only one lists the bucket at a time
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._load_from_disk()
+
+    def get(self, bucket):
+        """Return (voices, etag), refreshing synchronously only if nothing is cached yet."""
+        if self.etag is None:
+            self.refresh(bucket)
+        elif time.time() - self.refreshed_at > self.ttl:
+            self.refresh_in_background(bucket)
+        return self.voices, self.etag
+
+    def refresh_in_background(self, bucket):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(bucket)
+            except Exception as e:
+                logger.error(f"Background voice catalog refresh failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="voice-catalog-refresh", daemon=True).start()
+
+    def refresh(self, bucket):
+        """List the models folder once and re-fetch metadata only for changed voices.
+
+        A call that had to wait for another refresh returns once that one is
+        done instead of listing the bucket again.
+        """
+        requested_at = time.time()
+        with self._refresh_lock:
+            if self.refreshed_at >= requested_at:
+                return
+            self._refresh(bucket)
+
+    def _refresh(self, bucket):
+        blobs = {blob.name: blob for blob in bucket.list_blobs(prefix=self.models_path)}
+        onnx_names = [name for name in blobs if name.endswith('.onnx') and not name.endswith('.onnx.json')]
+
+        entries = {}
+        fetched = 0
+        for onnx_blob_name in sorted(onnx_names):
+            base_name = Path(onnx_blob_name).stem
+            json_blob = blobs.get(f"{self.models_path}{base_name}.onnx.json")
+            if json_blob is None:
+                logger.warning(f"No JSON file found for {onnx_blob_name}")
+                continue
+            previous = self._entries.get(onnx_blob_name)
+            if (
+                previous
+                and previous["generation"] == blobs[onnx_blob_name].generation
+                and previous["json_generation"] == json_blob.generation
+            ):
+                entries[onnx_blob_name] = previous
+                continue
+            try:
+                voice_info = json.loads(json_blob.download_as_bytes())
+                fetched += 1
+            except Exception as e:
+                logger.error(f"Error processing voice {onnx_blob_name}: {e}")
+                continue
+            language_code = base_name.split("-")[0]
+            entries[onnx_blob_name] = {
+                "generation": blobs[onnx_blob_name].generation,
+                "json_generation": json_blob.generation,
+                "voice": {
+                    "name": base_name,
+                    "language": language_code,
+                    "description": voice_info.get("description", "No description available"),
+                },
+            }
+
+        voices = [entry["voice"] for entry in entries.values()]
+        etag = '"' + hashlib.md5(json.dumps(voices, sort_keys=True).encode()).hexdigest() + '"'
+        with self._lock:
+            self._entries = entries
+            self.voices = voices
+            self.etag = etag
+            self.refreshed_at = time.time()
+        logger.info(f"Voice catalog refreshed: {len(voices)} voices, {fetched} metadata files fetched")
+        self._save_to_disk()
+
+    def _load_from_disk(self):
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            with open(self.persist_path) as f:
+                data = json.load(f)
+            self._entries = data["entries"]
+            self.voices = [entry["voice"] for entry in self._entries.values()]
+            self.etag = data["etag"]
+            # Serve the persisted list right away, but refresh it on first use
+            self.refreshed_at = 0.0
+            logger.info(f"Loaded {len(self.voices)} voices from {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Could not load voice catalog from {self.persist_path}: {e}")
+
+    def _save_to_disk(self):
+        if not self.persist_path:
+            return
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_name(f".{self.persist_path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"entries": self._entries, "etag": self.etag}, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logger.warning(f"Could not persist voice catalog to {self.persist_path}: {e}")
@@ -0,0 +1,85 @@
+"""Startup warmup of the most used voices, and the readiness it reports.
+
+Each worker downloads (into the shared model cache), loads and runs a short
+synthesis with the configured voices before /readyz reports it ready, so a
+load balancer only sends traffic to workers that won't pay a cold start.
+"""
+import logging
+import os
+import threading
+import time
+
+from .engine import MAX_LOADED_VOICES
+
+logger = logging.getLogger("piper_tts_web")
+
+# Voices warmed on every worker, e.g. "en_US-amy-medium,de_DE-thorsten-medium"
+WARMUP_VOICES = [voice.strip() for voice in os.environ.get("PIPER_WARMUP_VOICES", "").split(",") if voice.strip()]
+# Also warm the N voices with the most recordings
+WARMUP_TOP_N = int(os.environ.get("PIPER_WARMUP_TOP_N", "0"))
+WARMUP_TEXT = os.environ.get("PIPER_WARMUP_TEXT", "Hello.")
+# A worker reports ready after this many seconds even if warmup hasn't finished
+WARMUP_TIMEOUT = float(os.environ.get("PIPER_WARMUP_TIMEOUT", "300"))
+
+
+def select_warmup_voices(voice_counts=None, voices=None, top_n: int = WARMUP_TOP_N, max_voices: int = MAX_LOADED_VOICES) -> list:
+    """Explicit voices first, then the most used ones, limited to what stays loaded."""
+    selected = list(dict.fromkeys(WARMUP_VOICES if voices is None else voices))
+    if top_n > 0 and voice_counts:
+        ranked = sorted(voice_counts.items(), key=lambda item: item[1], reverse=True)
+        for voice, _ in ranked[:top_n]:
+            if voice not in selected:
+                selected.append(voice)
+    if len(selected) > max_voices:
+        # Loading more than the voice pool keeps would just evict the first ones again
+        logger.warning(f"Warming only {max_voices} of {len(selected)} voices (PIPER_MAX_LOADED_VOICES)")
+        selected = selected[:max_voices]
+    return selected
+
+
+class WarmupState:
+    """Progress of this worker's warmup, as reported by /readyz."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.finished_at = None
+        self.timed_out = False
+        self.voices = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    def start(self, voices):
+        with self._lock:
+            self.started_at = time.time()
+            self.finished_at = None
+            self.timed_out = False
+            self.voices = {voice: {"status": "pending"} for voice in voices}
+
+    def voice_done(self, voice: str, seconds: float, error=None):
+        with self._lock:
+            if error is None:
+                self.voices[voice] = {"status": "ready", "seconds": round(seconds, 3)}
+            else:
+                self.voices[voice] = {"status": "failed", "seconds": round(seconds, 3), "error": str(error)}
+
+    def finish(self, timed_out: bool = False):
+        with self._lock:
+            self.finished_at = time.time()
+            self.timed_out = timed_out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "ready": self.ready,
+                "pid": os.getpid(),
+                "seconds": round(end - self.started_at, 3) if self.started_at else None,
+                "timed_out": self.timed_out,
+                "voices": {voice: dict(info) for voice, info in self.voices.items()},
+            }
+
+
+warmup_state = WarmupState()
@@ -5,8 +5,14 @@ set -e
 
 echo "Starting Basic TTS Web Application..."
 
+# Workers write their metrics here so /metrics can report totals for all of them
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/piper_tts_web_metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 echo "Starting server..."
 exec gunicorn piper_tts_web.server:app \
+    --config python:piper_tts_web.gunicorn_conf \
     --workers 4 \
     --worker-class uvicorn.workers.UvicornWorker \
     --bind 0.0.0.0:8000 \
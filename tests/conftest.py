@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+# Local stand-ins for Firebase and RevenueCat, shared with the benchmarks
+sys.path.insert(0, str(ROOT / "benchmarks"))
@@ -0,0 +1,32 @@
+"""Auth caches and the superuser-only diagnostic endpoints."""
+import pytest
+from fastapi.testclient import TestClient
+
+import fake_app
+from fake_app import server
+from piper_tts_web.auth_cache import RoleCache
+
+DIAGNOSTICS = ["/auth-cache", "/revenuecat/cache", "/fragment-cache", "/memory", "/synthesis-queue"]
+
+
+def test_role_cache_drops_least_recently_used():
+    cache = RoleCache("test", ttl=60, max_size=2)
+    cache.get("a", lambda uid: True)
+    cache.get("b", lambda uid: False)
+    cache.get("a", lambda uid: pytest.fail("a should be cached"))
+    cache.get("c", lambda uid: False)
+    assert cache.stats()["size"] == 2
+    loads = []
+    cache.get("b", loads.append)
+    assert loads == ["b"]
+
+
+@pytest.mark.parametrize("path", DIAGNOSTICS)
+def test_diagnostics_are_for_superusers_only(path):
+    fake_app.install()
+    client = TestClient(server.app)
+    assert client.get(path).status_code == 401
+    user = {"Authorization": f"Bearer {fake_app.token_for('bench-user0')}"}
+    assert client.get(path, headers=user).status_code == 403
+    admin = {"Authorization": f"Bearer {fake_app.token_for(fake_app.SUPERUSER_UID)}"}
+    assert client.get(path, headers=admin).status_code == 200
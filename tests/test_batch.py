@@ -0,0 +1,86 @@
+"""/synthesize/batch: deduplication, several voices and per-item failures."""
+import pytest
+from fastapi.testclient import TestClient
+
+import fake_app
+from fake_app import server
+
+VOICE_A = "xx_BENCH-voice00000-low"
+VOICE_B = "xx_BENCH-voice00001-low"
+UID = "bench-user0"
+ONE_SECOND = b"\0\0" * 22050
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    bucket, db = fake_app.install()
+    fake_app.seed_catalog_voices(bucket, 2)
+    calls = []
+
+    async def render_pcm_many(voice_name, onnx_blob, json_blob, texts, uid):
+        calls.append((voice_name, list(texts)))
+        # An empty rendering makes that item's encode fail
+        return [(b"" if text == "Broken." else ONE_SECOND, 22050) for text in texts]
+
+    encode_pcm = server.encode_pcm
+
+    async def failing_encode_pcm(pcm, sample_rate, audio_format):
+        if not pcm:
+            raise ValueError("nothing to encode")
+        return await encode_pcm(pcm, sample_rate, audio_format)
+
+    async def not_subscribed(uid):
+        return False
+
+    monkeypatch.setattr(server, "render_pcm_many", render_pcm_many)
+    monkeypatch.setattr(server, "encode_pcm", failing_encode_pcm)
+    monkeypatch.setattr(server, "check_revenuecat_subscription", not_subscribed)
+    return calls, db
+
+
+def synthesize_batch(items):
+    client = TestClient(server.app)
+    return client.post(
+        "/synthesize/batch",
+        json={"items": [{"text": text, "voice": voice} for voice, text in items]},
+        headers={"Authorization": f"Bearer {fake_app.token_for(UID)}"},
+    )
+
+
+def test_duplicates_are_rendered_once_per_voice(rendered):
+    calls, db = rendered
+    response = synthesize_batch([(VOICE_A, "Hello."), (VOICE_B, "Hello."), (VOICE_A, "Hello."), (VOICE_B, "Bye.")])
+    assert response.status_code == 200
+
+    items = response.json()["items"]
+    assert [item["index"] for item in items] == [0, 1, 2, 3]
+    assert [item["voice"] for item in items] == [VOICE_A, VOICE_B, VOICE_A, VOICE_B]
+    assert all(item["duration"] == 1.0 for item in items)
+    assert items[0]["audioUrl"] == items[2]["audioUrl"] != items[1]["audioUrl"]
+    assert sorted(calls) == [(VOICE_A, ["Hello."]), (VOICE_B, ["Hello.", "Bye."])]
+    assert db._docs[f"{server.USAGE_COLLECTION}/{UID}"]["recordings_count"] == 3
+
+
+def test_a_failing_item_does_not_fail_the_others(rendered):
+    _, db = rendered
+    response = synthesize_batch([
+        (VOICE_A, "Hello."), (VOICE_A, "Broken."), ("xx_BENCH-missing-low", "Hello."), (VOICE_B, "Hello."),
+    ])
+    assert response.status_code == 200
+
+    items = response.json()["items"]
+    assert "audioUrl" in items[0] and "audioUrl" in items[3]
+    assert items[1]["status"] == 500 and "nothing to encode" in items[1]["error"]
+    assert items[2]["status"] == 404
+    # Only the rendered items are recorded and counted
+    assert db._docs[f"{server.USAGE_COLLECTION}/{UID}"]["recordings_count"] == 2
+
+
+def test_item_limit(rendered, monkeypatch):
+    monkeypatch.setattr(server, "MAX_BATCH_ITEMS", 3)
+    assert synthesize_batch([(VOICE_A, f"Sentence {i}.") for i in range(3)]).status_code == 200
+
+    response = synthesize_batch([(VOICE_A, f"Sentence {i}.") for i in range(4)])
+    assert response.status_code == 400
+    assert "at most 3" in response.json()["detail"]
+    assert synthesize_batch([]).status_code == 400
@@ -0,0 +1,75 @@
+"""Dashboard facets: seeding from existing recordings and rebuilds."""
+import asyncio
+
+import pytest
+
+import fake_app
+from fake_app import server
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(server, "FACET_SHARDS", 4)
+    _, db = fake_app.install()
+    return db
+
+
+def legacy_recording(db, uid, recording_id, voice, duration):
+    doc = server.build_recording_doc(uid, voice, "Hello there.", recording_id, "url", "path", duration, 1)
+    db.put(f"users/{uid}/recordings/{recording_id}", doc)
+
+
+def test_first_read_counts_recordings_made_before_the_facets(db):
+    legacy_recording(db, "u1", "old1", "voice-a", 10)
+    legacy_recording(db, "u2", "old2", "voice-b", 20)
+    # The first write after deploy creates a shard holding only its own counts
+    server.write_user_recording("u1", "new1", server.build_recording_doc("u1", "voice-a", "Hi.", "new1", "url", "path", 5, 1))
+
+    facets = server.read_dashboard_facets()
+    assert facets["total_count"] == 3
+    assert facets["total_duration"] == 35
+    assert facets["voices"] == {"voice-a": 2, "voice-b": 1}
+
+    # Seeded once; later writes are counted incrementally
+    server.write_user_recording("u2", "new2", server.build_recording_doc("u2", "voice-b", "Yo.", "new2", "url", "path", 1, 1))
+    assert server.read_dashboard_facets()["voices"] == {"voice-a": 2, "voice-b": 2}
+    assert db.document("dashboardFacets/meta").get().get("seeded")
+
+
+def test_rebuild_corrects_drift_with_increments(db):
+    legacy_recording(db, "u1", "r1", "voice-a", 10)
+    server.read_dashboard_facets()
+    db.put("dashboardFacets/shard-2", {"total_count": 5, "total_duration": 3, "voices": {"voice-z": 5}})
+    assert server.read_dashboard_facets()["total_count"] == 6
+
+    facets = server.rebuild_dashboard_facets()
+    assert facets["total_count"] == 1
+    current = server.read_dashboard_facets()
+    assert current["total_count"] == 1
+    assert current["total_duration"] == 10
+    assert {voice: count for voice, count in current["voices"].items() if count} == {"voice-a": 1}
+    # The shard another writer incremented is left alone
+    assert db.document("dashboardFacets/shard-2").get().get("total_count") == 5
+
+
+def test_only_one_worker_holds_the_rebuild_lease(db):
+    assert server._claim_facet_rebuild()
+    assert not server._claim_facet_rebuild()
+    server.rebuild_dashboard_facets()
+    assert server._claim_facet_rebuild()
+
+
+def test_warmup_never_seeds_the_facets(db, monkeypatch):
+    legacy_recording(db, "u1", "r1", "voice-a", 10)
+    monkeypatch.setattr(server, "WARMUP_TOP_N", 3)
+    seen = []
+    monkeypatch.setattr(server, "select_warmup_voices", lambda voice_counts: seen.append(voice_counts) or [])
+
+    assert server.read_dashboard_facets(seed=False) is None
+    asyncio.run(server.run_warmup())
+    assert seen == [None]
+    assert not db.document("dashboardFacets/meta").get().exists
+
+    server.read_dashboard_facets()
+    asyncio.run(server.run_warmup())
+    assert seen[-1] == {"voice-a": 1}
@@ -0,0 +1,54 @@
+"""Dashboard recordings: page numbers agree with the filters applied after the query."""
+import pytest
+
+import fake_app
+from fake_app import server
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(server, "search_index", None)
+    _, db = fake_app.install()
+    fake_app.seed_recordings(db, 400, users=50)
+    # 40 users match "benchmark", too many for an "in" filter; the others' recordings are dropped per page
+    for u in range(40, 50):
+        db.put(f"users/bench-user{u}", {"email": f"user{u}@example.invalid"})
+    return db
+
+
+def ids(page):
+    return [recording["id"] for recording in page["recordings"]]
+
+
+def listing(limit, filters, by_cursor):
+    """Every page of the listing, followed by next_cursor or by page number."""
+    found = []
+    page_number, cursor = 1, None
+    while True:
+        page = server.query_dashboard_recordings(
+            page_number, limit, filters.get("search"), None, filters.get("user_email"), None, cursor
+        )
+        found.extend(ids(page))
+        if not page["pagination"]["has_next"]:
+            return found
+        page_number += 1
+        if by_cursor:
+            cursor = page["pagination"]["next_cursor"]
+
+
+@pytest.mark.parametrize("filters", [
+    {"search": "the quick"},        # the second word is checked on each page
+    {"user_email": "benchmark"},    # more than 30 users are checked on each page
+])
+def test_page_numbers_with_residual_filters(db, filters):
+    by_cursor = listing(7, filters, by_cursor=True)
+    assert len(by_cursor) > 20
+    assert len(set(by_cursor)) == len(by_cursor)
+    assert listing(7, filters, by_cursor=False) == by_cursor
+
+
+def test_too_deep_without_a_cursor(db, monkeypatch):
+    monkeypatch.setattr(server, "DASHBOARD_MAX_SCAN", 50)
+    with pytest.raises(server.HTTPException) as error:
+        server.query_dashboard_recordings(30, 10, "the quick", None, None, None, None)
+    assert error.value.status_code == 400
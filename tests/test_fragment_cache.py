@@ -0,0 +1,17 @@
+"""Fragment cache: stored sentences read back, damaged files count as misses."""
+from piper_tts_web.fragment_cache import FragmentCache
+
+
+def test_fragments_read_back(tmp_path):
+    cache = FragmentCache(tmp_path, max_bytes=1024 ** 2, spill=False)
+    key = cache.key("en_US-test-medium", 1, "Hello there.")
+    cache.write(key, b"\x01\x00" * 100, 22050)
+    assert cache.read(key) == (b"\x01\x00" * 100, 22050)
+
+
+def test_corrupt_fragment_is_a_miss(tmp_path):
+    cache = FragmentCache(tmp_path, max_bytes=1024 ** 2, spill=False)
+    key = cache.key("en_US-test-medium", 1, "Hello there.")
+    (tmp_path / f"{key}.wav").write_bytes(b"RIFF\x00\x00")
+    assert cache.read(key) is None
+    assert not (tmp_path / f"{key}.wav").exists()
@@ -0,0 +1,144 @@
+"""Synthesis jobs: admission control, the piper CLI fallback and orphaned jobs."""
+import asyncio
+import time
+
+import pytest
+
+import fake_app
+from fake_app import server
+from piper_tts_web.engine import pcm_to_wav_bytes
+from piper_tts_web.jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobStore, SQLiteJobStore, new_job
+from piper_tts_web.scheduler import SynthesisScheduler
+
+VOICE = "xx_BENCH-voice00000-low"
+
+
+@pytest.fixture
+def store(monkeypatch):
+    bucket, _ = fake_app.install()
+    fake_app.seed_catalog_voices(bucket, 1)
+    store = SQLiteJobStore(":memory:")
+    monkeypatch.setattr(server, "job_store", store)
+
+    async def not_subscribed(uid):
+        return False
+
+    monkeypatch.setattr(server, "check_revenuecat_subscription", not_subscribed)
+    return store
+
+
+def run_job(store, text="Hello there. How are you?"):
+    job = store.create(new_job("bench-user0", VOICE, text))
+    onnx_blob, json_blob = server.get_voice_blobs(VOICE)
+    asyncio.run(server.run_synthesis_job(job["id"], "bench-user0", VOICE, text, onnx_blob, json_blob))
+    return store.get(job["id"])
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+
+def test_jobs_wait_in_the_synthesis_queue(store, monkeypatch):
+    scheduler = SynthesisScheduler(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(server, "synthesis_scheduler", scheduler)
+
+    async def run_while_busy():
+        slot = await scheduler.acquire()
+        job = store.create(new_job("bench-user0", VOICE, "Hello there."))
+        onnx_blob, json_blob = server.get_voice_blobs(VOICE)
+        await server.run_synthesis_job(job["id"], "bench-user0", VOICE, "Hello there.", onnx_blob, json_blob)
+        slot.release()
+        return store.get(job["id"])
+
+    job = asyncio.run(run_while_busy())
+    assert job["status"] == JOB_FAILED
+    assert "Too many requests" in job["error"]
+    assert scheduler.stats()["rejected_total"] == 1
+
+
+def test_jobs_fall_back_to_the_piper_cli(store, monkeypatch):
+    monkeypatch.setattr(type(server.voice_pool), "available", property(lambda self: False))
+    texts = []
+
+    async def piper_cli(model_path, text):
+        texts.append(text)
+        return pcm_to_wav_bytes(b"\0\0" * 22050, 22050)
+
+    monkeypatch.setattr(server, "synthesize_with_piper_cli", piper_cli)
+    job = run_job(store)
+    assert job["status"] == JOB_SUCCEEDED, job["error"]
+    assert job["duration"] == 1.0
+    assert job["sentences_done"] == 2
+    assert texts == ["Hello there. How are you?"]
+    assert server.synthesis_scheduler.stats()["active"] == 0
+
+
+def test_stale_unfinished_jobs_are_failed():
+    store = SQLiteJobStore(":memory:")
+    stale_running = store.create({**new_job("u1", VOICE, "a"), "status": JOB_RUNNING})
+    stale_queued = store.create(new_job("u1", VOICE, "b"))
+    fresh = store.create({**new_job("u1", VOICE, "c"), "status": JOB_RUNNING})
+    done = store.create({**new_job("u1", VOICE, "d"), "status": JOB_SUCCEEDED})
+    with store._lock:
+        for job in (stale_running, stale_queued, done):
+            store._conn.execute("UPDATE synthesis_jobs SET updated = ? WHERE id = ?", (time.time() - 3600, job["id"]))
+
+    assert sorted(store.fail_stale("restarted", max_age=600)) == sorted([stale_running["id"], stale_queued["id"]])
+    for job in (stale_running, stale_queued):
+        assert store.get(job["id"])["status"] == JOB_FAILED
+        assert store.get(job["id"])["error"] == "restarted"
+    assert store.get(fresh["id"])["status"] == JOB_RUNNING
+    assert store.get(done["id"])["status"] == JOB_SUCCEEDED
+
+
+def test_jobs_waiting_for_a_slot_keep_their_heartbeat(store, monkeypatch):
+    monkeypatch.setattr(server, "JOB_HEARTBEAT_SECONDS", 0.05)
+    scheduler = SynthesisScheduler(max_concurrent=1, max_queue=1)
+    monkeypatch.setattr(server, "synthesis_scheduler", scheduler)
+    job = store.create(new_job("bench-user0", VOICE, "Hello there."))
+
+    async def wait_then_release():
+        held = await scheduler.acquire()
+        waiting = asyncio.ensure_future(server.with_job_heartbeat(job["id"], server.acquire_synthesis_slot("bench-user0")))
+        await asyncio.sleep(0.3)
+        assert store.get(job["id"])["updated"] > time.time() - 0.2
+        held.release()
+        (await waiting).release()
+
+    asyncio.run(wait_then_release())
+    assert store.get(job["id"])["status"] == JOB_QUEUED
+    assert scheduler.stats()["active"] == 0
+
+
+def test_broken_process_pool_falls_back_for_the_remaining_sentences(store, monkeypatch):
+    from concurrent.futures import Future
+    from concurrent.futures.process import BrokenProcessPool
+
+    pool = server.synthesis_pool
+    monkeypatch.setattr(pool, "should_split", lambda text: True)
+    resets = []
+    monkeypatch.setattr(pool, "reset", lambda: resets.append(True))
+
+    def submit(key, model_path, unit):
+        future = Future()
+        if unit == "Hello there.":
+            future.set_result((b"\0\0" * 22050, 22050))
+        else:
+            future.set_exception(BrokenProcessPool("a worker died"))
+        return future
+
+    monkeypatch.setattr(pool, "submit", submit)
+    monkeypatch.setattr(type(server.voice_pool), "available", property(lambda self: False))
+    texts = []
+
+    async def piper_cli(model_path, text):
+        texts.append(text)
+        return pcm_to_wav_bytes(b"\0\0" * 44100, 22050)
+
+    monkeypatch.setattr(server, "synthesize_with_piper_cli", piper_cli)
+    job = run_job(store, "Hello there. How are you? Fine.")
+    assert job["status"] == JOB_SUCCEEDED, job["error"]
+    assert job["duration"] == 3.0
+    assert texts == ["How are you? Fine."]
+    assert resets == [True]
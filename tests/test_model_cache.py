@@ -0,0 +1,110 @@
+"""Model cache: shared downloads, checksum checks and eviction."""
+import os
+import threading
+
+import pytest
+
+from fakes import FakeBucket
+from piper_tts_web.model_cache import ModelCache
+
+MODEL = b"onnx-weights" * 100
+
+
+@pytest.fixture
+def bucket():
+    bucket = FakeBucket(latency=0.02)
+    bucket.put("models/voice-a.onnx", MODEL)
+    bucket.put("models/voice-a.onnx.json", b"{}")
+    return bucket
+
+
+def blobs(bucket, voice="voice-a"):
+    return bucket.get_blob(f"models/{voice}.onnx"), bucket.blob(f"models/{voice}.onnx.json")
+
+
+def counting_downloads(cache):
+    downloads = []
+    download = cache._download
+
+    def counted(blob, dest, expected_md5=None):
+        downloads.append(blob.name)
+        return download(blob, dest, expected_md5=expected_md5)
+
+    cache._download = counted
+    return downloads
+
+
+def test_concurrent_fetches_download_once(bucket, tmp_path):
+    cache = ModelCache(tmp_path)
+    downloads = counting_downloads(cache)
+    paths = []
+
+    def fetch():
+        # Each worker has its own blob objects
+        paths.append(cache.fetch("voice-a", *blobs(bucket)))
+
+    threads = [threading.Thread(target=fetch) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(paths)) == 1 and len(paths) == 6
+    assert paths[0].read_bytes() == MODEL
+    assert downloads == ["models/voice-a.onnx.json", "models/voice-a.onnx"]
+
+
+def test_checksum_mismatch_is_not_cached_and_downloads_again(bucket, tmp_path):
+    cache = ModelCache(tmp_path)
+    downloads = counting_downloads(cache)
+    onnx_blob, json_blob = blobs(bucket)
+    stored = bucket._objects["models/voice-a.onnx"]
+    stored["data"] = MODEL[:-10]  # a truncated transfer
+
+    with pytest.raises(IOError, match="Checksum mismatch"):
+        cache.fetch("voice-a", onnx_blob, json_blob)
+    assert not cache.is_cached("voice-a", onnx_blob.generation)
+    assert not list(tmp_path.glob("*.tmp"))
+
+    stored["data"] = MODEL
+    path = cache.fetch("voice-a", onnx_blob, json_blob)
+    assert path.read_bytes() == MODEL
+    assert downloads.count("models/voice-a.onnx") == 2
+
+
+def test_new_generation_is_downloaded_only_if_its_content_changed(bucket, tmp_path):
+    cache = ModelCache(tmp_path)
+    downloads = counting_downloads(cache)
+    old_path = cache.fetch("voice-a", *blobs(bucket))
+
+    # Re-uploaded unchanged: the cached file is renamed to the new generation
+    bucket.put("models/voice-a.onnx", MODEL)
+    same_path = cache.fetch("voice-a", *blobs(bucket))
+    assert same_path != old_path and not old_path.exists()
+    assert downloads.count("models/voice-a.onnx") == 1
+
+    # Re-uploaded with new weights: the old file's md5 no longer matches
+    bucket.put("models/voice-a.onnx", MODEL + b"v2")
+    new_path = cache.fetch("voice-a", *blobs(bucket))
+    assert new_path.read_bytes() == MODEL + b"v2"
+    assert downloads.count("models/voice-a.onnx") == 2
+
+
+def test_least_recently_used_models_are_evicted(bucket, tmp_path):
+    for voice in ("voice-b", "voice-c"):
+        bucket.put(f"models/{voice}.onnx", MODEL)
+        bucket.put(f"models/{voice}.onnx.json", b"{}")
+    # Room for two models with their configs
+    cache = ModelCache(tmp_path, max_bytes=2 * (len(MODEL) + 2))
+
+    path_a = cache.fetch("voice-a", *blobs(bucket, "voice-a"))
+    path_b = cache.fetch("voice-b", *blobs(bucket, "voice-b"))
+    os.utime(path_a, (1000, 1000))
+    os.utime(path_b, (2000, 2000))
+    # Using voice-a again makes voice-b the least recently used
+    assert cache.fetch("voice-a", *blobs(bucket, "voice-a")) == path_a
+
+    path_c = cache.fetch("voice-c", *blobs(bucket, "voice-c"))
+    assert path_a.exists() and path_c.exists()
+    assert not path_b.exists()
+    assert not os.path.exists(f"{path_b}.json")
@@ -0,0 +1,149 @@
+"""RevenueCat lookups and the entitlement cache, against a local stub of the API."""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from fakes import RevenueCatStub
+from piper_tts_web import revenuecat
+from piper_tts_web.revenuecat import EntitlementCache, RevenueCatClient, active_until
+
+
+@pytest.fixture
+def stub():
+    stub = RevenueCatStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def client(stub, tmp_path):
+    return RevenueCatClient(stub.url, "test-key", EntitlementCache(invalidation_dir=tmp_path))
+
+
+def lookup(client, *uids):
+    async def run():
+        try:
+            return await asyncio.gather(*(client.has_active_entitlement(uid) for uid in uids))
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+
+def cached_ttl(client, uid) -> float:
+    return client.cache._entries[uid][1] - time.time()
+
+
+def iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def test_active_until_iso_expiry():
+    expires = int(time.time()) + 3600
+    assert active_until({"entitlements": {"pro": {"expires_date": iso(expires)}}}) == (True, expires)
+    assert active_until({"entitlements": {"pro": {"expires_date": iso(time.time() - 60)}}}) == (False, None)
+
+
+def test_active_until_millisecond_expiry():
+    expires_ms = int((time.time() + 3600) * 1000)
+    assert active_until({"entitlements": {"pro": {"expires_date": expires_ms}}}) == (True, expires_ms / 1000)
+    assert active_until({"entitlements": {"pro": {"expires_date": expires_ms - 7200 * 1000}}}) == (False, None)
+
+
+def test_active_until_latest_and_lifetime():
+    soon, later = time.time() + 60, time.time() + 600
+    entitlements = {"a": {"expires_date": iso(soon)}, "b": {"expires_date": int(later * 1000)}}
+    active, until = active_until({"entitlements": entitlements})
+    assert active and until == pytest.approx(later, abs=1)
+    entitlements["c"] = {"expires_date": None}
+    assert active_until({"entitlements": entitlements}) == (True, None)
+    assert active_until({}) == (False, None)
+
+
+def test_positive_ttl_ends_with_the_entitlement(stub, client):
+    stub.expires["soon"] = int((time.time() + 120) * 1000)
+    stub.expires["later"] = iso(time.time() + 10 * revenuecat.ENTITLEMENT_MAX_TTL)
+    stub.active.add("lifetime")
+    assert lookup(client, "soon", "later", "lifetime") == [True, True, True]
+    assert cached_ttl(client, "soon") == pytest.approx(120, abs=2)
+    assert cached_ttl(client, "later") == pytest.approx(revenuecat.ENTITLEMENT_MAX_TTL, abs=2)
+    assert cached_ttl(client, "lifetime") == pytest.approx(revenuecat.ENTITLEMENT_MAX_TTL, abs=2)
+    # Served from the cache
+    assert lookup(client, "soon") == [True]
+    assert stub.requests == 3
+
+
+def test_negative_ttl(stub, client):
+    stub.expires["lapsed"] = iso(time.time() - 60)
+    assert lookup(client, "free", "lapsed") == [False, False]
+    assert cached_ttl(client, "free") == pytest.approx(revenuecat.ENTITLEMENT_NEGATIVE_TTL, abs=2)
+    assert cached_ttl(client, "lapsed") == pytest.approx(revenuecat.ENTITLEMENT_NEGATIVE_TTL, abs=2)
+
+
+def test_error_ttl(stub, client):
+    stub.failing.add("broken")
+    assert lookup(client, "broken") == [False]
+    assert cached_ttl(client, "broken") == pytest.approx(revenuecat.ENTITLEMENT_ERROR_TTL, abs=2)
+    assert lookup(client, "broken") == [False]
+    assert stub.requests == 1
+
+
+def test_unreachable_api_uses_error_ttl(tmp_path):
+    client = RevenueCatClient("http://127.0.0.1:9", "test-key", EntitlementCache(invalidation_dir=tmp_path))
+    assert lookup(client, "offline") == [False]
+    assert cached_ttl(client, "offline") == pytest.approx(revenuecat.ENTITLEMENT_ERROR_TTL, abs=2)
+
+
+def test_concurrent_lookups_share_one_call(stub, client):
+    stub.active.add("busy")
+    stub.latency = 0.2
+    assert lookup(client, *["busy"] * 10) == [True] * 10
+    assert stub.requests == 1
+
+
+def test_webhook_invalidates_entitlements(stub, client, monkeypatch):
+    from fastapi.testclient import TestClient
+    from piper_tts_web import server
+
+    monkeypatch.setattr(server, "revenuecat", client)
+    monkeypatch.setattr(server, "REVENUECAT_WEBHOOK_AUTH", "Bearer hook-secret")
+    stub.active.update({"subscriber", "alias"})
+    assert lookup(client, "subscriber", "alias", "bystander") == [True, True, False]
+
+    stub.active.clear()
+    event = {"event": {"type": "CANCELLATION", "app_user_id": "subscriber", "aliases": ["alias"]}}
+    app = TestClient(server.app)
+    assert app.post("/revenuecat/webhook", json=event).status_code == 401
+    response = app.post("/revenuecat/webhook", json=event, headers={"Authorization": "Bearer hook-secret"})
+    assert response.status_code == 200
+
+    assert client.cache.get("subscriber") is None
+    assert client.cache.get("alias") is None
+    assert client.cache.get("bystander") is False
+    assert lookup(client, "subscriber", "alias") == [False, False]
+    assert stub.requests == 5
+
+
+def test_webhook_invalidates_other_workers(stub, client, tmp_path):
+    other_worker = RevenueCatClient(stub.url, "test-key", EntitlementCache(invalidation_dir=tmp_path))
+    stub.active.add("subscriber")
+    assert lookup(client, "subscriber") == [True]
+    assert lookup(other_worker, "subscriber") == [True]
+
+    stub.active.clear()
+    client.invalidate("subscriber")
+    assert other_worker.cache.get("subscriber") is None
+    assert lookup(other_worker, "subscriber") == [False]
+    assert lookup(other_worker, "subscriber") == [False]
+    assert stub.requests == 3
+
+
+def test_invalidation_during_a_lookup_discards_its_result(tmp_path):
+    cache = EntitlementCache(invalidation_dir=tmp_path)
+    looked_up_at = time.time()
+    cache.invalidate("subscriber")
+    cache.set("subscriber", True, 600, looked_up_at)
+    assert cache.get("subscriber") is None
+    cache.set("subscriber", False, 60)
+    assert cache.get("subscriber") is False
@@ -0,0 +1,95 @@
+"""Synthesis admission: priorities, a full queue and cancelled waiters."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from fake_app import server
+from piper_tts_web.scheduler import PRIORITY_FREE, PRIORITY_SUBSCRIBER, QueueFullError, SynthesisScheduler
+
+
+def test_subscribers_are_served_first():
+    async def run():
+        scheduler = SynthesisScheduler(max_concurrent=1, max_queue=8)
+        served = []
+        running = await scheduler.acquire()
+
+        async def wait(name, priority):
+            slot = await scheduler.acquire(priority)
+            served.append(name)
+            slot.release()
+
+        waiters = [
+            asyncio.ensure_future(wait("free-1", PRIORITY_FREE)),
+            asyncio.ensure_future(wait("free-2", PRIORITY_FREE)),
+            asyncio.ensure_future(wait("subscriber", PRIORITY_SUBSCRIBER)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 3
+        running.release()
+        await asyncio.gather(*waiters)
+        return served, scheduler
+
+    served, scheduler = asyncio.run(run())
+    # Same priority keeps arrival order
+    assert served == ["subscriber", "free-1", "free-2"]
+    assert scheduler.active == 0
+    assert scheduler.stats()["admitted_total"] == 4
+
+
+def test_full_queue_is_rejected_with_retry_after(monkeypatch):
+    async def not_subscribed(uid):
+        return False
+
+    async def run():
+        scheduler = SynthesisScheduler(max_concurrent=1, max_queue=1, retry_after=7)
+        monkeypatch.setattr(server, "synthesis_scheduler", scheduler)
+        running = await server.acquire_synthesis_slot("u1")
+        waiting = asyncio.ensure_future(server.acquire_synthesis_slot("u2"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(QueueFullError):
+            await scheduler.acquire()
+        with pytest.raises(HTTPException) as rejected:
+            await server.acquire_synthesis_slot("u3")
+
+        running.release()
+        (await waiting).release()
+        return scheduler, rejected.value
+
+    monkeypatch.setattr(server, "check_revenuecat_subscription", not_subscribed)
+    scheduler, rejected = asyncio.run(run())
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "7"
+    assert scheduler.stats()["rejected_total"] == 2
+    assert scheduler.active == 0
+
+
+def test_cancelled_waiters_give_up_their_place():
+    async def run():
+        scheduler = SynthesisScheduler(max_concurrent=1, max_queue=8)
+        running = await scheduler.acquire()
+
+        # Cancelled while queued: it leaves the queue
+        queued = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert scheduler.queue_depth == 0
+
+        # Cancelled just as the slot is handed over: the slot goes to the next waiter
+        handed = asyncio.ensure_future(scheduler.acquire())
+        after = asyncio.ensure_future(scheduler.acquire())
+        await asyncio.sleep(0)
+        running.release()
+        handed.cancel()
+        await asyncio.gather(handed, return_exceptions=True)
+        slot = await asyncio.wait_for(after, 1)
+        assert scheduler.active == 1
+        slot.release()
+        slot.release()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.active == 0
+    assert scheduler.queue_depth == 0
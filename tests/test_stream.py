@@ -0,0 +1,68 @@
+"""/synthesize/stream: a client hanging up is not counted as an error."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import fake_app
+from fake_app import server
+from piper_tts_web import metrics
+
+VOICE = "xx_BENCH-voice00000-low"
+
+
+class FakeVoice:
+    config = SimpleNamespace(sample_rate=22050, espeak_voice="en-us")
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def synthesize(self, text):
+        for _ in range(3):
+            if self.fail:
+                raise RuntimeError("onnxruntime failed")
+            yield SimpleNamespace(audio_int16_bytes=b"\0\0" * 2205)
+
+
+def stream_errors(error_type: str) -> float:
+    return metrics.ERRORS.labels(endpoint="stream", type=error_type)._value.get()
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    bucket, _ = fake_app.install()
+    fake_app.seed_catalog_voices(bucket, 1)
+    monkeypatch.setattr(type(server.voice_pool), "available", property(lambda self: True))
+    monkeypatch.setattr(server.voice_pool, "is_loaded", lambda key: True)
+
+    def open_stream(voice):
+        monkeypatch.setattr(server.voice_pool, "get", lambda key, fetch: voice)
+        request = server.StreamingSynthesisRequest(text="One. Two. Three.", voice=VOICE, container="pcm")
+        return server.synthesize_speech_stream(request, uid=None)
+
+    return open_stream
+
+
+def test_hang_up_is_not_an_error(stream):
+    async def hang_up():
+        response = await stream(FakeVoice())
+        body = response.body_iterator
+        await body.__anext__()
+        await body.aclose()
+
+    before = stream_errors("GeneratorExit")
+    asyncio.run(hang_up())
+    assert stream_errors("GeneratorExit") == before
+    assert server.synthesis_scheduler.stats()["active"] == 0
+
+
+def test_synthesis_failure_is_an_error(stream):
+    async def consume():
+        response = await stream(FakeVoice(fail=True))
+        async for _ in response.body_iterator:
+            pass
+
+    before = stream_errors("RuntimeError")
+    with pytest.raises(RuntimeError):
+        asyncio.run(consume())
+    assert stream_errors("RuntimeError") == before + 1
@@ -0,0 +1,75 @@
+"""/synthesize: the recording and usage are stored before the response goes out."""
+import pytest
+from fastapi.testclient import TestClient
+
+import fake_app
+from fake_app import server
+
+VOICE = "xx_BENCH-voice00000-low"
+UID = "bench-user0"
+ONE_SECOND = b"\0\0" * 22050
+
+
+@pytest.fixture
+def env(monkeypatch):
+    bucket, db = fake_app.install()
+    fake_app.seed_catalog_voices(bucket, 1)
+
+    async def render_pcm(voice_name, onnx_blob, json_blob, text, uid):
+        return ONE_SECOND, 22050
+
+    async def not_subscribed(uid):
+        return False
+
+    monkeypatch.setattr(server, "render_pcm", render_pcm)
+    monkeypatch.setattr(server, "check_revenuecat_subscription", not_subscribed)
+    return bucket, db
+
+
+def synthesize(text: str):
+    client = TestClient(server.app)
+    return client.post(
+        "/synthesize",
+        json={"text": text, "voice": VOICE},
+        headers={"Authorization": f"Bearer {fake_app.token_for(UID)}"},
+    )
+
+
+def usage(db) -> dict:
+    return db._docs[f"{server.USAGE_COLLECTION}/{UID}"]
+
+
+def test_usage_is_stored_when_the_response_arrives(env, monkeypatch):
+    _, db = env
+    monkeypatch.setattr(server, "FREE_DURATION_SECONDS", 1.5)
+    first = synthesize("Hello there.")
+    assert first.status_code == 200
+    assert "show_paywall" not in first.json()
+    assert usage(db)["recordings_count"] == 1
+
+    # Same text again: the recording is overwritten, not counted twice
+    repeat = synthesize("Hello there.")
+    assert repeat.status_code == 200
+    assert "show_paywall" not in repeat.json()
+    assert usage(db)["recordings_count"] == 1
+    assert usage(db)["total_duration"] == 1.0
+
+    second = synthesize("Something else.")
+    assert second.json()["show_paywall"] is True
+    assert second.json()["usage"]["used_duration"] == usage(db)["total_duration"] == 2.0
+
+
+def test_failed_upload_leaves_no_dead_audio_url(env, monkeypatch):
+    _, db = env
+
+    def failing_upload(*args, **kwargs):
+        raise RuntimeError("storage unavailable")
+
+    monkeypatch.setattr(server, "upload_audio_bytes", failing_upload)
+    response = synthesize("Hello there.")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("audio/")
+    docs = [doc for path, doc in db._docs.items() if path.startswith(f"users/{UID}/recordings/")]
+    assert len(docs) == 1
+    assert docs[0]["audioUrl"] is None
+    assert usage(db)["recordings_count"] == 1
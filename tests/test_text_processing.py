@@ -0,0 +1,42 @@
+"""Text normalization and sentence splitting."""
+import pytest
+
+from piper_tts_web.text_processing import normalize_text, split_units, synthesis_units
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("It costs $5.", "It costs 5 dollars."),
+    ("It costs $5.50 today.", "It costs 5 dollars 50 cents today."),
+    ("Only £1.01.", "Only 1 pound 1 penny."),
+    ("It costs $5.5 today.", "It costs $5.5 today."),
+    ("Pi is about $3.14159.", "Pi is about $3.14159."),
+    ("A $1,250 fee.", "A 1250 dollars fee."),
+])
+def test_currency(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_splits_only_at_sentence_ends():
+    assert split_units("First: a list; of things. Second one! Third?") == [
+        "First: a list; of things.", "Second one!", "Third?",
+    ]
+
+
+def test_no_split_after_abbreviations_and_initials():
+    text = "The U.S. economy grew. Mt. Everest is tall. J. R. R. Tolkien wrote it. So did I. The end."
+    assert split_units(text) == [
+        "The U.S. economy grew.", "Mt. Everest is tall.", "J. R. R. Tolkien wrote it.", "So did I.", "The end.",
+    ]
+
+
+def test_english_abbreviations_are_expanded_before_splitting():
+    assert synthesis_units("Dr. Smith is here. Paragraph one.\n\nParagraph two.", "en_US") == [
+        "Doctor Smith is here.", "Paragraph one.", "Paragraph two.",
+    ]
+
+
+def test_url_at_the_end_of_a_sentence_keeps_its_period():
+    assert synthesis_units("Visit https://example.com. Then go home.", "en_US") == [
+        "Visit example dot com.", "Then go home.",
+    ]
+    assert normalize_text("See www.example.org/docs?a=1, then ask!") == "See example dot org, then ask!"
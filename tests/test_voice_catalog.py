@@ -0,0 +1,47 @@
+"""Voice catalog: cold loads happen once and off the event loop."""
+import asyncio
+import threading
+
+import httpx
+
+import fake_app
+from fake_app import server
+
+
+def test_concurrent_cold_requests_list_the_bucket_once():
+    bucket, _ = fake_app.install(storage_latency=0.05)
+    fake_app.seed_catalog_voices(bucket, 3)
+    listings = []
+    list_blobs = bucket.list_blobs
+
+    def counting_list_blobs(*args, **kwargs):
+        listings.append(threading.current_thread().name)
+        return list_blobs(*args, **kwargs)
+
+    bucket.list_blobs = counting_list_blobs
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get("/voices") for _ in range(8)))
+
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 8
+    assert len(responses[0].json()) == 3
+    assert len(listings) == 1
+    assert listings[0].startswith("storage")
+
+
+def test_refresh_waiting_for_another_does_not_list_again():
+    bucket, _ = fake_app.install(storage_latency=0.05)
+    fake_app.seed_catalog_voices(bucket, 2)
+    catalog = server.voice_catalog
+    calls_before = bucket.calls
+    threads = [threading.Thread(target=catalog.refresh, args=(bucket,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(catalog.voices) == 2
+    # One listing plus one metadata download per voice
+    assert bucket.calls - calls_before == 3